@@ -0,0 +1,126 @@
+"""Concurrent crawl check: run_indexer with one worker and with many, against the same fake library.
+
+Full scans of one synthetic library run sequentially (one list and one tag
+worker), concurrently, and concurrently while Graph answers every Nth call
+with 429 + Retry-After. All three must leave the same folders, albums and
+songs in the catalog, matching the tags the files hold, and the throttled run
+must actually have been throttled; the exit code is 1 when they do not.
+
+    python benchmarks/crawl.py --songs 2000 --throttle-every 10
+"""
+import os
+import sys
+import sqlite3
+import argparse
+import tempfile
+
+from harness import new_database, add_json_argument, write_results
+from fake_graph import FakeGraph, Library
+from indexer import check_catalog, run
+
+def snapshot(db_file):
+    """The catalog as comparable rows, with the autoincrement ids resolved to names and paths."""
+    conn = sqlite3.connect(db_file)
+    folders = conn.execute(
+        "SELECT folders.item_id, folders.path, parent.item_id, folders.scanned FROM folders "
+        "LEFT JOIN folders AS parent ON parent.id = folders.parent_id ORDER BY folders.item_id").fetchall()
+    albums = conn.execute(
+        "SELECT albums.album_name, artists.name, folders.path FROM albums "
+        "LEFT JOIN artists ON artists.id = albums.artist_id "
+        "JOIN folders ON folders.id = albums.folder_id ORDER BY 3, 1").fetchall()
+    songs = conn.execute(
+        "SELECT songs.file_id, folders.path, songs.file_name, songs.title, artists.name, albums.album_name, "
+        "songs.search_text, songs.ctag, songs.duration, songs.bitrate, songs.size FROM songs "
+        "JOIN folders ON folders.id = songs.folder_id "
+        "LEFT JOIN artists ON artists.id = songs.artist_id "
+        "LEFT JOIN albums ON albums.id = songs.album_id ORDER BY songs.file_id").fetchall()
+    conn.close()
+    return {"folders": folders, "albums": albums, "songs": songs}
+
+def differences(expected, actual):
+    """Rows per table that only one of the two catalogs holds."""
+    return {table: len(set(expected[table]) ^ set(actual[table])) for table in expected}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--songs", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=10, help="fake Graph API latency per call")
+    parser.add_argument("--content-latency-ms", type=float, default=20, help="time to first byte of a download")
+    parser.add_argument("--throttle-every", type=int, default=10,
+                        help="every Nth Graph call is answered 429 in the throttled run")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with each 429")
+    parser.add_argument("--list-workers", type=int, help="INDEXER_LIST_WORKERS (default: the indexer's)")
+    parser.add_argument("--tag-workers", type=int, help="INDEXER_TAG_WORKERS (default: the indexer's)")
+    parser.add_argument("--seed", type=int, default=1)
+    add_json_argument(parser)
+    args = parser.parse_args()
+
+    library = Library(args.songs, args.seed)
+    print(f"Library: {args.songs} songs in {library.folder_count()} folders")
+    graph = FakeGraph(latency=args.latency_ms / 1000, content_latency=args.content_latency_ms / 1000,
+                      retry_after=args.retry_after, library=library).start()
+    os.environ["GRAPH_API_URL"] = graph.graph_api_url
+    if args.list_workers:
+        os.environ["INDEXER_LIST_WORKERS"] = str(args.list_workers)
+    if args.tag_workers:
+        os.environ["INDEXER_TAG_WORKERS"] = str(args.tag_workers)
+
+    with tempfile.TemporaryDirectory() as directory:
+        summary_file = os.path.join(directory, "indexer_summary.json")
+        os.environ["INDEXER_SUMMARY_FILE"] = summary_file
+        # Imported only now so graph_client and run_indexer pick up the settings above.
+        from graph_auth import token_provider
+        token_provider.get_token = lambda: "benchmark-token"
+        import run_indexer
+
+        workers = (run_indexer.LIST_WORKERS, run_indexer.TAG_WORKERS)
+        # name -> (list workers, tag workers, throttle every Nth call)
+        runs = {
+            "sequential": (1, 1, 0),
+            "concurrent": workers + (0,),
+            "throttled": workers + (args.throttle_every,),
+        }
+        results, catalogs = {}, {}
+        for name, (list_workers, tag_workers, throttle_every) in runs.items():
+            run_indexer.LIST_WORKERS, run_indexer.TAG_WORKERS = list_workers, tag_workers
+            graph.throttle_every = throttle_every
+            run_directory = os.path.join(directory, name)
+            os.mkdir(run_directory)
+            new_database(run_directory, "music_bot.db").close()
+            # run_indexer opens music_bot.db relative to the working directory.
+            os.chdir(run_directory)
+            results[name] = run(graph, run_indexer, [], summary_file)
+            songs, accuracy = check_catalog("music_bot.db", library)
+            catalogs[name] = snapshot("music_bot.db")
+            results[name].update({"workers": {"list": list_workers, "tag": tag_workers},
+                                  "songs_in_catalog": songs, "tag_accuracy": accuracy})
+            os.chdir(directory)
+        os.chdir(os.path.dirname(directory))
+    graph.stop()
+
+    passed = True
+    for name, run_results in results.items():
+        run_results["rows_differing_from_sequential"] = differences(catalogs["sequential"], catalogs[name])
+        ok = (run_results["status"] == "ok" and run_results["songs_in_catalog"] == args.songs
+              and all(share == 1 for share in run_results["tag_accuracy"].values())
+              and not any(run_results["rows_differing_from_sequential"].values()))
+        run_results["matches"] = ok
+        # A throttled run that never saw a 429 proves nothing about retries.
+        unthrottled = name == "throttled" and not run_results["graph_throttled"]
+        passed = passed and ok and not unthrottled
+        print(f"{name}: {run_results['status']} in {run_results['seconds']:.1f}s with "
+              f"{run_results['workers']['list']}/{run_results['workers']['tag']} list/tag workers, "
+              f"{run_results['graph_api_calls']} API calls, {run_results['graph_throttled']} throttled")
+        print(f"  catalog: {run_results['songs_in_catalog']} songs; rows differing from sequential: "
+              + ", ".join(f"{table} {count}" for table, count in run_results["rows_differing_from_sequential"].items())
+              + ("" if ok else "  MISMATCH") + ("  (never throttled)" if unthrottled else ""))
+    results["speedup"] = round(results["sequential"]["seconds"] / max(results["concurrent"]["seconds"], 0.001), 2)
+    results["passed"] = passed
+    print(f"Concurrent crawl {results['speedup']}x faster than sequential; "
+          + ("catalogs identical." if passed else "check FAILED."))
+    write_results(args.json, "crawl", vars(args), results)
+    if not passed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Indexer DB write benchmark: per-row commits vs. run_indexer.BatchWriter.
+
+    python benchmarks/db_writes.py --rows 100000
+"""
+import time
+import argparse
+import tempfile
+
+from harness import new_database, add_json_argument, write_results
+
+import run_indexer
+
+SONG_SQL = ("INSERT INTO songs (file_id, folder_id, file_name, title, artist_id, album_id, search_text, ctag) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)")
+
+def synthetic_rows(count):
+    for i in range(count):
+        # Twelve tracks per album folder, ten albums per artist
+        name = f"{i % 12 + 1:02d}. Track {i}.flac"
+        yield (f"FILE{i:08d}", i // 12 + 1, name, f"Track {i}", i // 120 + 1, i // 12 + 1,
+               f"track {i} artist {i // 120} album {i // 12}", f"ctag{i}")
+
+def bench_per_row(conn, rows):
+    # The original indexer: one INSERT and one commit (fsync) per track.
+    run_indexer.create_secondary_indexes(conn)
+    cursor = conn.cursor()
+    for row in rows:
+        cursor.execute(SONG_SQL, row)
+        conn.commit()
+
+def bench_batched(conn, rows):
+    run_indexer.begin_bulk_load(conn)
+    run_indexer.drop_secondary_indexes(conn)
+    writer = run_indexer.BatchWriter(conn)
+    for row in rows:
+        writer.add(SONG_SQL, row)
+    writer.flush()
+    run_indexer.end_bulk_load(conn)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    add_json_argument(parser)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for label, bench in (("per_row_commit", bench_per_row), ("batched", bench_batched)):
+            conn = new_database(directory, f"{bench.__name__}.db")
+            start = time.perf_counter()
+            bench(conn, synthetic_rows(args.rows))
+            elapsed = time.perf_counter() - start
+            conn.close()
+            results[label] = {"seconds": round(elapsed, 3), "rows_per_second": round(args.rows / elapsed)}
+            print(f"{label:>15}: {args.rows} rows in {elapsed:.2f}s ({args.rows / elapsed:,.0f} rows/sec)")
+    write_results(args.json, "db_writes", vars(args), results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Concurrent download load test for the bot's download routes against a fake Graph server.
+
+Song downloads go through /download (proxy mode) and album downloads through
+/download_album as streamed ZIPs, all for tracks of a synthetic library.
+
+    python benchmarks/downloads.py --clients 16 --downloads 200 --size-mb 4 --albums 8
+"""
+import os
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from harness import latency_summary, add_json_argument, write_results
+from fake_graph import FakeGraph, Library
+import synthetic_db
+
+def run_downloads(base_url, paths, clients):
+    """GET every path with ``clients`` concurrent clients and summarize latency and throughput."""
+    import requests
+
+    def download(path):
+        start = time.perf_counter()
+        try:
+            with requests.get(f"{base_url}{path}", stream=True) as response:
+                received = sum(len(chunk) for chunk in response.iter_content(256 * 1024))
+                expected = int(response.headers.get("Content-Length", -1))
+        except requests.exceptions.RequestException:
+            # Counted as a failure, e.g. the server broke off the body.
+            return (time.perf_counter() - start) * 1000, 0, 0, -1
+        return (time.perf_counter() - start) * 1000, received, response.status_code, expected
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        results = list(pool.map(download, paths))
+    return summarize(results, time.perf_counter() - started, clients)
+
+def summarize(results, elapsed, clients):
+    ok = [(ms, received) for ms, received, status, expected in results if status == 200 and received == expected]
+    total_bytes = sum(received for _, received in ok)
+    return {
+        "clients": clients,
+        "downloads": len(results),
+        "failed": len(results) - len(ok),
+        "seconds": round(elapsed, 3),
+        "latency": latency_summary([ms for ms, _ in ok]),
+        "mib_per_second": round(total_bytes / elapsed / 1024 / 1024, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--downloads", type=int, default=200, help="song downloads")
+    parser.add_argument("--albums", type=int, default=8, help="album ZIP downloads (0 to skip)")
+    parser.add_argument("--songs", type=int, default=240, help="tracks in the synthetic library")
+    parser.add_argument("--size-mb", type=float, default=4, help="size of every track")
+    parser.add_argument("--latency-ms", type=float, default=20, help="fake Graph API latency per call")
+    parser.add_argument("--content-latency-ms", type=float, default=40, help="time to first byte of a download")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of Graph calls answered 429")
+    add_json_argument(parser)
+    args = parser.parse_args()
+
+    library = Library(args.songs, audio_size=int(args.size_mb * 1024 * 1024))
+    graph = FakeGraph(latency=args.latency_ms / 1000, content_latency=args.content_latency_ms / 1000,
+                      throttle_rate=args.throttle_rate, library=library).start()
+    os.environ["GRAPH_API_URL"] = graph.graph_api_url
+    os.environ["ALBUM_DOWNLOAD_MODE"] = "zip"
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:benchmark")
+    os.environ.setdefault("ADMIN_USER_ID", "0")
+
+    # Imported only now so graph_client and bot pick up the settings above.
+    from werkzeug.serving import make_server
+    from graph_auth import token_provider
+    token_provider.get_token = lambda: "benchmark-token"
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        # The same catalog as the library, so song and folder ids line up.
+        db_file = synthetic_db.generate(os.path.join(directory, "music_bot.db"), args.songs, members=10)
+        conn = sqlite3.connect(db_file)
+        user_id = conn.execute("SELECT telegram_id FROM members WHERE status = 'active' "
+                               "AND expiry_date > datetime('now')").fetchone()[0]
+        album_ids = [row[0] for row in conn.execute("SELECT id FROM albums")]
+        conn.close()
+        # bot opens music_bot.db relative to the working directory.
+        os.chdir(directory)
+        import bot
+
+        server = make_server("127.0.0.1", 0, bot.create_app(), threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_port}"
+        rng = random.Random(1)
+
+        paths = [f"/download/{bot.token_signer.issue(bot.KIND_SONG, rng.randint(1, args.songs), user_id)}"
+                 for _ in range(args.downloads)]
+        results["song"] = run_downloads(base_url, paths, args.clients)
+        if args.albums:
+            paths = [f"/download_album/{bot.token_signer.issue(bot.KIND_ALBUM, rng.choice(album_ids), user_id)}"
+                     for _ in range(args.albums)]
+            results["album_zip"] = run_downloads(base_url, paths, min(args.clients, args.albums))
+        server.shutdown()
+        os.chdir(os.path.dirname(directory))
+    graph.stop()
+    results["graph"] = {"api_calls": graph.requests, "throttled": graph.throttled,
+                        "download_requests": graph.content_requests}
+
+    for route in ("song", "album_zip"):
+        if route not in results:
+            continue
+        route_results = results[route]
+        print(f"{route}: {route_results['downloads']} downloads ({route_results['failed']} failed) "
+              f"with {route_results['clients']} clients in {route_results['seconds']:.2f}s")
+        if route_results["latency"]["count"]:
+            print(f"  latency ms: p50 {route_results['latency']['p50_ms']:.1f}  "
+                  f"p99 {route_results['latency']['p99_ms']:.1f}")
+        print(f"  throughput: {route_results['mib_per_second']} MiB/s")
+    print(f"fake Graph: {graph.requests} API calls, {graph.throttled} throttled, "
+          f"{graph.content_requests} download requests")
+    write_results(args.json, "downloads", vars(args), results)
+
+if __name__ == "__main__":
+    main()
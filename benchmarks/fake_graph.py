@@ -0,0 +1,391 @@
+"""Local stand-in for the Microsoft Graph endpoints the bot and the indexer use.
+
+Serves drive items, createLink and pre-authenticated download URLs (with
+Range support) from memory, plus the AAD OpenID configuration and token
+endpoints MSAL uses for app-only tokens. With a ``Library`` it also serves a
+whole drive: root, paged folder listings and delta, over tagged
+FLAC/M4A/WAV/DSF files. Latency and throttling can be injected to see how
+the clients behave against a slow or throttling service.
+"""
+import re
+import json
+import time
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import synthetic_audio
+from synthetic_db import catalog, file_name
+
+RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)")
+# Items per delta page; Graph pages delta responses much like folder listings
+DELTA_PAGE_SIZE = 200
+# AAD endpoints are advertised on the real host; clients route it to the fake
+AUTHORITY_HOST = "https://login.microsoftonline.com"
+MIME_TYPES = {"flac": "audio/flac", "m4a": "audio/mp4", "wav": "audio/wav", "dsf": "audio/x-dsf", "jpg": "image/jpeg"}
+
+
+class Library:
+    """A OneDrive music folder built from the synthetic catalog.
+
+    /Music/<artist>/<album>/NN. Title.ext, with a "Disc 2" subfolder for
+    two-disc albums and a cover.jpg the indexer has to skip in every album.
+    File sizes follow each track's length unless ``audio_size`` fixes them.
+    ``retag`` rewrites some tracks' tags the way a user re-tagging files
+    would, and the changes show up in delta.
+    """
+
+    def __init__(self, songs=1000, seed=1, audio_size=None):
+        self.audio_size = audio_size
+        self.items = {}
+        self.children = {}
+        self.files = {}
+        # file id -> (title, artist, album) the tags hold
+        self.expected = {}
+        self.changes = []
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._add_folder("root", None, "root")
+        self._add_folder("music", "root", "Music")
+        folders = {}
+        for index, track in enumerate(catalog(songs, seed)):
+            artist_id = folders.get(track.artist)
+            if artist_id is None:
+                artist_id = folders[track.artist] = self._add_folder(f"FA{len(folders):07d}", "music", track.artist)
+            album_key = (track.artist, track.album)
+            album_id = folders.get(album_key)
+            if album_id is None:
+                album_id = folders[album_key] = self._add_folder(f"FB{len(folders):07d}", artist_id, track.album)
+                self._add_file(f"C{album_id}", album_id, "cover.jpg", synthetic_audio.SyntheticFile(b"", 200000))
+            parent_id = album_id
+            if track.disc > 1:
+                disc_key = album_key + (track.disc,)
+                parent_id = folders.get(disc_key)
+                if parent_id is None:
+                    parent_id = folders[disc_key] = self._add_folder(f"FD{len(folders):07d}", album_id,
+                                                                     f"Disc {track.disc}")
+            file_id = f"I{index:08d}"
+            self._add_file(file_id, parent_id, file_name(track), synthetic_audio.build(
+                track.fmt, track.title, track.artist, track.album, track.seconds, self.audio_size))
+            self.expected[file_id] = (track.title, track.artist, track.album)
+            self.items[file_id]["fmt"] = track.fmt
+
+    def _add_folder(self, item_id, parent_id, name):
+        self.items[item_id] = {"id": item_id, "name": name, "parent": parent_id}
+        self.children[item_id] = []
+        if parent_id:
+            self.children[parent_id].append(item_id)
+        return item_id
+
+    def _add_file(self, item_id, parent_id, name, content):
+        self.items[item_id] = {"id": item_id, "name": name, "parent": parent_id, "ctag": f"{item_id}.1"}
+        self.files[item_id] = content
+        self.children[parent_id].append(item_id)
+
+    @property
+    def song_ids(self):
+        return list(self.expected)
+
+    def folder_count(self):
+        return len(self.children)
+
+    def retag(self, count):
+        """Give ``count`` random tracks new titles; returns their ids."""
+        with self._lock:
+            changed = self._rng.sample(self.song_ids, count)
+            for file_id in changed:
+                item = self.items[file_id]
+                title, artist, album = self.expected[file_id]
+                title = f"{title} (Remastered)"
+                self.files[file_id] = synthetic_audio.build(item["fmt"], title, artist, album,
+                                                            audio_size=self.audio_size)
+                self.expected[file_id] = (title, artist, album)
+                version = int(item["ctag"].rsplit(".", 1)[1]) + 1
+                item["ctag"] = f"{file_id}.{version}"
+                self.changes.append(file_id)
+        return changed
+
+    def item_json(self, item_id, base_url, download_url=True):
+        item = self.items[item_id]
+        body = {"id": item_id, "name": item["name"]}
+        if item_id == "root":
+            body["root"] = {}
+        elif item["parent"]:
+            body["parentReference"] = {"id": item["parent"]}
+        if item_id in self.children:
+            body["folder"] = {"childCount": len(self.children[item_id])}
+            return body
+        extension = item["name"].rsplit(".", 1)[-1]
+        body.update({"size": self.files[item_id].size, "file": {"mimeType": MIME_TYPES.get(extension, "")},
+                     "eTag": item["ctag"], "cTag": item["ctag"]})
+        if download_url:
+            body["@microsoft.graph.downloadUrl"] = f"{base_url}/content/{item_id}"
+        return body
+
+
+class QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up mid-body (HEAD probes, cancelled downloads) are expected.
+        pass
+
+
+class FakeGraph:
+    """``latency`` delays every API call, ``content_latency`` the first byte of
+    every download (OneDrive's download URLs are a separate, slower service),
+    and ``throttle_rate`` of API calls get a 429 with ``retry_after``, as does
+    every ``throttle_every``-th call when it is set, for runs that must be
+    throttled a known number of times.
+    ``page_size`` caps folder listing pages below the ``$top`` asked for, as
+    Graph may; the query of every listing request is kept in ``listings``.
+    Tokens are issued after ``token_latency`` and last ``token_lifetime``
+    seconds."""
+
+    def __init__(self, file_size=8 * 1024 * 1024, latency=0.0, throttle_rate=0.0, retry_after=1,
+                 throttle_every=0, content_latency=0.0, library: Library = None, page_size=None, token_latency=0.0,
+                 token_lifetime=3600):
+        self.file_size = file_size
+        self.latency = latency
+        self.content_latency = content_latency
+        self.throttle_rate = throttle_rate
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.library = library
+        self.page_size = page_size
+        self.listings = []
+        self.token_latency = token_latency
+        self.token_lifetime = token_lifetime
+        self.token_requests = 0
+        self.requests = 0
+        self.throttled = 0
+        self.content_requests = 0
+        self.content_bytes = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._chunk = bytes(range(256)) * 256
+
+    # --- server lifecycle ---
+    def start(self, port=0):
+        fake = self
+
+        class Handler(FakeGraphHandler):
+            graph = fake
+
+        self._server = QuietServer(("127.0.0.1", port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    @property
+    def graph_api_url(self):
+        return f"{self.url}/v1.0"
+
+    # --- content ---
+    def item(self, item_id):
+        if self.library and item_id in self.library.items:
+            return self.library.item_json(item_id, self.url)
+        return {
+            "id": item_id,
+            "name": f"{item_id}.flac",
+            "size": self.file_size,
+            "file": {},
+            "@microsoft.graph.downloadUrl": f"{self.url}/content/{item_id}",
+        }
+
+    def content(self, start, end):
+        """Deterministic file bytes for [start, end]."""
+        size = len(self._chunk)
+        data = bytearray()
+        offset = start
+        while offset <= end:
+            piece = self._chunk[offset % size:size][:end - offset + 1]
+            data += piece
+            offset += len(piece)
+        return bytes(data)
+
+    def file(self, item_id):
+        """(size, read(start, end)) for a download URL."""
+        if self.library and item_id in self.library.files:
+            content = self.library.files[item_id]
+            return content.size, content.read
+        return self.file_size, self.content
+
+    def etag(self, item_id):
+        """Strong ETag of a download, changing whenever the file is re-tagged."""
+        if self.library and item_id in self.library.files:
+            return f'"{self.library.items[item_id]["ctag"]}"'
+        return f'"{item_id}"'
+
+    def count_content(self, sent):
+        with self._lock:
+            self.content_requests += 1
+            self.content_bytes += sent
+
+    def children_page(self, item_id, query):
+        with self._lock:
+            self.listings.append((item_id, query))
+        children = self.library.children[item_id]
+        top = int(query.get("$top", ["200"])[0])
+        count = min(top, self.page_size) if self.page_size else top
+        skip = int(query.get("$skiptoken", ["0"])[0])
+        page = {"value": [self.library.item_json(child, self.url) for child in children[skip:skip + count]]}
+        if skip + count < len(children):
+            select = "".join(f"&$select={value}" for value in query.get("$select", []))
+            page["@odata.nextLink"] = (f"{self.graph_api_url}/drive/items/{item_id}/children"
+                                       f"?$top={top}{select}&$skiptoken={skip + count}")
+        return page
+
+    def delta_page(self, query):
+        """Items changed since the token, newest state of each, without download URLs (as Graph sends)."""
+        changes = self.library.changes
+        token = query.get("token", ["0"])[0]
+        if token == "latest":
+            return {"value": [], "@odata.deltaLink": f"{self.graph_api_url}/drive/root/delta?token={len(changes)}"}
+        start = int(token)
+        skip = int(query.get("$skiptoken", ["0"])[0])
+        changed = list(dict.fromkeys(changes[start:]))
+        page = {"value": [self.library.item_json(item_id, self.url, download_url=False)
+                          for item_id in changed[skip:skip + DELTA_PAGE_SIZE]]}
+        if skip + DELTA_PAGE_SIZE < len(changed):
+            page["@odata.nextLink"] = (f"{self.graph_api_url}/drive/root/delta"
+                                       f"?token={start}&$skiptoken={skip + DELTA_PAGE_SIZE}")
+        else:
+            page["@odata.deltaLink"] = f"{self.graph_api_url}/drive/root/delta?token={len(changes)}"
+        return page
+
+    # --- AAD ---
+    def openid_configuration(self, tenant):
+        base = f"{AUTHORITY_HOST}/{tenant}"
+        return {
+            "issuer": f"{base}/v2.0",
+            "authorization_endpoint": f"{base}/oauth2/v2.0/authorize",
+            "token_endpoint": f"{base}/oauth2/v2.0/token",
+        }
+
+    def issue_token(self):
+        if self.token_latency:
+            time.sleep(self.token_latency)
+        with self._lock:
+            self.token_requests += 1
+            number = self.token_requests
+        return {"token_type": "Bearer", "expires_in": self.token_lifetime, "access_token": f"fake-token-{number}"}
+
+    def should_throttle(self):
+        with self._lock:
+            self.requests += 1
+            if ((self.throttle_every and self.requests % self.throttle_every == 0)
+                    or (self.throttle_rate and random.random() < self.throttle_rate)):
+                self.throttled += 1
+                return True
+        return False
+
+
+class FakeGraphHandler(BaseHTTPRequestHandler):
+    graph = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, body, status=200):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def preamble(self):
+        if self.graph.latency:
+            time.sleep(self.graph.latency)
+        if self.graph.should_throttle():
+            self.send_response(429)
+            self.send_header("Retry-After", str(self.graph.retry_after))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return False
+        return True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        path, query = url.path, parse_qs(url.query)
+        if path.startswith("/content/"):
+            return self.send_content(path[len("/content/"):])
+        match = re.fullmatch(r"/([^/]+)/v2\.0/\.well-known/openid-configuration", path)
+        if match:
+            return self.send_json(self.graph.openid_configuration(match.group(1)))
+        if not self.preamble():
+            return
+        library = self.graph.library
+        match = re.search(r"/drive/items/([^/]+)$", path)
+        if match:
+            return self.send_json(self.graph.item(match.group(1)))
+        if library:
+            if path.endswith("/drive/root"):
+                return self.send_json(library.item_json("root", self.graph.url))
+            if path.endswith("/drive/root/delta"):
+                return self.send_json(self.graph.delta_page(query))
+            match = re.search(r"/drive/items/([^/]+)/children$", path)
+            if match and match.group(1) in library.children:
+                return self.send_json(self.graph.children_page(match.group(1), query))
+        self.send_json({"error": {"code": "itemNotFound"}}, status=404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        path = urlparse(self.path).path
+        if re.fullmatch(r"/[^/]+/oauth2/v2\.0/token", path):
+            return self.send_json(self.graph.issue_token())
+        if not self.preamble():
+            return
+        match = re.search(r"/drive/items/([^/]+)/createLink$", path)
+        if match:
+            return self.send_json({"link": {"webUrl": f"{self.graph.url}/share/{match.group(1)}"}}, status=201)
+        self.send_json({"error": {"code": "itemNotFound"}}, status=404)
+
+    def send_content(self, item_id):
+        if self.graph.content_latency:
+            time.sleep(self.graph.content_latency)
+        size, read = self.graph.file(item_id)
+        etag = self.graph.etag(item_id)
+        start, end = 0, size - 1
+        match = RANGE_RE.fullmatch(self.headers.get("Range", ""))
+        # If-Range: a range of a file that has changed since is answered with the whole file.
+        if_range = self.headers.get("If-Range")
+        if match and (match.group(1) or match.group(2)) and if_range in (None, etag):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:
+                start = max(size - int(match.group(2)), 0)
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        offset = start
+        try:
+            while offset <= end:
+                piece_end = min(offset + 256 * 1024 - 1, end)
+                self.wfile.write(read(offset, piece_end))
+                offset = piece_end + 1
+        finally:
+            self.graph.count_content(offset - start)
@@ -0,0 +1,139 @@
+"""Local stand-in for the Telegram Bot API, and a generator of incoming updates.
+
+``FakeTelegram`` answers the Bot API methods the bot calls (getMe,
+sendMessage, editMessageText, answerCallbackQuery, setWebhook, ...) after an
+optional latency, counts the calls, and keeps the last inline keyboard sent
+to each chat so a simulated user can press its buttons; ``wait_for_reply``
+lets a client driving the webhook wait for the bot's answer. ``UpdateFactory``
+builds the update JSON Telegram would deliver for commands and button presses.
+"""
+import json
+import time
+import itertools
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from fake_graph import QuietServer
+
+BOT_USER = {"id": 1000, "is_bot": True, "first_name": "Benchmark", "username": "benchmark_bot"}
+
+
+class FakeTelegram:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        # chat id -> (message id, inline keyboard rows) of the last message sent or edited
+        self.keyboards = {}
+        self._message_ids = itertools.count(1)
+        # chat id -> messages sent or edited
+        self._replies = Counter()
+        self._lock = threading.Lock()
+        self._replied = threading.Condition(self._lock)
+        self._server = None
+
+    def start(self, port=0):
+        fake = self
+
+        class Handler(FakeTelegramHandler):
+            telegram = fake
+
+        self._server = QuietServer(("127.0.0.1", port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @property
+    def api_url(self):
+        """Value for the bot's TELEGRAM_API_URL (the token is appended to it)."""
+        return f"http://127.0.0.1:{self._server.server_address[1]}/bot"
+
+    def buttons(self, chat_id) -> list:
+        """callback_data of every button on the chat's last keyboard, in order."""
+        _, rows = self.keyboards.get(chat_id, (None, []))
+        return [button["callback_data"] for row in rows for button in row if "callback_data" in button]
+
+    def message_id(self, chat_id):
+        return self.keyboards.get(chat_id, (1, None))[0]
+
+    def replies(self, chat_id) -> int:
+        """Messages sent or edited in the chat so far."""
+        with self._lock:
+            return self._replies[chat_id]
+
+    def wait_for_reply(self, chat_id, seen: int, timeout: float = 30) -> bool:
+        """Wait until the chat has more than ``seen`` messages sent or edited."""
+        with self._replied:
+            return self._replied.wait_for(lambda: self._replies[chat_id] > seen, timeout)
+
+    def answer(self, method: str, params: dict):
+        with self._lock:
+            self.calls[method] += 1
+        if method == "getMe":
+            return BOT_USER
+        if method in ("sendMessage", "editMessageText"):
+            chat_id = int(params.get("chat_id", 0))
+            message_id = int(params["message_id"]) if "message_id" in params else next(self._message_ids)
+            markup = json.loads(params["reply_markup"]) if "reply_markup" in params else {}
+            with self._lock:
+                self.keyboards[chat_id] = (message_id, markup.get("inline_keyboard", []))
+                self._replies[chat_id] += 1
+                self._replied.notify_all()
+            return {"message_id": message_id, "date": int(time.time()), "text": params.get("text", ""),
+                    "chat": {"id": chat_id, "type": "private"}, "from": BOT_USER}
+        return True
+
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    telegram = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            params = json.loads(body or "{}")
+        else:
+            params = {name: values[0] for name, values in parse_qs(body).items()}
+        if self.telegram.latency:
+            time.sleep(self.telegram.latency)
+        method = urlparse(self.path).path.rsplit("/", 1)[-1]
+        payload = json.dumps({"ok": True, "result": self.telegram.answer(method, params)}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class UpdateFactory:
+    """Update JSON as Telegram delivers it to the webhook, for private chats with users."""
+
+    def __init__(self):
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    @staticmethod
+    def user(user_id):
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+    def message(self, user_id, text):
+        message = {"message_id": next(self._message_ids), "date": int(time.time()), "text": text,
+                   "chat": {"id": user_id, "type": "private"}, "from": self.user(user_id)}
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": next(self._update_ids), "message": message}
+
+    def callback(self, user_id, data, message_id=1):
+        """A press of the inline button carrying ``data`` on the bot's message ``message_id``."""
+        message = {"message_id": message_id, "date": int(time.time()), "text": "",
+                   "chat": {"id": user_id, "type": "private"}, "from": BOT_USER}
+        return {"update_id": next(self._update_ids),
+                "callback_query": {"id": str(next(self._update_ids)), "from": self.user(user_id),
+                                   "chat_instance": str(user_id), "data": data, "message": message}}
@@ -0,0 +1,152 @@
+"""Fuzzy (trigram) index benchmark: build time, memory and typo-query latency.
+
+Also checks the "did you mean" retry end to end on a small catalog whose
+names hold apostrophes and "&", which normalization removes: each misspelled
+search must find nothing as typed and then find its song through the
+suggestion. The exit code is 1 when one does not.
+
+    python benchmarks/fuzzy.py --values 1000000 --queries 500
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import statistics
+
+from harness import new_database, percentile, latency_summary, add_json_argument, write_results
+
+from fuzzy import FuzzyCatalog, TrigramIndex
+from normalize import normalize_text, build_search_text
+
+LETTERS = "abcdefghijklmnoprstuwyz"
+MYANMAR = ["က", "ခ", "ဂ", "င", "စ", "ဆ", "ည", "တ", "ထ", "ဒ", "န", "ပ", "ဖ", "ဗ", "မ", "ယ", "ရ", "လ", "ဝ", "သ"]
+MARKS = ["ာ", "ိ", "ီ", "ု", "ူ", "ေ", "ဲ", "ံ", "့", "း", "်"]
+# (title, artist, album) with punctuation that normalize_text drops or rewrites
+PUNCTUATED = [
+    ("Don't Stop Me Now", "Queen", "Jazz"),
+    ("The Boxer", "Simon & Garfunkel", "Bridge over Troubled Water"),
+    ("Rock 'n' Roll Star", "Oasis", "Definitely Maybe"),
+    ("Mississippi", "Bob Dylan", "Love & Theft"),
+]
+# (search kind, misspelled term, the catalog value it should lead to)
+PUNCTUATED_TYPOS = [
+    ("title", "Dont Stpo Me", "Don't Stop Me Now"),
+    ("artist", "Simon & Garfunkle", "Simon & Garfunkel"),
+    ("title", "Rock n Roll Str", "Rock 'n' Roll Star"),
+    ("album", "Love and Thetf", "Love & Theft"),
+]
+
+def vocabulary(rng, size):
+    words = set()
+    while len(words) < size:
+        if rng.random() < 0.3:
+            words.add("".join(rng.choice(MYANMAR) + rng.choice(MARKS) for _ in range(rng.randint(1, 3))))
+        else:
+            words.add("".join(rng.choice(LETTERS) for _ in range(rng.randint(3, 9))))
+    return sorted(words)
+
+def typo(rng, text):
+    """One random edit: delete, insert, substitute or swap a character."""
+    i = rng.randrange(len(text))
+    edit = rng.choice("disw")
+    if edit == "d" and len(text) > 1:
+        return text[:i] + text[i + 1:]
+    if edit == "i":
+        return text[:i] + rng.choice(LETTERS) + text[i:]
+    if edit == "s":
+        return text[:i] + rng.choice(LETTERS) + text[i + 1:]
+    if i + 1 < len(text):
+        return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+    return text
+
+def postings_bytes(index):
+    return sum(posting.itemsize * len(posting) for posting in index.postings.values())
+
+def check_suggestions(directory):
+    """Run each of PUNCTUATED_TYPOS through bot.search_or_suggest; returns {term: passed}."""
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:benchmark")
+    os.environ.setdefault("ADMIN_USER_ID", "0")
+    import bot
+    from db import Database
+
+    conn = new_database(directory, "punctuated.db")
+    conn.execute("INSERT INTO folders (id, item_id, name, path, scanned) VALUES (1, 'root', '', '', 1)")
+    for index, (title, artist, album) in enumerate(PUNCTUATED, 1):
+        conn.execute("INSERT OR IGNORE INTO artists (name) VALUES (?)", (artist,))
+        artist_id = conn.execute("SELECT id FROM artists WHERE name = ?", (artist,)).fetchone()[0]
+        album_id = conn.execute("INSERT INTO albums (album_name, artist_id, folder_id) VALUES (?, ?, 1)",
+                                (album, artist_id)).lastrowid
+        conn.execute("INSERT INTO songs (file_id, folder_id, file_name, title, artist_id, album_id, search_text) "
+                     "VALUES (?, 1, ?, ?, ?, ?, ?)", (f"S{index}", f"{title}.flac", title, artist_id, album_id,
+                                                      build_search_text(title, artist, album)))
+    conn.commit()
+    conn.close()
+
+    bot.db = Database(os.path.join(directory, "punctuated.db"))
+    bot.fuzzy_catalog = FuzzyCatalog(os.path.join(directory, "punctuated.db"))
+    # Loaded here rather than by start()'s background thread, so mark it ready by hand.
+    bot.fuzzy_catalog.refresh()
+    bot.fuzzy_catalog.ready.set()
+    checks = {}
+    for kind, term, expected in PUNCTUATED_TYPOS:
+        as_typed = bot.search_page(kind, term)[0]
+        rows, _, searched = bot.search_or_suggest(kind, term)
+        checks[term] = not as_typed and searched == expected and bool(rows)
+        print(f"  {kind} {term!r}: suggested {searched!r}, {len(rows)} results"
+              + ("" if checks[term] else "  FAILED"))
+    bot.db.close()
+    return checks
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--values", type=int, default=200000, help="distinct titles in the index")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    add_json_argument(parser)
+    args = parser.parse_args()
+
+    rng = random.Random(17)
+    words = vocabulary(rng, args.vocabulary)
+    values = set()
+    while len(values) < args.values:
+        values.add(normalize_text(" ".join(rng.choice(words) for _ in range(rng.randint(2, 4)))))
+    values = list(values)
+
+    index = TrigramIndex()
+    started = time.perf_counter()
+    for text in values:
+        index.add(text)
+    build_s = time.perf_counter() - started
+    print(f"{len(index)} values indexed in {build_s:.1f}s; {len(index.postings)} trigrams, "
+          f"{postings_bytes(index) / 1024 / 1024:.1f} MiB of postings")
+
+    targets = [rng.choice(values) for _ in range(args.queries)]
+    queries = [typo(rng, target) for target in targets]
+    latencies, found = [], 0
+    for query, target in zip(queries, targets):
+        start = time.perf_counter()
+        results = index.search(query, limit=5)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found += any(text == target for _, text in results)
+    print(f"{args.queries} one-typo queries: p50 {statistics.median(latencies):.2f} ms  "
+          f"p99 {percentile(latencies, 99):.2f} ms  max {max(latencies):.2f} ms")
+    print(f"  intended value in top 5: {found / args.queries:.1%}")
+
+    print("Misspelled names with punctuation, through the bot's search:")
+    with tempfile.TemporaryDirectory() as directory:
+        suggestions = check_suggestions(directory)
+    write_results(args.json, "fuzzy", vars(args), {
+        "build_seconds": round(build_s, 3),
+        "postings_mib": round(postings_bytes(index) / 1024 / 1024, 1),
+        "query": latency_summary(latencies),
+        "top5_recall": round(found / args.queries, 4),
+        "punctuated_suggestions_found": sum(suggestions.values()),
+        "punctuated_suggestions": len(suggestions),
+    })
+    if not all(suggestions.values()):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
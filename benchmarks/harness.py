@@ -0,0 +1,95 @@
+"""Helpers shared by the benchmarks: schema setup, latency summaries and JSON results."""
+import os
+import io
+import sys
+import json
+import runpy
+import shutil
+import sqlite3
+import platform
+import tempfile
+import subprocess
+import contextlib
+from datetime import datetime, timezone
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+# Bumped whenever a result's meaning changes, so old and new files are not compared blindly
+RESULTS_VERSION = 1
+
+
+def new_database(directory, name):
+    """A connection to ``directory/name`` holding the schema from create_database.py."""
+    path = os.path.join(directory, name)
+    # create_database.py writes ./music_bot.db; run it somewhere that cannot already hold one.
+    with tempfile.TemporaryDirectory(dir=directory) as scratch:
+        cwd = os.getcwd()
+        os.chdir(scratch)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                runpy.run_path(os.path.join(REPO_DIR, "create_database.py"))
+        finally:
+            os.chdir(cwd)
+        shutil.move(os.path.join(scratch, "music_bot.db"), path)
+    return sqlite3.connect(path)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+def latency_summary(samples_ms) -> dict:
+    if not samples_ms:
+        return {"count": 0}
+    return {
+        "count": len(samples_ms),
+        "mean_ms": round(sum(samples_ms) / len(samples_ms), 3),
+        "p50_ms": round(percentile(samples_ms, 50), 3),
+        "p95_ms": round(percentile(samples_ms, 95), 3),
+        "p99_ms": round(percentile(samples_ms, 99), 3),
+        "max_ms": round(max(samples_ms), 3),
+    }
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                                text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def add_json_argument(parser):
+    parser.add_argument("--json", metavar="PATH", help="also write the results to PATH as JSON")
+
+
+def write_results(path, benchmark: str, params: dict, results: dict):
+    """Write one benchmark's results in the format run_all.py collects and compares."""
+    if not path:
+        return
+    document = {
+        "version": RESULTS_VERSION,
+        "benchmark": benchmark,
+        "finished_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": environment(),
+        "params": {key: value for key, value in params.items() if key != "json"},
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2, ensure_ascii=False)
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence the indexer's per-file progress output."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
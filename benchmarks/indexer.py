@@ -0,0 +1,134 @@
+"""Indexer throughput benchmark: run_indexer against a fake OneDrive library.
+
+A full scan of a synthetic library of tagged FLAC/M4A/WAV/DSF files, then an
+incremental (delta) run after some tracks were re-tagged. The catalog the
+indexer wrote is checked against the tags the files really hold.
+
+    python benchmarks/indexer.py --songs 5000 --latency-ms 30 --content-latency-ms 60
+"""
+import os
+import json
+import time
+import sqlite3
+import argparse
+import tempfile
+from collections import Counter
+
+from harness import new_database, quiet, add_json_argument, write_results
+from fake_graph import FakeGraph, Library
+
+def check_catalog(db_file, library, file_ids=None):
+    """Per-format share of songs whose stored title/artist/album match the file's tags."""
+    conn = sqlite3.connect(db_file)
+    stored = {file_id: (title, artist, album) for file_id, title, artist, album
+              in conn.execute("SELECT songs.file_id, songs.title, artists.name, albums.album_name FROM songs "
+                              "LEFT JOIN artists ON artists.id = songs.artist_id "
+                              "LEFT JOIN albums ON albums.id = songs.album_id")}
+    conn.close()
+    checked, correct = Counter(), Counter()
+    for file_id in file_ids if file_ids is not None else library.song_ids:
+        fmt = library.items[file_id]["fmt"]
+        checked[fmt] += 1
+        correct[fmt] += stored.get(file_id) == library.expected[file_id]
+    return len(stored), {fmt: round(correct[fmt] / checked[fmt], 4) for fmt in sorted(checked)}
+
+def song_id_map(db_file):
+    conn = sqlite3.connect(db_file)
+    ids = dict(conn.execute("SELECT file_id, id FROM songs"))
+    conn.close()
+    return ids
+
+def run(graph, run_indexer, argv, summary_file):
+    requests_before, throttled_before = graph.requests, graph.throttled
+    content_before, bytes_before = graph.content_requests, graph.content_bytes
+    started = time.perf_counter()
+    with quiet():
+        run_indexer.main(argv)
+    elapsed = time.perf_counter() - started
+    with open(summary_file) as f:
+        summary = json.load(f)
+    return {
+        "status": summary["status"],
+        "seconds": round(elapsed, 3),
+        "folders_listed": summary["folders_listed"],
+        "folders_per_second": summary["folders_per_second"],
+        "songs_tagged": summary["songs_tagged"],
+        "songs_per_second": summary["songs_per_second"],
+        "tag_bytes_per_song": round(summary["tag_bytes_fetched"] / max(summary["songs_tagged"], 1)),
+        "tag_requests_per_song": round(summary["tag_requests"] / max(summary["songs_tagged"], 1), 2),
+        "rows_per_second": summary["rows_per_second"],
+        "graph_api_calls": graph.requests - requests_before,
+        "graph_throttled": graph.throttled - throttled_before,
+        "download_requests": graph.content_requests - content_before,
+        "download_bytes": graph.content_bytes - bytes_before,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--songs", type=int, default=2000)
+    parser.add_argument("--retag", type=int, default=100, help="tracks changed before the incremental run")
+    parser.add_argument("--latency-ms", type=float, default=30, help="fake Graph API latency per call")
+    parser.add_argument("--content-latency-ms", type=float, default=60, help="time to first byte of a download")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of Graph calls answered 429")
+    parser.add_argument("--list-workers", type=int, help="INDEXER_LIST_WORKERS (default: the indexer's)")
+    parser.add_argument("--tag-workers", type=int, help="INDEXER_TAG_WORKERS (default: the indexer's)")
+    parser.add_argument("--seed", type=int, default=1)
+    add_json_argument(parser)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    library = Library(args.songs, args.seed)
+    print(f"Library: {args.songs} songs in {library.folder_count()} folders, "
+          f"built in {time.perf_counter() - started:.1f}s")
+    graph = FakeGraph(latency=args.latency_ms / 1000, content_latency=args.content_latency_ms / 1000,
+                      throttle_rate=args.throttle_rate, library=library).start()
+    os.environ["GRAPH_API_URL"] = graph.graph_api_url
+    if args.list_workers:
+        os.environ["INDEXER_LIST_WORKERS"] = str(args.list_workers)
+    if args.tag_workers:
+        os.environ["INDEXER_TAG_WORKERS"] = str(args.tag_workers)
+
+    with tempfile.TemporaryDirectory() as directory:
+        summary_file = os.path.join(directory, "indexer_summary.json")
+        os.environ["INDEXER_SUMMARY_FILE"] = summary_file
+        # Imported only now so graph_client and run_indexer pick up the settings above.
+        from graph_auth import token_provider
+        token_provider.get_token = lambda: "benchmark-token"
+        import run_indexer
+
+        new_database(directory, "music_bot.db").close()
+        # run_indexer opens music_bot.db relative to the working directory.
+        os.chdir(directory)
+        results = {"workers": {"list": run_indexer.LIST_WORKERS, "tag": run_indexer.TAG_WORKERS}}
+
+        results["full_scan"] = run(graph, run_indexer, [], summary_file)
+        songs, accuracy = check_catalog("music_bot.db", library)
+        results["full_scan"].update({"songs_in_catalog": songs, "tag_accuracy": accuracy})
+
+        changed = library.retag(args.retag)
+        song_ids = song_id_map("music_bot.db")
+        results["incremental"] = run(graph, run_indexer, ["--incremental"], summary_file)
+        songs, accuracy = check_catalog("music_bot.db", library, changed)
+        # Re-tagged songs keep their ids, so buttons and links already sent keep working.
+        new_ids = song_id_map("music_bot.db")
+        results["incremental"].update({"songs_in_catalog": songs, "tag_accuracy": accuracy,
+                                       "song_ids_changed": sum(new_ids.get(file_id) != song_ids[file_id]
+                                                               for file_id in changed)})
+        os.chdir(os.path.dirname(directory))
+    graph.stop()
+
+    for name in ("full_scan", "incremental"):
+        run_results = results[name]
+        print(f"{name}: {run_results['status']} in {run_results['seconds']:.1f}s, "
+              f"{run_results['songs_tagged']} songs ({run_results['songs_per_second']}/s), "
+              f"{run_results['folders_listed']} folders listed")
+        print(f"  per song: {run_results['tag_bytes_per_song']:,} bytes in {run_results['tag_requests_per_song']} "
+              f"range requests; Graph: {run_results['graph_api_calls']} API calls, "
+              f"{run_results['graph_throttled']} throttled")
+        print(f"  catalog: {run_results['songs_in_catalog']} songs; tags read correctly: "
+              + ", ".join(f"{fmt} {share:.0%}" for fmt, share in run_results["tag_accuracy"].items()))
+    print(f"  re-tagged songs given a new id: {results['incremental']['song_ids_changed']}")
+    write_results(args.json, "indexer", vars(args), results)
+
+if __name__ == "__main__":
+    main()
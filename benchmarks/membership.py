@@ -0,0 +1,75 @@
+"""is_member microbenchmark: per-update SQLite lookup vs. membership.MembershipCache.
+
+    python benchmarks/membership.py --members 1000 --checks 100000
+"""
+import os
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+from harness import new_database, add_json_argument, write_results
+
+from membership import MembershipCache
+
+def is_member_sqlite(db_file, user_id):
+    # The original bot.is_member: new connection, query and date parsing per update.
+    conn = sqlite3.connect(db_file)
+    cursor = conn.cursor()
+    cursor.execute("SELECT expiry_date, status FROM members WHERE telegram_id = ?", (user_id,))
+    result = cursor.fetchone()
+    conn.close()
+    if result:
+        expiry_date_str, status = result
+        try:
+            expiry_date = datetime.fromisoformat(expiry_date_str)
+        except ValueError:
+            expiry_date = datetime.strptime(expiry_date_str, "%Y-%m-%d %H:%M:%S.%f")
+        if status == "active" and expiry_date > datetime.now():
+            return True
+    return False
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--members", type=int, default=1000)
+    parser.add_argument("--checks", type=int, default=100000)
+    add_json_argument(parser)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        conn = new_database(directory, "members.db")
+        db_file = os.path.join(directory, "members.db")
+        with conn:
+            conn.executemany(
+                "INSERT INTO members (telegram_id, expiry_date, status) VALUES (?, ?, ?)",
+                [(user_id, (datetime.now() + timedelta(days=random.randint(-30, 30))).isoformat(),
+                  random.choice(["active", "active", "banned"])) for user_id in range(args.members)]
+            )
+        user_ids = [random.randrange(args.members * 2) for _ in range(args.checks)]
+        cache = MembershipCache(db_file)
+
+        for label, check in (("sqlite per update", lambda user_id: is_member_sqlite(db_file, user_id)),
+                             ("membership cache", cache.is_member)):
+            start = time.perf_counter()
+            for user_id in user_ids:
+                check(user_id)
+            elapsed = time.perf_counter() - start
+            results[label.replace(" ", "_")] = {"checks_per_second": round(args.checks / elapsed)}
+            print(f"{label:>18}: {args.checks / elapsed:,.0f} updates/sec")
+
+        assert all(cache.is_member(u) == is_member_sqlite(db_file, u) for u in range(args.members * 2))
+        # A write from another connection (another gunicorn worker) must be seen.
+        member = next(u for u in range(args.members) if cache.is_member(u))
+        with conn:
+            conn.execute("UPDATE members SET status = 'banned' WHERE telegram_id = ?", (member,))
+        time.sleep(cache.check_interval)
+        results["ban_visible_across_connections"] = not cache.is_member(member)
+        print(f"ban from another connection visible: {not cache.is_member(member)}")
+        conn.close()
+    write_results(args.json, "membership", vars(args), results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Paged listing check: run_indexer follows @odata.nextLink through folders longer than one page.
+
+FakeGraph caps every folder listing page below what the indexer asks for
+($top), so nearly every folder of the synthetic library spans several pages.
+Each folder is listed through run_indexer.list_folder and must come back
+complete and in order, with $top and $select sent on the first request and
+every later page fetched from nextLink; a full scan must then index every
+song. The exit code is 1 when any of this does not hold.
+
+    python benchmarks/paging.py --songs 1000 --page-size 3
+"""
+import os
+import sys
+import math
+import argparse
+import tempfile
+
+from harness import new_database, add_json_argument, write_results
+from fake_graph import FakeGraph, Library
+from indexer import check_catalog, run
+
+def check_listings(graph, library, run_indexer):
+    """List every folder; returns (folders listed incompletely, pages fetched, pages expected, bad queries)."""
+    incomplete = bad_queries = 0
+    pages_before = len(graph.listings)
+    expected_pages = 0
+    for folder_id, children in library.children.items():
+        start = len(graph.listings)
+        listed = [item["id"] for item in run_indexer.list_folder(folder_id)]
+        incomplete += listed != children
+        expected_pages += max(math.ceil(len(children) / graph.page_size), 1)
+        for page, (item_id, query) in enumerate(graph.listings[start:]):
+            bad_queries += (item_id != folder_id
+                            or query.get("$top") != [str(run_indexer.PAGE_SIZE)]
+                            or query.get("$select") != [run_indexer.CHILDREN_SELECT]
+                            or ("$skiptoken" in query) != (page > 0))
+    return incomplete, len(graph.listings) - pages_before, expected_pages, bad_queries
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--songs", type=int, default=1000)
+    parser.add_argument("--page-size", type=int, default=3, help="most children FakeGraph returns per page")
+    parser.add_argument("--latency-ms", type=float, default=2, help="fake Graph API latency per call")
+    parser.add_argument("--seed", type=int, default=1)
+    add_json_argument(parser)
+    args = parser.parse_args()
+
+    library = Library(args.songs, args.seed)
+    largest = max(len(children) for children in library.children.values())
+    print(f"Library: {args.songs} songs in {library.folder_count()} folders, up to {largest} children per folder; "
+          f"pages hold {args.page_size}")
+    graph = FakeGraph(latency=args.latency_ms / 1000, library=library, page_size=args.page_size).start()
+    os.environ["GRAPH_API_URL"] = graph.graph_api_url
+
+    with tempfile.TemporaryDirectory() as directory:
+        summary_file = os.path.join(directory, "indexer_summary.json")
+        os.environ["INDEXER_SUMMARY_FILE"] = summary_file
+        # Imported only now so graph_client and run_indexer pick up the settings above.
+        from graph_auth import token_provider
+        token_provider.get_token = lambda: "benchmark-token"
+        import run_indexer
+
+        incomplete, pages, expected_pages, bad_queries = check_listings(graph, library, run_indexer)
+        results = {"listing": {"folders": library.folder_count(), "folders_incomplete": incomplete,
+                               "pages": pages, "pages_expected": expected_pages, "bad_queries": bad_queries}}
+
+        new_database(directory, "music_bot.db").close()
+        # run_indexer opens music_bot.db relative to the working directory.
+        os.chdir(directory)
+        results["full_scan"] = run(graph, run_indexer, [], summary_file)
+        songs, accuracy = check_catalog("music_bot.db", library)
+        results["full_scan"].update({"songs_in_catalog": songs, "tag_accuracy": accuracy})
+        os.chdir(os.path.dirname(directory))
+    graph.stop()
+
+    listing, full_scan = results["listing"], results["full_scan"]
+    results["passed"] = (not incomplete and not bad_queries and pages == expected_pages
+                         and full_scan["status"] == "ok" and full_scan["songs_in_catalog"] == args.songs
+                         and all(share == 1 for share in accuracy.values()))
+    print(f"listing: {listing['folders']} folders in {pages} pages (expected {expected_pages}); "
+          f"{incomplete} incomplete, {bad_queries} requests without the expected $top/$select/$skiptoken")
+    print(f"full_scan: {full_scan['status']} in {full_scan['seconds']:.1f}s, "
+          f"{full_scan['graph_api_calls']} API calls; catalog: {full_scan['songs_in_catalog']} songs")
+    print("Paged listings complete." if results["passed"] else "Paged listings INCOMPLETE.")
+    write_results(args.json, "paging", vars(args), results)
+    if not results["passed"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
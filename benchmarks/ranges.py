@@ -0,0 +1,129 @@
+"""Range download check: download_proxy's Range, If-Range, resume and one-time-use rules.
+
+Song links are fetched through the bot's /download route (proxy mode) from a
+fake Graph server that serves byte ranges, ETags and If-Range. Each request
+must get the status, Content-Range and exact bytes it should: partial ranges,
+a resume inside and after DOWNLOAD_RESUME_WINDOW, replays, HEAD probes,
+unsatisfiable ranges and If-Range for a current and a stale ETag. The exit
+code is 1 when any does not.
+
+    python benchmarks/ranges.py --resume-window 2
+"""
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+import threading
+
+from harness import add_json_argument, write_results
+from fake_graph import FakeGraph, Library
+import synthetic_db
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-kb", type=int, default=512, help="size of every track")
+    parser.add_argument("--resume-window", type=int, default=2, help="DOWNLOAD_RESUME_WINDOW for the check")
+    add_json_argument(parser)
+    args = parser.parse_args()
+
+    songs = 8
+    library = Library(songs, audio_size=args.size_kb * 1024)
+    graph = FakeGraph(library=library).start()
+    os.environ["GRAPH_API_URL"] = graph.graph_api_url
+    os.environ["DOWNLOAD_MODE"] = "proxy"
+    os.environ["DOWNLOAD_RESUME_WINDOW"] = str(args.resume_window)
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:benchmark")
+    os.environ.setdefault("ADMIN_USER_ID", "0")
+
+    # Imported only now so graph_client and bot pick up the settings above.
+    import requests
+    from werkzeug.serving import make_server
+    from graph_auth import token_provider
+    token_provider.get_token = lambda: "benchmark-token"
+
+    checks = []
+    with tempfile.TemporaryDirectory() as directory:
+        # The same catalog as the library, so song ids line up with its files.
+        db_file = synthetic_db.generate(os.path.join(directory, "music_bot.db"), songs, members=10)
+        conn = sqlite3.connect(db_file)
+        user_id = conn.execute("SELECT telegram_id FROM members WHERE status = 'active' "
+                               "AND expiry_date > datetime('now')").fetchone()[0]
+        song_id, file_id = conn.execute("SELECT id, file_id FROM songs ORDER BY id LIMIT 1").fetchone()
+        conn.close()
+        content = library.files[file_id]
+        size = content.size
+        etag = graph.etag(file_id)
+        # bot opens music_bot.db relative to the working directory.
+        os.chdir(directory)
+        import bot
+
+        server = make_server("127.0.0.1", 0, bot.create_app(), threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_port}"
+
+        def link():
+            return f"{base_url}/download/{bot.token_signer.issue(bot.KIND_SONG, song_id, user_id)}"
+
+        def check(name, url, status, byte_range=None, method="GET", **headers):
+            """One request; ``byte_range`` is the (start, end) the body must hold, None for the whole file."""
+            response = requests.request(method, url, headers=headers, allow_redirects=False)
+            expected_range = f"bytes {byte_range[0]}-{byte_range[1]}/{size}" if byte_range and status == 206 else None
+            start, end = byte_range or (0, size - 1)
+            problems = []
+            if response.status_code != status:
+                problems.append(f"status {response.status_code}, expected {status}")
+            elif status == 416:
+                if response.headers.get("Content-Range") != f"bytes */{size}":
+                    problems.append(f"Content-Range {response.headers.get('Content-Range')!r}")
+            elif status in (200, 206):
+                if response.headers.get("Content-Range") != expected_range:
+                    problems.append(f"Content-Range {response.headers.get('Content-Range')!r}, "
+                                    f"expected {expected_range!r}")
+                if int(response.headers.get("Content-Length", -1)) != end - start + 1:
+                    problems.append(f"Content-Length {response.headers.get('Content-Length')}")
+                if method == "GET" and response.content != content.read(start, end):
+                    problems.append(f"body of {len(response.content)} bytes differs from bytes {start}-{end}")
+                if method == "HEAD" and response.content:
+                    problems.append("HEAD response has a body")
+            checks.append({"check": name, "status": response.status_code, "passed": not problems,
+                           "problems": problems})
+            print(f"  {'ok  ' if not problems else 'FAIL'} {name}: {response.status_code}"
+                  + (f" ({'; '.join(problems)})" if problems else ""))
+
+        print(f"One {size:,}-byte song, resume window {args.resume_window}s:")
+        check("whole file", link(), 200)
+
+        url = link()
+        check("first 100 bytes", url, 206, (0, 99), Range="bytes=0-99")
+        check("resume from byte 100 inside the window", url, 206, (100, size - 1), Range="bytes=100-")
+        check("replayed GET", url, 404)
+        check("replayed GET from byte 0", url, 404, Range="bytes=0-")
+        check("replayed HEAD", url, 404, method="HEAD")
+        time.sleep(args.resume_window + 0.5)
+        check("resume after the window", url, 404, Range="bytes=200-")
+
+        url = link()
+        check("HEAD probe", url, 200, method="HEAD")
+        check("GET after the HEAD probe", url, 404)
+        check("resume after the HEAD probe", url, 206, (1000, size - 1), Range="bytes=1000-")
+
+        check("range past the end", link(), 416, Range=f"bytes={size}-")
+        check("suffix range", link(), 206, (size - 500, size - 1), Range="bytes=-500")
+        check("If-Range with the current ETag", link(), 206, (0, 99), Range="bytes=0-99", **{"If-Range": etag})
+        check("If-Range with a stale ETag", link(), 200, Range="bytes=0-99", **{"If-Range": '"stale"'})
+        check("tampered link", link()[:-2] + "xx", 404)
+        server.shutdown()
+        os.chdir(os.path.dirname(directory))
+    graph.stop()
+
+    failed = [item["check"] for item in checks if not item["passed"]]
+    print(f"{len(checks) - len(failed)} of {len(checks)} checks passed.")
+    write_results(args.json, "ranges", vars(args), {"checks": checks, "passed": not failed,
+                                                    "checks_passed": len(checks) - len(failed)})
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
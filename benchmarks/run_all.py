@@ -0,0 +1,142 @@
+"""Offline benchmark suite: run every scenario and collect comparable JSON results.
+
+Each scenario runs in its own process against local fakes of OneDrive (Graph)
+and the Telegram Bot API, so no credentials or network access are needed:
+
+    indexer    full and incremental scans of a synthetic library of tagged files
+    search     search latency on 10k / 100k / 1M song catalogs
+    downloads  concurrent song and album ZIP downloads through the bot
+    updates    simulated users driving the Telegram handlers
+    db_writes, membership, fuzzy   the narrower micro-benchmarks
+    crawl      sequential vs concurrent (and throttled) scans must index the same catalog
+    paging     folder listings split over many pages must come back complete
+    tokens     the shared Graph token provider against a fake AAD token endpoint
+    ranges     Range, If-Range, resume and one-time-use rules of song downloads
+
+The checks (crawl, paging, tokens, ranges) exit non-zero on a mismatch, which marks the scenario failed.
+
+    python benchmarks/run_all.py --output before.json
+    python benchmarks/run_all.py --profile quick --only search updates --output after.json
+    python benchmarks/run_all.py --compare before.json after.json
+
+Generated catalogs are cached between runs (see search.py --cache-dir); the
+first "full" run spends a few minutes building the 1M-song one.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+from harness import RESULTS_VERSION, environment
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Command-line arguments per scenario and profile
+PROFILES = {
+    "quick": {
+        "indexer": ["--songs", "500", "--retag", "20", "--latency-ms", "10", "--content-latency-ms", "20"],
+        "search": ["--rows", "10000", "--queries", "50"],
+        "downloads": ["--downloads", "40", "--albums", "2", "--songs", "48", "--size-mb", "1"],
+        "updates": ["--sessions", "60", "--concurrency", "10"],
+        "db_writes": ["--rows", "2000"],
+        "membership": ["--checks", "20000"],
+        "fuzzy": ["--values", "50000", "--queries", "100"],
+        "crawl": ["--songs", "300"],
+        "paging": ["--songs", "300"],
+        "tokens": [],
+        "ranges": [],
+    },
+    "full": {
+        "indexer": ["--songs", "5000", "--retag", "200"],
+        "search": ["--rows", "10000", "100000", "1000000"],
+        "downloads": ["--downloads", "200", "--albums", "8"],
+        "updates": ["--sessions", "500", "--concurrency", "50", "--songs", "100000"],
+        "db_writes": ["--rows", "20000"],
+        "membership": [],
+        "fuzzy": ["--values", "1000000"],
+        "crawl": ["--songs", "2000"],
+        "paging": ["--songs", "2000"],
+        "tokens": [],
+        "ranges": [],
+    },
+}
+
+def run_scenario(name, arguments, directory):
+    output = os.path.join(directory, f"{name}.json")
+    print(f"\n=== {name} {' '.join(arguments)}", flush=True)
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, os.path.join(BENCHMARKS_DIR, f"{name}.py"), *arguments,
+                                "--json", output], cwd=directory)
+    if completed.returncode != 0 or not os.path.exists(output):
+        print(f"=== {name} failed (exit code {completed.returncode})")
+        return {"benchmark": name, "error": f"exit code {completed.returncode}"}
+    print(f"=== {name} finished in {time.perf_counter() - started:.0f}s")
+    with open(output) as f:
+        return json.load(f)
+
+def flatten(value, prefix=""):
+    """{"a": {"b": 1}} -> {"a.b": 1}, numbers only."""
+    if isinstance(value, dict):
+        items = {}
+        for key, child in value.items():
+            items.update(flatten(child, f"{prefix}.{key}" if prefix else str(key)))
+        return items
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix: value}
+    return {}
+
+def compare(before_file, after_file, match=None):
+    with open(before_file) as f:
+        before = json.load(f)
+    with open(after_file) as f:
+        after = json.load(f)
+    for key in ("python", "sqlite", "cpus"):
+        if before["environment"].get(key) != after["environment"].get(key):
+            print(f"note: {key} differs ({before['environment'].get(key)} -> {after['environment'].get(key)})")
+    for name, document in after["scenarios"].items():
+        previous = before["scenarios"].get(name)
+        if not previous or "results" not in previous or "results" not in document:
+            continue
+        if previous["params"] != document["params"]:
+            print(f"\n{name}: parameters differ, skipped")
+            continue
+        old, new = flatten(previous["results"]), flatten(document["results"])
+        rows = [(key, old[key], new[key]) for key in new if key in old and (not match or match in key)]
+        if not rows:
+            continue
+        print(f"\n{name} ({before['environment'].get('commit') or '?'} -> {after['environment'].get('commit') or '?'})")
+        width = max(len(key) for key, _, _ in rows)
+        for key, old_value, new_value in rows:
+            change = f"{(new_value - old_value) / old_value:+.1%}" if old_value else ""
+            print(f"  {key:<{width}}  {old_value:>12,.3f}  {new_value:>12,.3f}  {change:>8}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="full")
+    parser.add_argument("--only", nargs="+", choices=list(PROFILES["full"]), help="run just these scenarios")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two results files")
+    parser.add_argument("--match", help="with --compare, only metrics whose name contains this")
+    args = parser.parse_args()
+    if args.compare:
+        compare(*args.compare, match=args.match)
+        return
+
+    scenarios = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, arguments in PROFILES[args.profile].items():
+            if args.only and name not in args.only:
+                continue
+            scenarios[name] = run_scenario(name, arguments, directory)
+    with open(args.output, "w") as f:
+        json.dump({"version": RESULTS_VERSION, "profile": args.profile, "environment": environment(),
+                   "scenarios": scenarios}, f, indent=2, ensure_ascii=False)
+    failed = [name for name, document in scenarios.items() if "error" in document]
+    print(f"\nResults written to {args.output}" + (f"; failed: {', '.join(failed)}" if failed else ""))
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Search latency benchmark over synthetic catalogs of increasing size.
+
+For each search kind, the cost of a first reply (one FTS5 keyset page plus the
+capped match count, as send_search_results does it), of a Next page, and of a
+misspelled term (which falls back to the fuzzy index when nothing matches);
+plus the old LIKE '%term%' artist scan for comparison. Catalogs are generated
+once per size and reused from --cache-dir.
+
+    python benchmarks/search.py --rows 10000 100000 1000000
+"""
+import os
+import time
+import random
+import sqlite3
+import argparse
+
+from harness import latency_summary, add_json_argument, write_results
+import synthetic_db
+from fuzzy import FuzzyCatalog
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:benchmark")
+os.environ.setdefault("ADMIN_USER_ID", "0")
+
+import bot
+from db import Database
+
+MISSES = ["zzqx", "qwertyuiop", "xylophonez"]
+
+def sample_terms(conn, rng, count):
+    """Search terms per kind, drawn from the catalog: whole names and single words, plus misses."""
+    max_id = conn.execute("SELECT max(id) FROM songs").fetchone()[0]
+    terms = {kind: [] for kind in bot.SEARCH_KINDS}
+    while len(terms["all"]) < count:
+        row = conn.execute("SELECT songs.title, artists.name, albums.album_name FROM songs "
+                           "JOIN artists ON artists.id = songs.artist_id JOIN albums ON albums.id = songs.album_id "
+                           "WHERE songs.id = ?", (rng.randint(1, max_id),)).fetchone()
+        if row is None:
+            continue
+        title, artist, album = row
+        broad = rng.random() < 0.5
+        terms["artist"].append(rng.choice(artist.split()) if broad else artist)
+        terms["title"].append(rng.choice(title.split()) if broad else title)
+        terms["album"].append(rng.choice(album.split()) if broad else album)
+        terms["all"].append(f"{rng.choice(title.split())} {rng.choice(artist.split())}")
+    # One search in twenty finds nothing.
+    for kind_terms in terms.values():
+        for i in range(0, count, 20):
+            kind_terms[i] = MISSES[i // 20 % len(MISSES)]
+    return terms
+
+def typo(rng, text):
+    i = rng.randrange(len(text))
+    return text[:i] + text[i + 1:] if len(text) > 4 else text + "x"
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return (time.perf_counter() - start) * 1000, result
+
+def first_reply(kind, term):
+    rows, has_next = bot.search_page(kind, term)
+    if has_next:
+        bot.count_matches(kind, term)
+    return rows, has_next
+
+def bench_catalog(db_file, rows, args):
+    bot.db = Database(db_file)
+    conn = sqlite3.connect(db_file)
+    rng = random.Random(rows)
+    terms = sample_terms(conn, rng, args.queries)
+    results = {"database_mib": round(os.path.getsize(db_file) / 1024 / 1024, 1)}
+
+    started = time.perf_counter()
+    fuzzy = FuzzyCatalog(db_file)
+    # Loaded here rather than by start()'s background thread, so mark it ready by hand.
+    fuzzy.refresh()
+    fuzzy.ready.set()
+    bot.fuzzy_catalog = fuzzy
+    results["fuzzy_load_seconds"] = round(time.perf_counter() - started, 2)
+
+    for kind, kind_terms in terms.items():
+        first, following, typos, hits, fallbacks = [], [], [], 0, 0
+        for term in kind_terms:
+            elapsed, (page, has_next) = timed(first_reply, kind, term)
+            first.append(elapsed)
+            hits += bool(page)
+            if has_next:
+                cursor = bot.decode_cursor(bot.encode_cursor(page[-1]))
+                following.append(timed(bot.search_page, kind, term, cursor)[0])
+        for term in kind_terms[:args.queries // 4]:
+            if term in MISSES:
+                continue
+            # Prefix matching absorbs many typos; the rest take the fuzzy path.
+            misspelled = typo(rng, term)
+            start = time.perf_counter()
+            page, has_next, searched = bot.search_or_suggest(kind, misspelled)
+            if has_next:
+                bot.count_matches(kind, searched)
+            typos.append((time.perf_counter() - start) * 1000)
+            fallbacks += searched != misspelled or not page
+        results[kind] = {
+            "first_page": latency_summary(first),
+            "next_page": latency_summary(following),
+            "typo": latency_summary(typos),
+            "typo_fuzzy_fallback_rate": round(fallbacks / max(len(typos), 1), 3),
+            "hit_rate": round(hits / len(kind_terms), 3),
+        }
+
+    like = [timed(lambda term: conn.execute("SELECT songs.id, artists.name, songs.title FROM songs "
+                                            "JOIN artists ON artists.id = songs.artist_id WHERE artists.name LIKE ?",
+                                            (f"%{term}%",)).fetchall(), term)[0]
+            for term in terms["artist"][:args.like_queries]]
+    results["like_artist_scan"] = latency_summary(like)
+    conn.close()
+    bot.db.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--queries", type=int, default=200, help="searches per kind and catalog size")
+    parser.add_argument("--like-queries", type=int, default=20, help="LIKE scans to time per catalog size")
+    parser.add_argument("--cache-dir", default=synthetic_db.DEFAULT_CACHE_DIR,
+                        help="where generated catalogs are kept")
+    add_json_argument(parser)
+    args = parser.parse_args()
+
+    results = {}
+    for rows in args.rows:
+        started = time.perf_counter()
+        db_file = synthetic_db.cached(args.cache_dir, rows)
+        print(f"{rows} songs ({time.perf_counter() - started:.1f}s to prepare the catalog)")
+        results[str(rows)] = size_results = bench_catalog(db_file, rows, args)
+        for kind in bot.SEARCH_KINDS:
+            kind_results = size_results[kind]
+            print(f"  {kind:>6}: first page p50 {kind_results['first_page']['p50_ms']:7.2f} "
+                  f"p99 {kind_results['first_page']['p99_ms']:7.2f} ms | next page p50 "
+                  f"{kind_results['next_page'].get('p50_ms', 0):7.2f} ms | typo p50 "
+                  f"{kind_results['typo'].get('p50_ms', 0):7.2f} ms "
+                  f"({kind_results['typo_fuzzy_fallback_rate']:.0%} fuzzy) | hits {kind_results['hit_rate']:.0%}")
+        like = size_results["like_artist_scan"]
+        print(f"  LIKE artist scan p50 {like['p50_ms']:.2f} ms; fuzzy index loaded in "
+              f"{size_results['fuzzy_load_seconds']}s")
+    write_results(args.json, "search", vars(args), results)
+
+if __name__ == "__main__":
+    main()
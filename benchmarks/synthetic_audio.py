@@ -0,0 +1,155 @@
+"""Small but real FLAC, M4A, WAV and DSF files for the fake Graph library.
+
+Each file is a container header tagged by mutagen, so the indexer's tag reader
+parses exactly what it would on OneDrive, then a run of filler "audio" bytes,
+then (WAV, DSF) the ID3 chunk those formats keep after the audio. Only the
+header and trailer are stored; ``SyntheticFile.read`` generates the filler on
+demand, so a library of full-size tracks costs a few KiB per file.
+"""
+import io
+import struct
+from mutagen.flac import FLAC
+from mutagen.mp4 import MP4
+from mutagen.wave import WAVE
+from mutagen.dsf import DSF
+from mutagen.id3 import TIT2, TPE1, TALB
+
+FORMATS = ("flac", "m4a", "wav", "dsf")
+# Bytes of audio per second: typical FLAC, 256 kbps AAC, 16-bit/44.1 kHz PCM, stereo DSD64
+BYTE_RATES = {"flac": 110000, "m4a": 32000, "wav": 176400, "dsf": 705600}
+FILLER = bytes(range(256)) * 256
+
+
+class SyntheticFile:
+    def __init__(self, prefix: bytes, filler: int, suffix: bytes = b""):
+        self.prefix = prefix
+        self.filler = filler
+        self.suffix = suffix
+        self.size = len(prefix) + filler + len(suffix)
+
+    def read(self, start: int, end: int) -> bytes:
+        """Bytes ``start`` through ``end`` inclusive."""
+        data = bytearray()
+        filler_start = len(self.prefix)
+        suffix_start = filler_start + self.filler
+        offset = start
+        while offset <= end:
+            if offset < filler_start:
+                piece = self.prefix[offset:min(end + 1, filler_start)]
+            elif offset < suffix_start:
+                at = (offset - filler_start) % len(FILLER)
+                piece = FILLER[at:at + min(end + 1, suffix_start) - offset]
+            else:
+                piece = self.suffix[offset - suffix_start:end + 1 - suffix_start]
+            data += piece
+            offset += len(piece)
+        return bytes(data)
+
+
+def _tag(cls, header: bytes, apply) -> bytes:
+    f = io.BytesIO(header)
+    audio = cls(f)
+    if audio.tags is None:
+        audio.add_tags()
+    apply(audio.tags)
+    f.seek(0)
+    audio.save(f)
+    return f.getvalue()
+
+
+def _set_id3(title, artist, album):
+    def apply(tags):
+        tags.add(TIT2(encoding=3, text=[title]))
+        tags.add(TPE1(encoding=3, text=[artist]))
+        tags.add(TALB(encoding=3, text=[album]))
+    return apply
+
+
+def _atom(kind, *children):
+    body = b"".join(children)
+    return struct.pack(">I4s", 8 + len(body), kind) + body
+
+
+def _full_atom(kind, payload):
+    return _atom(kind, b"\0\0\0\0" + payload)
+
+
+def _descriptor(tag, payload):
+    return bytes([tag, len(payload)]) + payload
+
+
+def flac(title, artist, album, seconds, audio_size) -> SyntheticFile:
+    # STREAMINFO: 4096-sample blocks, 44.1 kHz, stereo, 16 bit
+    rate, channels, bits = 44100, 2, 16
+    packed = (rate << 44) | ((channels - 1) << 41) | ((bits - 1) << 36) | (rate * seconds)
+    info = struct.pack(">HH", 4096, 4096) + b"\0" * 6 + packed.to_bytes(8, "big") + b"\0" * 16
+    header = b"fLaC" + bytes([0x80]) + len(info).to_bytes(3, "big") + info
+
+    def apply(tags):
+        tags["title"], tags["artist"], tags["album"] = title, artist, album
+    return SyntheticFile(_tag(FLAC, header, apply), audio_size)
+
+
+def m4a(title, artist, album, seconds, audio_size) -> SyntheticFile:
+    # ftyp, then moov (one AAC-LC sound track), then mdat: the "fast start" layout
+    rate, bitrate = 44100, 256000
+    config = _descriptor(0x04, struct.pack(">BB3sII", 0x40, 0x15, b"\0\0\0", bitrate, bitrate)
+                         + _descriptor(0x05, b"\x12\x10"))
+    esds = _full_atom(b"esds", _descriptor(0x03, struct.pack(">HB", 1, 0) + config + _descriptor(0x06, b"\x02")))
+    mp4a = _atom(b"mp4a", b"\0" * 6 + struct.pack(">H", 1) + b"\0" * 8
+                 + struct.pack(">HHHHI", 2, 16, 0, 0, rate << 16), esds)
+    stbl = _atom(b"stbl", _full_atom(b"stsd", struct.pack(">I", 1) + mp4a), _full_atom(b"stts", b"\0" * 4),
+                 _full_atom(b"stsc", b"\0" * 4), _full_atom(b"stsz", b"\0" * 8), _full_atom(b"stco", b"\0" * 4))
+    mdia = _atom(b"mdia",
+                 _full_atom(b"mdhd", struct.pack(">IIIIHH", 0, 0, rate, rate * seconds, 0x55C4, 0)),
+                 _full_atom(b"hdlr", b"\0\0\0\0soun" + b"\0" * 12 + b"SoundHandler\0"),
+                 _atom(b"minf", _full_atom(b"smhd", b"\0" * 4), stbl))
+    moov = _atom(b"moov", _full_atom(b"mvhd", struct.pack(">IIII", 0, 0, rate, rate * seconds) + b"\0" * 80),
+                 _atom(b"trak", mdia))
+    header = _atom(b"ftyp", b"M4A \0\0\0\0M4A mp42isom") + moov + _atom(b"mdat")
+
+    def apply(tags):
+        tags["\xa9nam"], tags["\xa9ART"], tags["\xa9alb"] = [title], [artist], [album]
+    data = _tag(MP4, header, apply)
+    # mutagen keeps mdat last; grow it over the filler.
+    return SyntheticFile(data[:-8] + struct.pack(">I4s", 8 + audio_size, b"mdat"), audio_size)
+
+
+def wav(title, artist, album, seconds, audio_size) -> SyntheticFile:
+    audio_size += audio_size % 2  # RIFF chunks are word-aligned
+    fmt = struct.pack("<HHIIHH", 1, 2, 44100, 44100 * 4, 4, 16)
+    body = b"WAVE" + b"fmt " + struct.pack("<I", len(fmt)) + fmt + b"data" + struct.pack("<I", 0)
+    data = _tag(WAVE, b"RIFF" + struct.pack("<I", len(body)) + body, _set_id3(title, artist, album))
+    # RIFF header, fmt, an empty data chunk and the "id3 " chunk: put the audio in the data chunk.
+    split = data.index(b"data") + 8
+    prefix = bytearray(data[:split])
+    struct.pack_into("<I", prefix, 4, len(data) - 8 + audio_size)
+    struct.pack_into("<I", prefix, split - 4, audio_size)
+    return SyntheticFile(bytes(prefix), audio_size, data[split:])
+
+
+def dsf(title, artist, album, seconds, audio_size) -> SyntheticFile:
+    # DSD64 stereo, 1 bit per sample, 4096-byte blocks per channel
+    rate = 2822400
+    fmt = struct.pack("<4sQIIIIIIQII", b"fmt ", 52, 1, 0, 2, 2, rate, 1, rate * seconds, 4096, 0)
+    chunk = b"data" + struct.pack("<Q", 12)
+    header = b"DSD " + struct.pack("<QQQ", 28, 28 + len(fmt) + len(chunk), 0) + fmt + chunk
+    data = _tag(DSF, header, _set_id3(title, artist, album))
+    # DSD chunk (file size, metadata offset), fmt, empty data chunk, then ID3 at the end.
+    split = len(header)
+    file_size, metadata_offset = struct.unpack_from("<QQ", data, 12)
+    prefix = bytearray(data[:split])
+    struct.pack_into("<QQ", prefix, 12, file_size + audio_size, metadata_offset + audio_size)
+    struct.pack_into("<Q", prefix, split - 8, 12 + audio_size)
+    return SyntheticFile(bytes(prefix), audio_size, data[split:])
+
+
+BUILDERS = {"flac": flac, "m4a": m4a, "wav": wav, "dsf": dsf}
+
+
+def build(fmt: str, title: str, artist: str, album: str, seconds: int = 240,
+          audio_size: int = None) -> SyntheticFile:
+    """A tagged ``fmt`` file; the audio size defaults to ``seconds`` at the format's usual bitrate."""
+    if audio_size is None:
+        audio_size = seconds * BYTE_RATES[fmt]
+    return BUILDERS[fmt](title, artist, album, seconds, audio_size)
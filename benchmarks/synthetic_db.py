@@ -0,0 +1,171 @@
+"""Synthetic music catalog: the same artists, albums and tracks for the fake Graph
+library and for pre-built bot databases of any size.
+
+    python benchmarks/synthetic_db.py --songs 1000000 --output /tmp/music_bot.db
+
+Names mix English, accented and Burmese words so normalization, FTS tokenizing
+and the fuzzy index all see the kinds of text the real catalog has. The same
+seed always produces the same catalog.
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+import contextlib
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from harness import new_database
+
+from normalize import build_search_text
+
+WORDS = ["love", "night", "river", "golden", "blue", "moon", "rain", "summer", "heart", "road",
+         "dream", "fire", "ocean", "silver", "star", "wind", "city", "light", "shadow", "garden",
+         "morning", "echo", "paper", "glass", "winter", "home", "wild", "electric", "velvet", "north"]
+ACCENTED = ["café", "señorita", "mañana", "corazón", "déjà", "naïve", "über", "fiancée", "piñata", "rosé"]
+BURMESE = ["ချစ်", "မေတ္တာ", "ည", "မိုး", "ပန်း", "ရင်ခုန်", "လမင်း", "ကြယ်", "မန္တလေး", "ရန်ကုန်", "သီချင်း", "အိပ်မက်"]
+# Share of albums in each container format
+FORMAT_WEIGHTS = {"flac": 50, "m4a": 25, "wav": 15, "dsf": 10}
+TRACKS_PER_ALBUM = 12
+ALBUMS_PER_ARTIST = 6
+# Typical stream bitrate (bits/s) per format, for the songs' bitrate and size columns
+BITRATES = {"flac": 880000, "m4a": 256000, "wav": 1411200, "dsf": 5644800}
+# Part of cached file names; bump when generated catalogs change
+CATALOG_VERSION = 5
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "od-search-benchmarks")
+
+Track = namedtuple("Track", "artist album disc number title fmt seconds")
+
+
+def phrase(rng, low, high):
+    words = []
+    for _ in range(rng.randint(low, high)):
+        pick = rng.random()
+        pool = BURMESE if pick < 0.2 else ACCENTED if pick < 0.3 else WORDS
+        word = rng.choice(pool)
+        words.append(word.title() if pool is not BURMESE else word)
+    return " ".join(words)
+
+
+def unique(rng, seen, low, high):
+    name = phrase(rng, low, high)
+    while name in seen:
+        name = f"{phrase(rng, low, high)} {rng.randint(2, 99)}"
+    seen.add(name)
+    return name
+
+
+def catalog(songs, seed=1, tracks_per_album=TRACKS_PER_ALBUM, albums_per_artist=ALBUMS_PER_ARTIST):
+    """Yield ``songs`` Tracks, album by album; about one album in ten has a second disc."""
+    rng = random.Random(seed)
+    formats, weights = zip(*FORMAT_WEIGHTS.items())
+    artists, produced = set(), 0
+    while produced < songs:
+        artist = unique(rng, artists, 1, 3)
+        albums = set()
+        for _ in range(albums_per_artist):
+            album = unique(rng, albums, 1, 4)
+            fmt = rng.choices(formats, weights)[0]
+            discs = 2 if rng.random() < 0.1 else 1
+            titles = set()
+            for index in range(tracks_per_album):
+                if produced == songs:
+                    return
+                disc = 1 + index * discs // tracks_per_album
+                yield Track(artist, album, disc, index + 1, unique(rng, titles, 1, 4), fmt, rng.randint(120, 420))
+                produced += 1
+
+
+def file_name(track: Track) -> str:
+    return f"{track.number:02d}. {track.title}.{track.fmt}"
+
+
+def generate(db_file, songs, members=1000, seed=1):
+    """Build ``db_file`` with the schema from create_database.py and a catalog of ``songs`` tracks."""
+    directory, name = os.path.split(os.path.abspath(db_file))
+    conn = new_database(directory, name)
+    folder_rows = [(1, "root", None, "", "", 1), (2, "music", 1, "Music", "/Music", 1)]
+    artist_ids, album_ids, folder_ids = {}, {}, {"": 1, "/Music": 2}
+
+    def folder(item_id, parent_path, name):
+        path = f"{parent_path}/{name}"
+        if path not in folder_ids:
+            folder_ids[path] = len(folder_rows) + 1
+            folder_rows.append((folder_ids[path], item_id, folder_ids[parent_path], name, path, 1))
+        return folder_ids[path], path
+
+    def song_rows():
+        # Streamed into executemany; folders, artists and albums are few enough to collect on the way.
+        for index, track in enumerate(catalog(songs, seed)):
+            artist_id = artist_ids.setdefault(track.artist, len(artist_ids) + 1)
+            _, artist_path = folder(f"FA{artist_id:07d}", "/Music", track.artist)
+            key = (track.artist, track.album)
+            album_folder, album_path = folder(f"FB{len(album_ids):07d}", artist_path, track.album)
+            album_id = album_ids.setdefault(key, (len(album_ids) + 1, album_folder))[0]
+            folder_id = album_folder
+            if track.disc > 1:
+                # Same layout as fake_graph.Library: later discs in a subfolder of the album.
+                folder_id, _ = folder(f"FD{len(folder_rows):07d}", album_path, f"Disc {track.disc}")
+            yield (f"I{index:08d}", folder_id, file_name(track), track.title, artist_id, album_id,
+                   build_search_text(track.title, track.artist, track.album), f"c{index}", track.seconds,
+                   BITRATES[track.fmt], track.seconds * BITRATES[track.fmt] // 8)
+
+    rng = random.Random(seed)
+    now = datetime.now()
+    member_rows = [(user_id, (now + timedelta(days=rng.randint(-30, 365))).isoformat(),
+                    "banned" if rng.random() < 0.05 else "active") for user_id in range(1, members + 1)]
+    conn.execute("PRAGMA synchronous=OFF")
+    with conn:
+        conn.executemany("INSERT INTO songs (file_id, folder_id, file_name, title, artist_id, album_id, search_text, "
+                         "ctag, duration, bitrate, size) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", song_rows())
+        conn.executemany("INSERT INTO folders (id, item_id, parent_id, name, path, scanned) VALUES (?, ?, ?, ?, ?, ?)",
+                         folder_rows)
+        conn.executemany("INSERT INTO artists (id, name) VALUES (?, ?)",
+                         [(artist_id, name) for name, artist_id in artist_ids.items()])
+        conn.executemany("INSERT INTO albums (id, album_name, artist_id, folder_id) VALUES (?, ?, ?, ?)",
+                         [(album_id, album, artist_ids[artist], folder_id)
+                          for (artist, album), (album_id, folder_id) in album_ids.items()])
+        conn.executemany("INSERT INTO members (telegram_id, expiry_date, status) VALUES (?, ?, ?)", member_rows)
+        # Songs went in before their artists, so index the search tables again with the names.
+        for fts in ("songs_fts", "albums_fts"):
+            conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+    # Imported here: fake_graph uses this module before the indexer benchmark configures run_indexer.
+    import run_indexer
+    with conn:
+        for sql in run_indexer.SECONDARY_INDEXES.values():
+            conn.execute(sql)
+    conn.execute("PRAGMA optimize")
+    conn.close()
+    return db_file
+
+
+def cached(cache_dir, songs, members=1000, seed=1):
+    """Path of a generated database, building it only if this size and seed is not in ``cache_dir`` yet."""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"catalog_v{CATALOG_VERSION}_{songs}_{members}_{seed}.db")
+    if not os.path.exists(path):
+        partial = path + ".partial"
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(partial)
+        generate(partial, songs, members, seed)
+        os.rename(partial, path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--songs", type=int, default=100000)
+    parser.add_argument("--members", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="music_bot.db")
+    args = parser.parse_args()
+    if os.path.exists(args.output):
+        parser.error(f"{args.output} already exists")
+    started = time.perf_counter()
+    generate(args.output, args.songs, args.members, args.seed)
+    print(f"{args.songs} songs written to {args.output} in {time.perf_counter() - started:.1f}s "
+          f"({os.path.getsize(args.output) / 1024 / 1024:.1f} MiB)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""Token provider check: graph_auth.TokenProvider against a fake AAD token endpoint.
+
+Real MSAL talks to FakeGraph's OpenID configuration and token endpoints
+(requests for login.microsoftonline.com are routed to it). The provider must
+build one MSAL application, answer a burst of concurrent callers with a single
+token request, serve later calls from memory, and once the token is within
+its refresh margin let exactly one caller refresh while the rest keep the
+still-valid token. The old per-call MSAL application is timed alongside for
+comparison. The exit code is 1 when the provider does not behave.
+
+    python benchmarks/tokens.py --token-latency-ms 150 --threads 32
+"""
+import sys
+import time
+import argparse
+import threading
+
+import requests
+
+from harness import latency_summary, add_json_argument, write_results
+from fake_graph import AUTHORITY_HOST, FakeGraph
+
+TENANT = "benchmark-tenant"
+
+class RoutedSession(requests.Session):
+    """A session that sends requests for the real authority host to the fake."""
+
+    def __init__(self, fake_url):
+        super().__init__()
+        self.fake_url = fake_url
+
+    def request(self, method, url, *args, **kwargs):
+        if url.startswith(AUTHORITY_HOST):
+            url = self.fake_url + url[len(AUTHORITY_HOST):]
+        return super().request(method, url, *args, **kwargs)
+
+def routed_application(graph):
+    """msal.ConfidentialClientApplication talking to ``graph``, counting how many are built."""
+    import msal
+
+    class RoutedApplication(msal.ConfidentialClientApplication):
+        created = 0
+
+        def __init__(self, *args, **kwargs):
+            type(self).created += 1
+            kwargs.setdefault("http_client", RoutedSession(graph.url))
+            super().__init__(*args, **kwargs)
+
+    return RoutedApplication
+
+def burst(provider, threads):
+    """``threads`` concurrent get_token calls; returns [(token, milliseconds)]."""
+    barrier = threading.Barrier(threads)
+    calls = [None] * threads
+
+    def call(index):
+        barrier.wait()
+        started = time.perf_counter()
+        token = provider.get_token()
+        calls[index] = (token, (time.perf_counter() - started) * 1000)
+
+    workers = [threading.Thread(target=call, args=(index,)) for index in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return calls
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--token-latency-ms", type=float, default=150, help="fake AAD token request latency")
+    parser.add_argument("--threads", type=int, default=32, help="concurrent callers per burst")
+    parser.add_argument("--calls", type=int, default=2000, help="warm get_token calls timed")
+    parser.add_argument("--lifetime", type=int, default=4, help="seconds a token lasts in the refresh phase")
+    parser.add_argument("--margin", type=int, default=2, help="refresh margin in the refresh phase")
+    add_json_argument(parser)
+    args = parser.parse_args()
+
+    graph = FakeGraph(token_latency=args.token_latency_ms / 1000).start()
+    import msal
+    application = msal.ConfidentialClientApplication = routed_application(graph)
+    from graph_auth import TokenProvider, SCOPE
+    token_latency = args.token_latency_ms
+    results, failures = {}, []
+
+    def provider(**kwargs):
+        return TokenProvider(tenant_id=TENANT, client_id="benchmark-client", client_secret="benchmark-secret",
+                             authority_host=AUTHORITY_HOST, **kwargs)
+
+    def check(condition, message):
+        if not condition:
+            failures.append(message)
+
+    # Cold start: a burst of callers, one token request, one MSAL application.
+    shared = provider()
+    calls = burst(shared, args.threads)
+    tokens = {token for token, _ in calls}
+    results["cold_burst"] = {"callers": args.threads, "token_requests": graph.token_requests,
+                             "applications": application.created, "distinct_tokens": len(tokens),
+                             "latency": latency_summary([ms for _, ms in calls])}
+    check(graph.token_requests == 1, f"cold burst made {graph.token_requests} token requests")
+    check(len(tokens) == 1 and None not in tokens, f"cold burst got tokens {sorted(map(str, tokens))}")
+
+    # Warm: every later call is served from memory.
+    samples = []
+    for _ in range(args.calls):
+        started = time.perf_counter()
+        shared.get_token()
+        samples.append((time.perf_counter() - started) * 1000)
+    results["warm"] = {"token_requests": graph.token_requests, "latency": latency_summary(samples)}
+    check(graph.token_requests == 1, f"warm calls made {graph.token_requests - 1} token requests")
+
+    # Refresh margin: one caller refreshes, the others keep the old token without waiting.
+    graph.token_lifetime = args.lifetime
+    short_lived = provider(refresh_margin=args.margin)
+    requests_before = graph.token_requests
+    first = short_lived.get_token()
+    time.sleep(args.lifetime - args.margin + 0.5)
+    calls = burst(short_lived, args.threads)
+    waited = sum(ms >= token_latency for _, ms in calls)
+    tokens = {token for token, _ in calls}
+    after = short_lived.get_token()
+    results["refresh"] = {"token_requests": graph.token_requests - requests_before - 1,
+                          "callers_waiting": waited, "old_token_served": sum(token == first for token, _ in calls),
+                          "latency": latency_summary([ms for _, ms in calls])}
+    check(results["refresh"]["token_requests"] == 1,
+          f"refresh burst made {results['refresh']['token_requests']} token requests")
+    check(waited <= 1, f"{waited} callers waited for the refresh")
+    check(None not in tokens and tokens <= {first, after}, "refresh burst got an unexpected token")
+    check(after != first, "token was not refreshed within the margin")
+
+    # Expired: every caller needs the new token, still from a single request.
+    time.sleep(args.lifetime + 0.5)
+    requests_before = graph.token_requests
+    calls = burst(short_lived, args.threads)
+    tokens = {token for token, _ in calls}
+    results["expired"] = {"token_requests": graph.token_requests - requests_before, "distinct_tokens": len(tokens)}
+    check(results["expired"]["token_requests"] == 1,
+          f"expired burst made {results['expired']['token_requests']} token requests")
+    check(len(tokens) == 1 and None not in tokens and after not in tokens, "expired burst got a stale token")
+    # One MSAL application per provider, however often it refreshed.
+    results["applications"] = application.created
+    check(application.created == 2, f"{application.created} MSAL applications built for 2 providers")
+
+    # Before the provider: a new MSAL application and token request per call.
+    graph.token_lifetime = 3600
+    samples = []
+    for _ in range(10):
+        started = time.perf_counter()
+        per_call = msal.ConfidentialClientApplication(
+            client_id="benchmark-client", authority=f"{AUTHORITY_HOST}/{TENANT}", client_credential="benchmark-secret")
+        per_call.acquire_token_for_client(scopes=SCOPE)
+        samples.append((time.perf_counter() - started) * 1000)
+    results["per_call_application"] = {"latency": latency_summary(samples)}
+    graph.stop()
+
+    results["passed"] = not failures
+    print(f"cold burst: {args.threads} callers, {results['cold_burst']['token_requests']} token request, "
+          f"p50 {results['cold_burst']['latency']['p50_ms']:.1f} ms")
+    print(f"warm: {args.calls} calls, p50 {results['warm']['latency']['p50_ms']:.3f} ms "
+          f"vs {results['per_call_application']['latency']['p50_ms']:.1f} ms with an MSAL application per call")
+    print(f"refresh: {results['refresh']['token_requests']} token request, {waited} of {args.threads} callers "
+          f"waited, {results['refresh']['old_token_served']} served the old token")
+    print(f"expired: {results['expired']['token_requests']} token request for {args.threads} callers")
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    write_results(args.json, "tokens", vars(args), results)
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
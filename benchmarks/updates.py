@@ -0,0 +1,215 @@
+"""Update handling benchmark: simulated users driving the bot through its webhook.
+
+A member's session is /start, a search, the Next page, then a download
+button; non-members send /start and a search that is ignored. Every update is
+POSTed to the webhook route of the bot's Flask app, like Telegram does, and
+the Bot API is answered by a fake server. Two latencies are measured: the
+webhook's answer to Telegram (ack), and the time until the bot's reply
+reaches the fake Bot API (reply). Startup is measured too: importing bot, and
+the first update a fresh bot process handles.
+
+    python benchmarks/updates.py --sessions 500 --concurrency 50 --songs 100000
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import sqlite3
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from harness import latency_summary, add_json_argument, write_results
+from fake_telegram import FakeTelegram, UpdateFactory
+import synthetic_db
+
+COMMANDS = {"/s": "all", "/s_artist": "artist", "/s_title": "title", "/s_album": "album"}
+ACTIONS = ("start", "search", "next_page", "download_link")
+
+def search_terms(db_file, rng, count):
+    conn = sqlite3.connect(db_file)
+    max_id = conn.execute("SELECT max(id) FROM songs").fetchone()[0]
+    terms = []
+    for song_id in (rng.randint(1, max_id) for _ in range(count)):
+        title, artist, album = conn.execute(
+            "SELECT songs.title, artists.name, albums.album_name FROM songs JOIN artists ON artists.id = songs.artist_id "
+            "JOIN albums ON albums.id = songs.album_id WHERE songs.id = ?", (song_id,)).fetchone()
+        command = rng.choice(list(COMMANDS))
+        term = {"/s": f"{rng.choice(title.split())} {rng.choice(artist.split())}", "/s_artist": artist,
+                "/s_title": title, "/s_album": album}[command]
+        terms.append(f"{command} {term}")
+    conn.close()
+    return terms
+
+def member_ids(db_file):
+    conn = sqlite3.connect(db_file)
+    ids = [row[0] for row in conn.execute(
+        "SELECT telegram_id FROM members WHERE status = 'active' AND expiry_date > datetime('now')")]
+    outsider = conn.execute("SELECT max(telegram_id) FROM members").fetchone()[0] + 1
+    conn.close()
+    return ids, outsider
+
+class Webhook:
+    """Posts updates to the bot's webhook route and times the ack and the bot's reply."""
+
+    def __init__(self, url, telegram, reply_timeout):
+        import requests
+
+        self.url = url
+        self.telegram = telegram
+        self.reply_timeout = reply_timeout
+        self.session = requests.Session()
+        self.session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=256))
+        self.acks = []
+        self.replies = defaultdict(list)
+        self.failed_acks = 0
+        self.missing_replies = 0
+        self._lock = threading.Lock()
+
+    def send(self, action, chat_id, data, expect_reply=True):
+        seen = self.telegram.replies(chat_id)
+        start = time.perf_counter()
+        response = self.session.post(self.url, json=data)
+        ack = time.perf_counter()
+        replied = expect_reply and self.telegram.wait_for_reply(chat_id, seen, self.reply_timeout)
+        with self._lock:
+            self.acks.append((ack - start) * 1000)
+            if response.status_code != 200:
+                self.failed_acks += 1
+            if replied:
+                self.replies[action].append((time.perf_counter() - start) * 1000)
+            elif expect_reply:
+                self.missing_replies += 1
+        return (ack - start) * 1000
+
+def drive(webhook, telegram, db_file, args):
+    factory = UpdateFactory()
+    rng = random.Random(args.seed)
+    members, first_outsider = member_ids(db_file)
+    terms = search_terms(db_file, rng, args.sessions)
+    plans = [(index, rng.random() >= args.outsider_rate, rng.random()) for index in range(args.sessions)]
+
+    def session(plan):
+        index, is_member, pick = plan
+        user_id = members[index % len(members)] if is_member else first_outsider + index
+        webhook.send("start", user_id, factory.message(user_id, "/start"))
+        webhook.send("search", user_id, factory.message(user_id, terms[index]), expect_reply=is_member)
+        if not is_member:
+            return
+        pages = [data for data in telegram.buttons(user_id) if data.startswith("pg_")]
+        if pages:
+            webhook.send("next_page", user_id, factory.callback(user_id, pages[-1], telegram.message_id(user_id)))
+        downloads = [data for data in telegram.buttons(user_id) if not data.startswith("pg_")]
+        if downloads:
+            webhook.send("download_link", user_id, factory.callback(
+                user_id, downloads[int(pick * len(downloads))], telegram.message_id(user_id)))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(session, plans))
+    elapsed = time.perf_counter() - started
+    total = len(webhook.acks)
+    return {
+        "updates": total,
+        "seconds": round(elapsed, 3),
+        "updates_per_second": round(total / elapsed, 1),
+        "ack": latency_summary(webhook.acks),
+        "reply": {action: latency_summary(webhook.replies[action]) for action in ACTIONS},
+        "failed_acks": webhook.failed_acks,
+        "missing_replies": webhook.missing_replies,
+        "bot_api_calls": dict(telegram.calls),
+    }
+
+def serve():
+    """Child process: the bot's Flask app on a local port, like one gunicorn worker."""
+    from werkzeug.serving import make_server
+    start = time.perf_counter()
+    import bot
+    import_seconds = time.perf_counter() - start
+    logging.getLogger().setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, bot.create_app(), threaded=True)
+    print(f"listening {server.server_port} {import_seconds:.4f}", flush=True)
+
+    def report_fuzzy_ready():
+        bot.fuzzy_catalog.ready.wait()
+        print("fuzzy ready", flush=True)
+    threading.Thread(target=report_fuzzy_ready, daemon=True).start()
+    server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=30, help="users active at the same time")
+    parser.add_argument("--songs", type=int, default=10000, help="catalog size")
+    parser.add_argument("--outsider-rate", type=float, default=0.1, help="share of sessions from non-members")
+    parser.add_argument("--telegram-latency-ms", type=float, default=30, help="fake Bot API latency per call")
+    parser.add_argument("--reply-timeout", type=float, default=30, help="seconds to wait for each reply")
+    parser.add_argument("--cache-dir", default=synthetic_db.DEFAULT_CACHE_DIR,
+                        help="where generated catalogs are kept")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    add_json_argument(parser)
+    args = parser.parse_args()
+    if args.serve:
+        serve()
+        return
+
+    telegram = FakeTelegram(latency=args.telegram_latency_ms / 1000).start()
+    environment = dict(os.environ, TELEGRAM_API_URL=telegram.api_url)
+    for name, value in (("TELEGRAM_BOT_TOKEN", "0:benchmark"), ("ADMIN_USER_ID", "0"),
+                        ("WEBHOOK_URL", "https://bot.example")):
+        environment.setdefault(name, value)
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_file = os.path.join(directory, "music_bot.db")
+        shutil.copy(synthetic_db.cached(args.cache_dir, args.songs), db_file)
+        # The bot runs in a process of its own (it opens music_bot.db in its working directory),
+        # so the simulated users and the fake Bot API do not compete with it for the GIL.
+        started = time.perf_counter()
+        worker = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve"], cwd=directory,
+                                  env=environment, stdout=subprocess.PIPE, text=True)
+        try:
+            _, port, import_seconds = worker.stdout.readline().split()
+            listening_seconds = time.perf_counter() - started
+            webhook = Webhook(f"http://127.0.0.1:{port}/{environment['TELEGRAM_BOT_TOKEN']}", telegram,
+                              args.reply_timeout)
+            # The first update a process gets also pays for setting the bot up.
+            first_chat = member_ids(db_file)[0][0]
+            start = time.perf_counter()
+            first_ack_ms = webhook.send("start", first_chat, UpdateFactory().message(first_chat, "/start"))
+            first_reply_ms = (time.perf_counter() - start) * 1000
+            webhook.acks.clear()
+            webhook.replies.clear()
+            # Typo fallbacks should hit a loaded fuzzy index, as they would once a worker is warm.
+            worker.stdout.readline()
+
+            results = drive(webhook, telegram, db_file, args)
+        finally:
+            worker.terminate()
+            worker.wait()
+    telegram.stop()
+    results["startup"] = {"import_seconds": round(float(import_seconds), 3),
+                          "listening_seconds": round(listening_seconds, 3),
+                          "first_ack_ms": round(first_ack_ms, 1), "first_reply_ms": round(first_reply_ms, 1)}
+
+    startup = results["startup"]
+    print(f"startup: listening after {startup['listening_seconds']:.2f}s (import bot {startup['import_seconds']:.2f}s); "
+          f"first update acked in {startup['first_ack_ms']:.0f} ms, answered in {startup['first_reply_ms']:.0f} ms")
+    print(f"{results['updates']} updates from {args.sessions} sessions ({args.concurrency} at a time) "
+          f"in {results['seconds']:.2f}s: {results['updates_per_second']} updates/s")
+    print(f"  {'webhook ack':>13}: p50 {results['ack']['p50_ms']:7.1f}  p99 {results['ack']['p99_ms']:7.1f} ms")
+    for action, summary in results["reply"].items():
+        if not summary["count"]:
+            continue
+        print(f"  {action:>13}: p50 {summary['p50_ms']:7.1f}  p99 {summary['p99_ms']:7.1f} ms  ({summary['count']})")
+    print(f"  Bot API calls: {results['bot_api_calls']}; failed acks: {results['failed_acks']}, "
+          f"missing replies: {results['missing_replies']}")
+    write_results(args.json, "updates", vars(args), results)
+
+if __name__ == "__main__":
+    main()
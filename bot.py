@@ -1,35 +1,132 @@
+from __future__ import annotations
+
 import os
-import sqlite3
+import hmac
+import base64
+import struct
+import hashlib
+import time
+import secrets
 import logging
-import requests
-import msal
-import uuid
+import posixpath
+import re
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+from urllib.parse import quote
 from datetime import datetime, timedelta
 from flask import Flask, request, Response, stream_with_context, redirect
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.constants import ParseMode
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler
+from graph_auth import token_provider
+import graph_client
+import metrics
+from cache import TTLCache
+from membership import MembershipCache
+from db import Database
+from normalize import normalize_text
+from fuzzy import FuzzyCatalog
+from zipstream import ZipStream, read_ahead
+from signed_tokens import TokenSigner, ReplayGuard, KIND_SONG, KIND_ALBUM
+from update_processor import UpdateProcessor
+
+# python-telegram-bot (and its HTTP clients) is loaded by the first webhook update, not at startup.
+if TYPE_CHECKING:
+    from telegram import Update
 
 # --- Configuration ---
 BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+# Bot API endpoint the token is appended to; e.g. a self-hosted Bot API server
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org/bot")
 ADMIN_USER_ID = int(os.getenv("ADMIN_USER_ID"))
 DB_FILE = "music_bot.db"
 WEBHOOK_URL = os.getenv("WEBHOOK_URL")
-TENANT_ID = os.getenv("O365_TENANT_ID")
-CLIENT_ID = os.getenv("O365_CLIENT_ID")
-CLIENT_SECRET = os.getenv("O365_CLIENT_SECRET")
-TARGET_USER_ID = os.getenv("O365_USER_ID")
+# "proxy" streams files through this server; "redirect" sends clients to OneDrive's pre-authenticated URL
+DOWNLOAD_MODE = os.getenv("DOWNLOAD_MODE", "proxy")
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", str(1024 * 1024)))
+# "link" redirects album downloads to an anonymous OneDrive sharing link; "zip" streams the tracks as one ZIP
+ALBUM_DOWNLOAD_MODE = os.getenv("ALBUM_DOWNLOAD_MODE", "link")
+# ZIP mode: tracks fetched ahead of the one being sent, and chunks buffered per track
+ZIP_FILES_AHEAD = int(os.getenv("ZIP_FILES_AHEAD", "2"))
+ZIP_CHUNKS_AHEAD = int(os.getenv("ZIP_CHUNKS_AHEAD", "4"))
+ZIP_RESOLVE_WORKERS = 8
+# Seconds to reuse a file's pre-authenticated download URL (Graph keeps them valid ~1 hour)
+DOWNLOAD_URL_TTL = int(os.getenv("DOWNLOAD_URL_TTL", "900"))
+# Seconds to reuse an album's anonymous sharing link before creating a fresh one
+SHARING_LINK_TTL = int(os.getenv("SHARING_LINK_TTL", str(30 * 24 * 3600)))
+LINK_CACHE_SIZE = int(os.getenv("LINK_CACHE_SIZE", "2048"))
+# Seconds between checks for membership changes made by other workers
+MEMBER_CHECK_INTERVAL = float(os.getenv("MEMBER_CHECK_INTERVAL", "1"))
+# Seconds a generated download link stays valid
+DOWNLOAD_TOKEN_TTL = int(os.getenv("DOWNLOAD_TOKEN_TTL", "1800"))
+# Seconds after a song link's first use during which an interrupted download may resume
+DOWNLOAD_RESUME_WINDOW = int(os.getenv("DOWNLOAD_RESUME_WINDOW", "600"))
+# HMAC key for download links; must be the same on every worker. Derived from the bot token if unset.
+DOWNLOAD_TOKEN_SECRET = os.getenv("DOWNLOAD_TOKEN_SECRET")
+# Search results: buttons per page, most matches counted and ranked, and how long Next/Prev keep working
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "20"))
+SEARCH_COUNT_LIMIT = int(os.getenv("SEARCH_COUNT_LIMIT", "1000"))
+SEARCH_SESSION_TTL = int(os.getenv("SEARCH_SESSION_TTL", "3600"))
+# Seconds between checks for catalog changes to apply to the fuzzy (typo-tolerant) index
+FUZZY_RELOAD_INTERVAL = float(os.getenv("FUZZY_RELOAD_INTERVAL", "60"))
+# Webhook updates handled at the same time per worker (and Bot API connections to match)
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "32"))
+
+# --- Metrics (per worker process; scraped from /metrics) ---
+TOKEN_SECONDS = metrics.histogram("bot_access_token_seconds", "get_access_token time (cached or from AAD)")
+GRAPH_SECONDS = metrics.histogram("bot_graph_request_seconds", "Graph API calls made by the bot", ("call",))
+LINK_SECONDS = metrics.histogram("bot_link_lookup_seconds",
+                                 "get_download_link / get_sharing_link time, cache hits included", ("kind",))
+DOWNLOAD_BYTES = metrics.counter("bot_download_bytes_total", "Bytes streamed to clients", ("route",))
+DOWNLOAD_SECONDS = metrics.histogram("bot_download_seconds", "Time to stream one response body", ("route",))
+DOWNLOAD_RATE = metrics.histogram(
+    "bot_download_bytes_per_second", "Per-download streaming throughput", ("route",),
+    buckets=tuple(2 ** power * 1024 for power in range(6, 18))  # 64 KiB/s .. 128 MiB/s
+)
+WEBHOOK_UPDATES = metrics.counter("bot_webhook_updates_total", "Updates received from Telegram and queued")
 
 # --- Initialize ---
-app = Flask(__name__)
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
     level=logging.INFO
 )
 logger = logging.getLogger(__name__)
 
-# Initialize Application
-application = Application.builder().token(BOT_TOKEN).build()
+# Hot songs/albums resolve from these without any Graph call
+download_url_cache = TTLCache(maxsize=LINK_CACHE_SIZE, ttl=DOWNLOAD_URL_TTL)
+sharing_link_cache = TTLCache(maxsize=LINK_CACHE_SIZE, ttl=SHARING_LINK_TTL)
+members = MembershipCache(DB_FILE, check_interval=MEMBER_CHECK_INTERVAL)
+db = Database(DB_FILE)
+token_signer = TokenSigner(
+    DOWNLOAD_TOKEN_SECRET.encode() if DOWNLOAD_TOKEN_SECRET
+    else hmac.new(BOT_TOKEN.encode(), b"download-tokens", hashlib.sha256).digest(),
+    ttl=DOWNLOAD_TOKEN_TTL
+)
+replay_guard = ReplayGuard(db, resume_window=DOWNLOAD_RESUME_WINDOW)
+# Search terms behind Next/Prev buttons (callback_data is limited to 64 bytes); kept in
+# SQLite so a press served by another worker, or after a restart, still finds them
+search_sessions = TTLCache(maxsize=LINK_CACHE_SIZE, ttl=SEARCH_SESSION_TTL)
+# Built in the background once this worker handles updates;
+# searches with no exact match retry with its closest value
+fuzzy_catalog = FuzzyCatalog(DB_FILE, reload_interval=FUZZY_RELOAD_INTERVAL)
+
+# Search kinds: FTS table, content table or view, FTS column to match, whether the query is
+# normalized like that column, fuzzy fields to fall back on, button label expression,
+# download callback prefix, button icon, result header and no-result message
+SearchKind = namedtuple("SearchKind", "fts table column normalized fuzzy label download icon header empty")
+SEARCH_KINDS = {
+    "artist": SearchKind("songs_fts", "songs_search", "artist", False, ("artist",), "songs_search.title", "dl", "📥",
+                         "🎤 *Found {count} songs by artist '{term}':*", "🤔 No results for artist: *{term}*"),
+    "title": SearchKind("songs_fts", "songs_search", "title", False, ("title",), "songs_search.title || coalesce(' — ' || songs_search.artist, '')", "dl", "📥",
+                        "🎵 *Found {count} songs titled '{term}':*", "🤔 No songs found with title: *{term}*"),
+    # search_text is the indexer's normalized "title artist album" column; file_path adds folder and file names
+    "all": SearchKind("songs_fts", "songs_search", "{search_text file_path}", True, ("title", "artist", "album"), "songs_search.title || coalesce(' — ' || songs_search.artist, '')", "dl", "📥",
+                      "🔎 *Found {count} songs for '{term}':*", "🤔 No results for: *{term}*"),
+    "album": SearchKind("albums_fts", "albums", "album_name", False, ("album",), "albums.album_name", "albumdl", "🔗",
+                        "💿 *Found {count} album folders for '{term}':*", "🤔 No album folders found for: *{term}*"),
+}
+# Keyset cursor: the bm25 score and id of the row a page starts or ends at
+CURSOR = struct.Struct(">dI")
+# Value of telegram.constants.ParseMode.MARKDOWN_V2
+MARKDOWN_V2 = "MarkdownV2"
 
 # --- Helper Functions ---
 def escape_markdown_v2(text: str) -> str:
@@ -40,80 +137,231 @@ def escape_markdown_v2(text: str) -> str:
     return text
 
 def get_access_token():
-    authority = f"https://login.microsoftonline.com/{TENANT_ID}"
-    scope = ["https://graph.microsoft.com/.default"]
-    msal_app = msal.ConfidentialClientApplication(
-        client_id=CLIENT_ID, authority=authority, client_credential=CLIENT_SECRET
-    )
-    result = msal_app.acquire_token_for_client(scopes=scope)
-    if "access_token" in result:
-        return result["access_token"]
-    logger.error(f"Failed to acquire token: {result.get('error_description')}")
-    return None
+    # Cached process-wide; only hits AAD when the token is close to expiry.
+    with TOKEN_SECONDS.time():
+        return token_provider.get_token()
 
-def get_download_link(file_id: str):
+def measure_stream(chunks, route: str):
+    """Pass chunks through, recording bytes sent and throughput once the body is done."""
+    start = time.perf_counter()
+    sent = 0
+    try:
+        for chunk in chunks:
+            sent += len(chunk)
+            yield chunk
+    finally:
+        elapsed = time.perf_counter() - start
+        DOWNLOAD_BYTES.inc(sent, route=route)
+        DOWNLOAD_SECONDS.observe(elapsed, route=route)
+        if sent and elapsed > 0:
+            DOWNLOAD_RATE.observe(sent / elapsed, route=route)
+
+def fetch_download_link(file_id: str):
     token = get_access_token()
     if not token:
-        return None, None
-    endpoint = f"https://graph.microsoft.com/v1.0/users/{TARGET_USER_ID}/drive/items/{file_id}"
-    headers = {"Authorization": f"Bearer {token}"}
-    response = requests.get(endpoint, headers=headers)
+        return None
+    with GRAPH_SECONDS.time(call="get_item"):
+        response = graph_client.get_item(file_id)
     if response.status_code == 200:
         data = response.json()
-        return data.get("@microsoft.graph.downloadUrl"), data.get("name")
+        if data.get("@microsoft.graph.downloadUrl"):
+            return data.get("@microsoft.graph.downloadUrl"), data.get("name"), data.get("size")
     logger.error(f"Graph API Error getting item: {response.text}")
-    return None, None
+    return None
 
-def get_sharing_link(folder_id: str):
+def get_download_link(file_id: str):
+    # Pre-authenticated URLs stay valid for about an hour; reuse them well inside that.
+    with LINK_SECONDS.time(kind="download_url"):
+        return download_url_cache.get_or_load(file_id, lambda: fetch_download_link(file_id)) or (None, None, None)
+
+def create_sharing_link(folder_id: str):
     token = get_access_token()
     if not token:
         return None
-    endpoint = f"https://graph.microsoft.com/v1.0/users/{TARGET_USER_ID}/drive/items/{folder_id}/createLink"
-    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-    payload = {"type": "view", "scope": "anonymous"}
-    response = requests.post(endpoint, headers=headers, json=payload)
+    with GRAPH_SECONDS.time(call="create_link"):
+        response = graph_client.create_view_link(folder_id)
     if response.status_code in (200, 201):
-        return response.json().get("link", {}).get("webUrl")
+        web_url = response.json().get("link", {}).get("webUrl")
+        if web_url:
+            db.execute(
+                "INSERT OR REPLACE INTO sharing_links (folder_id, web_url, created_at) VALUES (?, ?, CURRENT_TIMESTAMP)",
+                (folder_id, web_url)
+            )
+        return web_url
     logger.error(f"Graph API Error creating share link: {response.text}")
     return None
 
-def is_member(user_id: int) -> bool:
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT expiry_date, status FROM members WHERE telegram_id = ?", (user_id,))
-    result = cursor.fetchone()
-    conn.close()
+def load_sharing_link(folder_id: str):
+    """Sharing link from memory, then SQLite (survives restarts), then Graph createLink."""
+    result = db.fetchone(
+        "SELECT web_url FROM sharing_links WHERE folder_id = ? AND created_at > datetime('now', ?)",
+        (folder_id, f"-{SHARING_LINK_TTL} seconds")
+    )
     if result:
-        expiry_date_str, status = result
-        try:
-            expiry_date = datetime.fromisoformat(expiry_date_str)
-        except ValueError:
-            expiry_date = datetime.strptime(expiry_date_str, "%Y-%m-%d %H:%M:%S.%f")
-        if status == "active" and expiry_date > datetime.now():
-            return True
-    return False
+        return result[0]
+    return create_sharing_link(folder_id)
+
+def get_sharing_link(folder_id: str):
+    with LINK_SECONDS.time(kind="sharing_link"):
+        return sharing_link_cache.get_or_load(folder_id, lambda: load_sharing_link(folder_id))
+
+def is_member(user_id: int) -> bool:
+    # Memory lookup; the cache reloads when any worker changes the members table.
+    return members.is_member(user_id)
 
 def update_user_status(user_id: int, status: str) -> bool:
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT id FROM members WHERE telegram_id = ?", (user_id,))
-    result = cursor.fetchone()
-    if result:
-        cursor.execute("UPDATE members SET status = ? WHERE telegram_id = ?", (status, user_id))
-        conn.commit()
-        conn.close()
+    if db.execute("UPDATE members SET status = ? WHERE telegram_id = ?", (status, user_id)):
+        members.invalidate()
         return True
-    conn.close()
     return False
 
-def search_songs(criteria: str, search_term: str) -> list:
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    query = f"SELECT id, artist, album, title FROM songs WHERE {criteria} LIKE ?"
-    cursor.execute(query, (f"%{search_term}%",))
-    results = cursor.fetchall()
-    conn.close()
-    return results
+def build_match_query(search_term: str, column: str = None) -> str:
+    """Turn free text into an FTS5 prefix query, e.g. 'beatles abbey' -> '"beatles"* "abbey"*'."""
+    phrases = ['"' + word.replace('"', '""') + '"*' for word in search_term.split()
+               if any(char.isalnum() for char in word)]
+    if not phrases:
+        return ""
+    query = " ".join(phrases)
+    return f"{column} : ({query})" if column else query
+
+def kind_match_query(spec: SearchKind, search_term: str) -> str:
+    return build_match_query(normalize_text(search_term) if spec.normalized else search_term, spec.column)
+
+def encode_cursor(row) -> str:
+    row_id, label, score = row
+    return base64.urlsafe_b64encode(CURSOR.pack(score, row_id)).decode("ascii")
+
+def decode_cursor(text: str) -> tuple:
+    return CURSOR.unpack(base64.urlsafe_b64decode(text))
+
+def search_page(kind: str, search_term: str, cursor: tuple = None, backwards: bool = False):
+    """One page of (id, label, score) rows in bm25 order, after (or before) the keyset cursor.
+
+    Only SEARCH_PAGE_SIZE + 1 rows are ever fetched; the extra row tells whether
+    another page follows in that direction. bm25 has to score every candidate to
+    order them, so only the first SEARCH_COUNT_LIMIT matches (in index order) are
+    ranked: a page costs the same for a term matching a thousand songs or a
+    hundred thousand, and the results header already stops counting there.
+    """
+    spec = SEARCH_KINDS[kind]
+    match_query = kind_match_query(spec, search_term)
+    if not match_query:
+        return [], False
+    # Rank and cut the page before joining, so only the page's rows are joined.
+    order = "DESC" if backwards else "ASC"
+    keyset = f" WHERE (score, id) {'<' if backwards else '>'} (?, ?)" if cursor else ""
+    rows = db.fetchall(
+        f"SELECT m.id, {spec.label}, m.score FROM ("
+        f"SELECT id, score FROM ("
+        f"SELECT rowid AS id, bm25({spec.fts}) AS score FROM {spec.fts} WHERE {spec.fts} MATCH ? LIMIT ?"
+        f"){keyset} ORDER BY score {order}, id {order} LIMIT ?"
+        f") AS m JOIN {spec.table} ON {spec.table}.id = m.id ORDER BY m.score {order}, m.id {order}",
+        [match_query, SEARCH_COUNT_LIMIT, *(cursor or ()), SEARCH_PAGE_SIZE + 1]
+    )
+    has_more = len(rows) > SEARCH_PAGE_SIZE
+    rows = rows[:SEARCH_PAGE_SIZE]
+    if backwards:
+        rows.reverse()
+    return rows, has_more
+
+def count_matches(kind: str, search_term: str) -> str:
+    """Match count for the results header, e.g. '42' or '1000+'; stops counting at SEARCH_COUNT_LIMIT."""
+    spec = SEARCH_KINDS[kind]
+    count = db.fetchone(
+        f"SELECT count(*) FROM (SELECT 1 FROM {spec.fts} WHERE {spec.fts} MATCH ? LIMIT ?)",
+        (kind_match_query(spec, search_term), SEARCH_COUNT_LIMIT + 1)
+    )[0]
+    return f"{SEARCH_COUNT_LIMIT}+" if count > SEARCH_COUNT_LIMIT else str(count)
+
+def build_results_page(session_id: str, kind: str, search_term: str, count_label: str, rows: list,
+                       page: int, has_prev: bool, has_next: bool):
+    """Header text and keyboard for one page; Next/Prev carry the session id, page number and cursor."""
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+    spec = SEARCH_KINDS[kind]
+    text = spec.header.format(count=escape_markdown_v2(count_label), term=escape_markdown_v2(search_term))
+    if has_prev or has_next:
+        text += f"\n_page {page}_"
+    keyboard = [[InlineKeyboardButton(f"{spec.icon} {label}", callback_data=f"{spec.download}_{row_id}")]
+                for row_id, label, score in rows]
+    navigation = []
+    if has_prev:
+        navigation.append(InlineKeyboardButton(
+            "◀️ Prev", callback_data=f"pg_{session_id}_{page - 1}_p_{encode_cursor(rows[0])}"))
+    if has_next:
+        navigation.append(InlineKeyboardButton(
+            "Next ▶️", callback_data=f"pg_{session_id}_{page + 1}_n_{encode_cursor(rows[-1])}"))
+    if navigation:
+        keyboard.append(navigation)
+    return text, InlineKeyboardMarkup(keyboard)
+
+def search_or_suggest(kind: str, search_term: str):
+    """First page for ``search_term`` as (rows, has_next, term searched).
+
+    When nothing matches as typed, the closest catalog value (typos, spelling
+    variants) is searched instead and returned as the term searched.
+    """
+    rows, has_next = search_page(kind, search_term)
+    if not rows:
+        suggestion = fuzzy_catalog.suggest(SEARCH_KINDS[kind].fuzzy, search_term)
+        if suggestion:
+            suggested_rows, suggested_next = search_page(kind, suggestion)
+            if suggested_rows:
+                return suggested_rows, suggested_next, suggestion
+    return rows, has_next, search_term
+
+def save_search_session(session_id: str, kind: str, search_term: str, count_label: str):
+    expires_at = int(time.time()) + SEARCH_SESSION_TTL
+    db.execute("DELETE FROM search_sessions WHERE expires_at <= ?", (int(time.time()),))
+    db.execute("INSERT OR REPLACE INTO search_sessions (session_id, kind, search_term, count_label, expires_at) "
+               "VALUES (?, ?, ?, ?, ?)", (session_id, kind, search_term, count_label, expires_at))
+    search_sessions.set(session_id, (kind, search_term, count_label))
+
+def load_search_session(session_id: str):
+    """(kind, search term, count label) behind a Next/Prev button: from memory, then SQLite."""
+    session = search_sessions.get(session_id)
+    if session is None:
+        row = db.fetchone("SELECT kind, search_term, count_label, expires_at FROM search_sessions "
+                          "WHERE session_id = ? AND expires_at > ?", (session_id, int(time.time())))
+        if row:
+            session = row[:3]
+            search_sessions.set(session_id, session, row[3] - time.time())
+    return session
+
+async def send_search_results(update: Update, kind: str, search_term: str):
+    rows, has_next, searched = await db.run_async(search_or_suggest, kind, search_term)
+    notice = ""
+    if searched != search_term:
+        notice = f"✏️ No exact match for *{escape_markdown_v2(search_term)}*\n"
+        search_term = searched
+    if not rows:
+        await update.message.reply_text(
+            SEARCH_KINDS[kind].empty.format(term=escape_markdown_v2(search_term)),
+            parse_mode=MARKDOWN_V2
+        )
+        return
+    # A single page is its own count; otherwise count (up to a cap) once, not per page.
+    count_label = await db.run_async(count_matches, kind, search_term) if has_next else str(len(rows))
+    session_id = secrets.token_hex(4)
+    await db.run_async(save_search_session, session_id, kind, search_term, count_label)
+    text, reply_markup = build_results_page(session_id, kind, search_term, count_label, rows, 1, False, has_next)
+    await update.message.reply_text(notice + text, parse_mode=MARKDOWN_V2, reply_markup=reply_markup)
+
+async def show_search_page(query, callback_data: str):
+    _, session_id, page, direction, cursor = callback_data.split("_", 4)
+    session = await db.run_async(load_search_session, session_id)
+    backwards = direction == "p"
+    rows = None
+    if session:
+        kind, search_term, count_label = session
+        rows, has_more = await db.run_async(search_page, kind, search_term, decode_cursor(cursor), backwards)
+    if not rows:
+        await query.edit_message_text(text="⌛ This search has expired. Please search again.")
+        return
+    has_prev, has_next = (has_more, True) if backwards else (True, has_more)
+    text, reply_markup = build_results_page(session_id, kind, search_term, count_label, rows, int(page),
+                                            has_prev, has_next)
+    await query.edit_message_text(text=text, parse_mode=MARKDOWN_V2, reply_markup=reply_markup)
 
 # --- Command Handlers ---
 async def start(update: Update, context):
@@ -122,9 +370,11 @@ async def start(update: Update, context):
         await update.message.reply_text(
             f"👋 Welcome back, {user.first_name}!\n\n"
             "✨ You can search using:\n"
+            "`/s <any words>`\n"
+            "`/s_title <song_title>`\n"
             "`/s_album <album_name>`\n"
             "`/s_artist <artist_name>`",
-            parse_mode=ParseMode.MARKDOWN_V2
+            parse_mode=MARKDOWN_V2
         )
     else:
         await update.message.reply_text(
@@ -141,7 +391,7 @@ async def join_request(update: Update, context):
     if user.username:
         user_info += f"**Username:** @{user.username}\n"
     user_info += f"**User ID:** `{user.id}`\n\nTo approve:\n`/add_member {user.id} 30`"
-    await context.bot.send_message(chat_id=ADMIN_USER_ID, text=user_info, parse_mode=ParseMode.MARKDOWN_V2)
+    await context.bot.send_message(chat_id=ADMIN_USER_ID, text=user_info, parse_mode=MARKDOWN_V2)
     await update.message.reply_text("✅ Your request has been sent to the admin for approval.")
 
 async def add_member(update: Update, context):
@@ -154,14 +404,11 @@ async def add_member(update: Update, context):
     user_id = int(context.args[0])
     days = int(context.args[1])
     expiry_date = datetime.now() + timedelta(days=days)
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute(
+    await db.execute_async(
         "INSERT OR REPLACE INTO members (telegram_id, expiry_date, status) VALUES (?, ?, ?)",
         (user_id, expiry_date.isoformat(), "active")
     )
-    conn.commit()
-    conn.close()
+    members.invalidate()
     await update.message.reply_text(f"✅ User {user_id} added/updated as active member until {expiry_date}")
 
 async def ban_user(update: Update, context):
@@ -172,7 +419,7 @@ async def ban_user(update: Update, context):
         await update.message.reply_text("Usage: /ban <user_id>")
         return
     user_id = int(context.args[0])
-    if update_user_status(user_id, "banned"):
+    if await db.run_async(update_user_status, user_id, "banned"):
         await update.message.reply_text(f"🚫 User {user_id} banned.")
     else:
         await update.message.reply_text("❌ User not found.")
@@ -185,7 +432,7 @@ async def unban_user(update: Update, context):
         await update.message.reply_text("Usage: /unban <user_id>")
         return
     user_id = int(context.args[0])
-    if update_user_status(user_id, "active"):
+    if await db.run_async(update_user_status, user_id, "active"):
         await update.message.reply_text(f"✅ User {user_id} unbanned.")
     else:
         await update.message.reply_text("❌ User not found.")
@@ -197,23 +444,7 @@ async def search_album(update: Update, context):
     if not context.args:
         await update.message.reply_text("✍️ Usage: `/s_album <album_name>`")
         return
-    search_term = " ".join(context.args)
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, album_name, artist_name FROM albums WHERE album_name LIKE ?", (f"%{search_term}%",))
-    results = cursor.fetchall()
-    conn.close()
-    if not results:
-        await update.message.reply_text(f"🤔 No album folders found for: *{search_term}*", parse_mode=ParseMode.MARKDOWN_V2)
-    else:
-        keyboard = [[InlineKeyboardButton(f"🔗 {album_name}", callback_data=f"albumdl_{album_id}")]
-                    for album_id, album_name, artist_name in results[:20]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await update.message.reply_text(
-            f"💿 *Found {len(results)} album folders for '{search_term}':*",
-            parse_mode=ParseMode.MARKDOWN_V2,
-            reply_markup=reply_markup
-        )
+    await send_search_results(update, "album", " ".join(context.args))
 
 async def search_artist(update: Update, context):
     user = update.effective_user
@@ -222,19 +453,25 @@ async def search_artist(update: Update, context):
     if not context.args:
         await update.message.reply_text("✍️ Usage: `/s_artist <artist_name>`")
         return
-    search_term = " ".join(context.args)
-    results = search_songs("artist", search_term)
-    if not results:
-        await update.message.reply_text(f"🤔 No results for artist: *{search_term}*", parse_mode=ParseMode.MARKDOWN_V2)
-    else:
-        keyboard = [[InlineKeyboardButton(f"📥 {title}", callback_data=f"dl_{song_id}")]
-                    for song_id, artist, album, title in results[:20]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await update.message.reply_text(
-            f"🎤 *Found {len(results)} songs by artist '{search_term}':*",
-            parse_mode=ParseMode.MARKDOWN_V2,
-            reply_markup=reply_markup
-        )
+    await send_search_results(update, "artist", " ".join(context.args))
+
+async def search_title(update: Update, context):
+    user = update.effective_user
+    if not is_member(user.id):
+        return
+    if not context.args:
+        await update.message.reply_text("✍️ Usage: `/s_title <song_title>`")
+        return
+    await send_search_results(update, "title", " ".join(context.args))
+
+async def search_all(update: Update, context):
+    user = update.effective_user
+    if not is_member(user.id):
+        return
+    if not context.args:
+        await update.message.reply_text("✍️ Usage: `/s <title, artist or album words>`")
+        return
+    await send_search_results(update, "all", " ".join(context.args))
 
 async def button_handler(update: Update, context):
     query = update.callback_query
@@ -244,128 +481,201 @@ async def button_handler(update: Update, context):
         await query.edit_message_text(text="🚫 Membership expired.")
         return
     callback_data = query.data
-    token = str(uuid.uuid4())
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    if callback_data.startswith("dl_"):
+    if callback_data.startswith("pg_"):
+        await show_search_page(query, callback_data)
+    elif callback_data.startswith("dl_"):
         song_id = int(callback_data.split("_")[1])
-        cursor.execute("INSERT INTO download_tokens (token, song_id) VALUES (?, ?)", (token, song_id))
-        conn.commit()
-        conn.close()
+        token = token_signer.issue(KIND_SONG, song_id, user_id)
         download_url = f"{WEBHOOK_URL}/download/{token}"
         escaped_url = escape_markdown_v2(download_url)
         logger.info(f"Generated download_url: {download_url}")
-        message_text = f"✅ Secure link generated\\!\n\n👉 [Click to download]({escaped_url})\n\n\\_Link expires in 30 minutes and is one-time use\\._"
+        message_text = f"✅ Secure link generated\\!\n\n👉 [Click to download]({escaped_url})\n\n\\_Link expires in {DOWNLOAD_TOKEN_TTL // 60} minutes and is one-time use\\._"
         logger.info(f"Message text: {message_text}")
         await query.edit_message_text(
             text=message_text,
-            parse_mode=ParseMode.MARKDOWN_V2,
+            parse_mode=MARKDOWN_V2,
             disable_web_page_preview=True
         )
     elif callback_data.startswith("albumdl_"):
         album_id = int(callback_data.split("_")[1])
-        cursor.execute("INSERT INTO download_tokens (token, album_id) VALUES (?, ?)", (token, album_id))
-        conn.commit()
-        conn.close()
+        token = token_signer.issue(KIND_ALBUM, album_id, user_id)
         redirect_url = f"{WEBHOOK_URL}/download_album/{token}"
         escaped_url = escape_markdown_v2(redirect_url)
         logger.info(f"Generated redirect_url: {redirect_url}")
-        message_text = f"✅ Secure album link generated\\!\n\n👉 [{escape_markdown_v2('Click to download')}]({escaped_url})\n\n\\_Link is one-time use\\._"
+        message_text = f"✅ Secure album link generated\\!\n\n👉 [{escape_markdown_v2('Click to download')}]({escaped_url})\n\n\\_Link expires in {DOWNLOAD_TOKEN_TTL // 60} minutes and is one-time use\\._"
         logger.info(f"Message text: {message_text}")
         await query.edit_message_text(
             text=message_text,
-            parse_mode=ParseMode.MARKDOWN_V2,
+            parse_mode=MARKDOWN_V2,
             disable_web_page_preview=True
         )
 
 # --- Flask Routes ---
-@app.route(f"/{BOT_TOKEN}", methods=["POST"])
-async def webhook_handler():
-    update = Update.de_json(request.get_json(force=True), application.bot)
-    await application.process_update(update)
+def webhook_handler():
+    # Acknowledged as soon as it is queued, so a slow handler never makes Telegram retry the update.
+    update_processor.submit(request.get_json(force=True))
+    WEBHOOK_UPDATES.inc()
     return "ok", 200
 
-@app.route("/download/<token>", methods=["GET"])
+def is_resume(range_header: str) -> bool:
+    """True for one byte range that starts past the first byte, e.g. 'bytes=1048576-'."""
+    match = re.fullmatch(r"bytes=(\d+)-(\d*)", range_header.strip()) if range_header else None
+    return bool(match) and int(match.group(1)) > 0
+
 def download_proxy(token):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT song_id, created_at FROM download_tokens WHERE token = ?", (token,))
-    result = cursor.fetchone()
-    if not result:
-        conn.close()
+    # Signature and expiry are checked in memory; links of banned members stop working.
+    download_token = token_signer.verify(token)
+    if not download_token or download_token.kind != KIND_SONG or not is_member(download_token.user_id):
         return "Invalid or expired link.", 404
-    song_id, created_at = result
-    created_at = datetime.fromisoformat(created_at)
-    if datetime.now() - created_at > timedelta(minutes=30):
-        conn.close()
-        return "Link expired.", 410
-    # delete token immediately (one-time use)
-    cursor.execute("DELETE FROM download_tokens WHERE token = ?", (token,))
-    conn.commit()
-    cursor.execute("SELECT file_id FROM songs WHERE id = ?", (song_id,))
-    song_result = cursor.fetchone()
-    conn.close()
+    # One-time use: the first request spends the token whatever it asks for (a HEAD probe
+    # or "Range: bytes=0-" included). After that, only GETs resuming part-way through the
+    # file are served, and only for DOWNLOAD_RESUME_WINDOW seconds.
+    resuming = request.method == "GET" and is_resume(request.headers.get("Range"))
+    if not replay_guard.use(download_token, resume=resuming):
+        return "Invalid or expired link.", 404
+    song_result = db.fetchone("SELECT file_id FROM songs WHERE id = ?", (download_token.item_id,))
     if not song_result:
         return "Song not found.", 404
     file_id = song_result[0]
-    download_url, file_name = get_download_link(file_id)
+    download_url, file_name, _ = get_download_link(file_id)
     if not download_url:
         return "Could not fetch download link.", 500
+    if DOWNLOAD_MODE == "redirect":
+        # The client fetches straight from OneDrive; the URL is pre-authenticated and short-lived.
+        return redirect(download_url, code=302)
+
+    upstream_headers = {name: request.headers[name] for name in ("Range", "If-Range") if name in request.headers}
+    # Byte ranges must refer to the file itself, not a compressed encoding of it.
+    upstream_headers["Accept-Encoding"] = "identity"
+    # HEAD is answered from a GET's headers; the body is never read.
+    upstream = graph_client.session.get(download_url, headers=upstream_headers, stream=True)
+    if upstream.status_code not in (200, 206, 416):
+        logger.error(f"Upstream download failed with {upstream.status_code} for {file_id}")
+        upstream.close()
+        return "Could not fetch file.", 502
+    # Header values are latin-1: an ASCII fallback name, and the real one (e.g. Burmese) in filename*.
+    fallback_name = file_name.encode("ascii", "replace").decode("ascii").replace('"', "'")
+    headers = {"Content-Disposition": f"attachment; filename=\"{fallback_name}\"; filename*=UTF-8''{quote(file_name)}",
+               "Accept-Ranges": "bytes"}
+    for name in ("Content-Length", "Content-Range", "Content-Type", "ETag", "Last-Modified"):
+        if name in upstream.headers:
+            headers[name] = upstream.headers[name]
     def generate():
-        with requests.get(download_url, stream=True) as r:
-            for chunk in r.iter_content(chunk_size=8192):
-                if chunk:
-                    yield chunk
-    return Response(stream_with_context(generate()), headers={"Content-Disposition": f"attachment; filename={file_name}"})
+        # Only one chunk per download is held in memory at a time.
+        for chunk in upstream.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            if chunk:
+                yield chunk
+    response = Response(stream_with_context(measure_stream(generate(), "song")), status=upstream.status_code, headers=headers,
+                        direct_passthrough=True)
+    response.call_on_close(upstream.close)
+    return response
 
-@app.route("/download_album/<token>", methods=["GET"])
 def download_album_proxy(token):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT album_id FROM download_tokens WHERE token = ?", (token,))
-    result = cursor.fetchone()
-    if not result:
-        conn.close()
+    download_token = token_signer.verify(token)
+    if not download_token or download_token.kind != KIND_ALBUM or not is_member(download_token.user_id):
+        return "Link invalid or used.", 404
+    # one-time use: only the first request spends the token
+    if not replay_guard.use(download_token):
         return "Link invalid or used.", 404
-    # delete token immediately (one-time use)
-    cursor.execute("DELETE FROM download_tokens WHERE token = ?", (token,))
-    conn.commit()
-    album_id = result[0]
-    cursor.execute("SELECT folder_id FROM albums WHERE id = ?", (album_id,))
-    album_result = cursor.fetchone()
-    conn.close()
+    album_result = db.fetchone(
+        "SELECT folders.item_id, albums.album_name, folders.path FROM albums "
+        "JOIN folders ON folders.id = albums.folder_id WHERE albums.id = ?", (download_token.item_id,)
+    )
     if not album_result:
         return "Album not found.", 404
+    if ALBUM_DOWNLOAD_MODE == "zip":
+        return stream_album_zip(album_result[1], album_result[2])
     real_sharing_link = get_sharing_link(album_result[0])
     if not real_sharing_link:
         return "Could not create a sharing link.", 500
     return redirect(real_sharing_link, code=302)
 
-@app.route("/")
+def open_upstream(download_url: str):
+    def chunks():
+        with graph_client.session.get(download_url, headers={"Accept-Encoding": "identity"}, stream=True) as upstream:
+            upstream.raise_for_status()
+            for chunk in upstream.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                if chunk:
+                    yield chunk
+    return chunks
+
+def stream_album_zip(album_name: str, folder_path: str):
+    """The album folder's tracks as one store-only ZIP, streamed while the tracks download."""
+    # CROSS JOIN keeps folders as the outer loop: the folder tree is found first,
+    # then its songs through the songs.folder_id index.
+    tracks = db.fetchall(
+        "SELECT songs.file_id, folders.path || '/' || songs.file_name AS file_path FROM folders "
+        "CROSS JOIN songs ON songs.folder_id = folders.id "
+        "WHERE folders.path = ? OR substr(folders.path, 1, ?) = ? ORDER BY file_path",
+        (folder_path, len(folder_path) + 1, folder_path + "/")
+    )
+    if not tracks:
+        return "Album not found.", 404
+    # Sizes (for Content-Length) and download URLs, resolved concurrently and cached per track.
+    with ThreadPoolExecutor(max_workers=ZIP_RESOLVE_WORKERS) as pool:
+        links = list(pool.map(get_download_link, [file_id for file_id, _ in tracks]))
+    if any(download_url is None or size is None for download_url, _, size in links):
+        return "Could not fetch download link.", 500
+    # Entries keep the album folder and any disc subfolders, e.g. "Album/CD1/01.flac".
+    parent = posixpath.dirname(folder_path)
+    archive = ZipStream([(posixpath.relpath(file_path, parent), size)
+                         for (_, file_path), (_, _, size) in zip(tracks, links)])
+    contents = read_ahead([open_upstream(download_url) for download_url, _, _ in links],
+                          files_ahead=ZIP_FILES_AHEAD, chunks_ahead=ZIP_CHUNKS_AHEAD)
+    headers = {
+        "Content-Disposition": f"attachment; filename=album.zip; filename*=UTF-8''{quote(album_name + '.zip')}",
+        "Content-Length": str(archive.content_length()),
+        "Content-Type": "application/zip",
+    }
+    body = measure_stream(archive.generate(contents), "album_zip")
+    response = Response(stream_with_context(body), headers=headers, direct_passthrough=True)
+    response.call_on_close(contents.close)
+    return response
+
 def index():
     return "Bot is running!", 200
 
+def metrics_endpoint():
+    return Response(metrics.registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
 # --- Handlers ---
-application.add_handler(CommandHandler("start", start))
-application.add_handler(CommandHandler("join", join_request))
-application.add_handler(CommandHandler("add_member", add_member))
-application.add_handler(CommandHandler("ban", ban_user))
-application.add_handler(CommandHandler("unban", unban_user))
-application.add_handler(CommandHandler("s_album", search_album))
-application.add_handler(CommandHandler("s_artist", search_artist))
-application.add_handler(CallbackQueryHandler(button_handler))
-
-# Set webhook and initialize application
-WEBHOOK_SETUP_URL = f"https://api.telegram.org/bot{BOT_TOKEN}/setWebhook?url={WEBHOOK_URL}/{BOT_TOKEN}"
-logger.info(f"==> SET WEBHOOK (if not set): {WEBHOOK_SETUP_URL}")
+def build_application():
+    from telegram.ext import Application, CommandHandler, CallbackQueryHandler
 
-# Initialize and start the application
-async def initialize_application():
-    await application.initialize()
-    await application.start()
-    await application.bot.set_webhook(url=f"{WEBHOOK_URL}/{BOT_TOKEN}")
+    application = (Application.builder().token(BOT_TOKEN).base_url(TELEGRAM_API_URL)
+                   .concurrent_updates(UPDATE_CONCURRENCY).connection_pool_size(UPDATE_CONCURRENCY).build())
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("join", join_request))
+    application.add_handler(CommandHandler("add_member", add_member))
+    application.add_handler(CommandHandler("ban", ban_user))
+    application.add_handler(CommandHandler("unban", unban_user))
+    application.add_handler(CommandHandler("s_album", search_album))
+    application.add_handler(CommandHandler("s_artist", search_artist))
+    application.add_handler(CommandHandler("s_title", search_title))
+    application.add_handler(CommandHandler("s", search_all))
+    application.add_handler(CallbackQueryHandler(button_handler))
+    return application
+
+# One Application per worker process, started by the first update it receives
+update_processor = UpdateProcessor(build_application, on_start=fuzzy_catalog.start)
+
+def create_app():
+    """The Flask app gunicorn serves; cheap to create, as nothing Telegram-related is loaded yet."""
+    flask_app = Flask(__name__)
+    flask_app.add_url_rule(f"/{BOT_TOKEN}", view_func=webhook_handler, methods=["POST"])
+    flask_app.add_url_rule("/download/<token>", view_func=download_proxy, methods=["GET"])
+    flask_app.add_url_rule("/download_album/<token>", view_func=download_album_proxy, methods=["GET"])
+    flask_app.add_url_rule("/", view_func=index)
+    flask_app.add_url_rule("/metrics", view_func=metrics_endpoint)
+    return flask_app
+
+# Kept for "gunicorn bot:app"
+app = create_app()
+
+# Set webhook
+WEBHOOK_SETUP_URL = f"{TELEGRAM_API_URL}{BOT_TOKEN}/setWebhook?url={WEBHOOK_URL}/{BOT_TOKEN}"
+logger.info(f"==> SET WEBHOOK (if not set): {WEBHOOK_SETUP_URL}")
 
 if __name__ == "__main__":
-    import asyncio
-    asyncio.run(initialize_application())
+    update_processor.run(lambda application: application.bot.set_webhook(url=f"{WEBHOOK_URL}/{BOT_TOKEN}"))
     app.run(host="0.0.0.0", port=8000)  # For local testing; in production, use gunicorn
@@ -0,0 +1,87 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Thread-safe bounded LRU cache whose entries expire after ``ttl`` seconds.
+
+    ``get_or_load`` collapses concurrent misses for the same key into a single
+    call of ``loader`` (single-flight); the other callers wait for and share
+    its result. A loader returning None is treated as a failure and not cached.
+    """
+
+    def __init__(self, maxsize=1024, ttl=600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def get(self, key):
+        with self._lock:
+            return self._get(key)
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._set(key, value, ttl)
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[1] if entry else None
+
+    def __len__(self):
+        return len(self._data)
+
+    def get_or_load(self, key, loader, ttl=None):
+        with self._lock:
+            value = self._get(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            self.misses += 1
+            waiter = self._inflight.get(key)
+            if waiter is None:
+                waiter = self._inflight[key] = _Flight()
+                leader = True
+            else:
+                leader = False
+        if not leader:
+            waiter.done.wait()
+            return waiter.value
+        try:
+            waiter.value = loader()
+            if waiter.value is not None:
+                self.set(key, waiter.value, ttl)
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            waiter.done.set()
+        return waiter.value
+
+    # --- internals (caller holds the lock) ---
+    def _get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def _set(self, key, value, ttl):
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
@@ -1,18 +1,90 @@
 import sqlite3
+import posixpath
+from normalize import build_search_text
 
 conn = sqlite3.connect('music_bot.db')
 cursor = conn.cursor()
 
-# Songs table to store individual tracks
+def table_columns(table):
+    return {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+
+def parent_path(path):
+    # Paths are "" for the drive root and "/Music/Album" below it, as the indexer builds them.
+    return path.rsplit('/', 1)[0]
+
+# Catalogs from before the normalized layout kept artist, album and the full
+# file path as text on every song. Their tables are set aside here and copied
+# into the new ones below, keeping song and album ids (and so download links).
+legacy = 'file_path' in table_columns('songs')
+if legacy:
+    print("Migrating the catalog to the normalized layout...")
+    cursor.executescript('''
+    DROP TRIGGER IF EXISTS songs_fts_insert;
+    DROP TRIGGER IF EXISTS songs_fts_delete;
+    DROP TRIGGER IF EXISTS songs_fts_update;
+    DROP TRIGGER IF EXISTS albums_fts_insert;
+    DROP TRIGGER IF EXISTS albums_fts_delete;
+    DROP TRIGGER IF EXISTS albums_fts_update;
+    DROP TABLE IF EXISTS songs_fts;
+    DROP TABLE IF EXISTS albums_fts;
+    DROP INDEX IF EXISTS idx_songs_artist;
+    DROP INDEX IF EXISTS idx_songs_album;
+    ALTER TABLE songs RENAME TO legacy_songs;
+    ''')
+    for table in ('albums', 'folders'):
+        if table_columns(table):
+            cursor.execute(f"ALTER TABLE {table} RENAME TO legacy_{table}")
+
+# Folders, each stored once; songs and albums refer to them by id and paths
+# are built from them. item_id is the OneDrive id (NULL only for folders
+# recovered from paths by the migration); scanned is the full scan checkpoint.
+cursor.execute('''
+CREATE TABLE IF NOT EXISTS folders (
+    id INTEGER PRIMARY KEY,
+    item_id TEXT UNIQUE,
+    parent_id INTEGER,
+    name TEXT,
+    path TEXT NOT NULL,
+    scanned INTEGER NOT NULL DEFAULT 0
+)
+''')
+
+# Artist names, stored once
+cursor.execute('''
+CREATE TABLE IF NOT EXISTS artists (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+)
+''')
+
+# Albums table: one row per album found in a folder (an album folder usually holds one)
+cursor.execute('''
+CREATE TABLE IF NOT EXISTS albums (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    album_name TEXT NOT NULL,
+    artist_id INTEGER REFERENCES artists (id),
+    folder_id INTEGER NOT NULL REFERENCES folders (id),
+    UNIQUE (folder_id, album_name)
+)
+''')
+
+# Songs table to store individual tracks. One row per OneDrive file
+# (file_id), so re-runs upsert instead of duplicating songs. duration
+# (seconds), bitrate (bits/s) and size (bytes) come from the same tag read.
 cursor.execute('''
 CREATE TABLE IF NOT EXISTS songs (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
-    file_id TEXT NOT NULL,
+    file_id TEXT NOT NULL UNIQUE,
+    folder_id INTEGER NOT NULL REFERENCES folders (id),
     file_name TEXT NOT NULL,
     title TEXT,
-    artist TEXT,
-    album TEXT,
-    file_path TEXT
+    artist_id INTEGER REFERENCES artists (id),
+    album_id INTEGER REFERENCES albums (id),
+    search_text TEXT,
+    ctag TEXT,
+    duration REAL,
+    bitrate INTEGER,
+    size INTEGER
 )
 ''')
 
@@ -28,28 +100,225 @@ CREATE TABLE IF NOT EXISTS members (
 )
 ''')
 
-# Download tokens table for one-time links
+# Spent one-time download tokens; the tokens themselves are signed and never stored.
+# Rows are swept once expires_at (unix seconds) has passed.
+cursor.execute('''
+CREATE TABLE IF NOT EXISTS used_tokens (
+    token_id TEXT PRIMARY KEY,
+    expires_at INTEGER NOT NULL,
+    used_at INTEGER NOT NULL DEFAULT 0
+)
+''')
+# used_at (unix seconds of the first download) bounds how long a spent token can resume
+if 'used_at' not in table_columns('used_tokens'):
+    cursor.execute("ALTER TABLE used_tokens ADD COLUMN used_at INTEGER NOT NULL DEFAULT 0")
+cursor.execute("CREATE INDEX IF NOT EXISTS idx_used_tokens_expires_at ON used_tokens (expires_at)")
+# Replaced by signed tokens + used_tokens
+cursor.execute("DROP TABLE IF EXISTS download_tokens")
+
+# Album sharing links, reused across clicks and bot restarts
 cursor.execute('''
-CREATE TABLE IF NOT EXISTS download_tokens (
-    token TEXT PRIMARY KEY,
-    song_id INTEGER,
-    album_id INTEGER,
+CREATE TABLE IF NOT EXISTS sharing_links (
+    folder_id TEXT PRIMARY KEY,
+    web_url TEXT NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 )
 ''')
 
-# Albums table to store folder information
+# Search terms behind the bot's Next/Prev buttons, shared by all workers;
+# expired rows (expires_at, unix seconds) are swept as new searches come in
 cursor.execute('''
-CREATE TABLE IF NOT EXISTS albums (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    album_name TEXT NOT NULL,
-    artist_name TEXT,
-    folder_id TEXT NOT NULL UNIQUE,
-    folder_path TEXT
+CREATE TABLE IF NOT EXISTS search_sessions (
+    session_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    search_term TEXT NOT NULL,
+    count_label TEXT NOT NULL,
+    expires_at INTEGER NOT NULL
+)
+''')
+cursor.execute("CREATE INDEX IF NOT EXISTS idx_search_sessions_expires_at ON search_sessions (expires_at)")
+
+# Key/value state for the indexer (e.g. the Graph delta link)
+cursor.execute('''
+CREATE TABLE IF NOT EXISTS index_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+)
+''')
+
+if legacy:
+    legacy_tables = {row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    song_columns = table_columns('legacy_songs')
+    # Folders: those already known, then every folder the old paths mention.
+    folder_rows = {}
+    if 'legacy_folders' in legacy_tables:
+        for item_id, name, path, scanned in cursor.execute(
+                "SELECT id, name, path, scanned FROM legacy_folders" if 'scanned' in table_columns('legacy_folders')
+                else "SELECT id, name, path, 1 FROM legacy_folders").fetchall():
+            folder_rows[path] = [item_id, name, scanned]
+    legacy_albums = []
+    if 'legacy_albums' in legacy_tables:
+        legacy_albums = cursor.execute(
+            "SELECT id, album_name, artist_name, folder_id, folder_path FROM legacy_albums").fetchall()
+        legacy_albums = [album for album in legacy_albums if album[4] is not None]
+        for _, _, _, item_id, folder_path in legacy_albums:
+            folder_rows.setdefault(folder_path, [item_id, posixpath.basename(folder_path), 1])
+    # The newest row of each file_id, as the old unique index kept it.
+    legacy_songs = cursor.execute(
+        f"SELECT id, file_id, file_name, title, artist, album, "
+        f"{'search_text' if 'search_text' in song_columns else 'NULL'}, {'ctag' if 'ctag' in song_columns else 'NULL'}, "
+        f"file_path FROM legacy_songs WHERE id IN (SELECT max(id) FROM legacy_songs GROUP BY file_id) ORDER BY id"
+    ).fetchall()
+    for path in [parent_path(row[8] or '') for row in legacy_songs] + list(folder_rows):
+        while True:
+            folder_rows.setdefault(path, [None, posixpath.basename(path), 1])
+            if not path:
+                break
+            path = parent_path(path)
+    folder_ids = {}
+    # Parents before children
+    for path in sorted(folder_rows, key=lambda path: (path.count('/'), path)):
+        item_id, name, scanned = folder_rows[path]
+        parent_id = folder_ids.get(parent_path(path)) if path else None
+        cursor.execute("INSERT INTO folders (item_id, parent_id, name, path, scanned) VALUES (?, ?, ?, ?, ?)",
+                       (item_id, parent_id, name, path, scanned))
+        folder_ids[path] = cursor.lastrowid
+
+    names = {row[4] for row in legacy_songs if row[4]}
+    names.update(artist for _, _, artist, _, _ in legacy_albums if artist)
+    cursor.executemany("INSERT INTO artists (name) VALUES (?)", [(name,) for name in sorted(names)])
+    artist_ids = dict(cursor.execute("SELECT name, id FROM artists"))
+
+    album_ids = {}
+    for album_id, album_name, artist_name, _, folder_path in legacy_albums:
+        cursor.execute("INSERT OR IGNORE INTO albums (id, album_name, artist_id, folder_id) VALUES (?, ?, ?, ?)",
+                       (album_id, album_name, artist_ids.get(artist_name), folder_ids[folder_path]))
+        album_ids[(folder_ids[folder_path], album_name)] = album_id
+    # Songs whose album has no row of its own (the old albums table kept one album per
+    # folder, from its first song) get one, so the new songs table keeps their album.
+    for _, _, _, _, artist, album, _, _, file_path in legacy_songs:
+        key = (folder_ids[parent_path(file_path or '')], album)
+        if album and album != 'Unknown Album' and key not in album_ids:
+            cursor.execute("INSERT INTO albums (album_name, artist_id, folder_id) VALUES (?, ?, ?)",
+                           (album, artist_ids.get(artist), key[0]))
+            album_ids[key] = cursor.lastrowid
+    song_rows = []
+    for song_id, file_id, file_name, title, artist, album, search_text, ctag, file_path in legacy_songs:
+        folder_id = folder_ids[parent_path(file_path or '')]
+        song_rows.append((song_id, file_id, folder_id, file_name, title, artist_ids.get(artist),
+                          album_ids.get((folder_id, album)),
+                          search_text if search_text is not None else build_search_text(title, artist, album), ctag))
+    cursor.executemany(
+        "INSERT INTO songs (id, file_id, folder_id, file_name, title, artist_id, album_id, search_text, ctag) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", song_rows
+    )
+    for table in ('legacy_songs', 'legacy_albums', 'legacy_folders'):
+        cursor.execute(f"DROP TABLE IF EXISTS {table}")
+    print(f"Migrated {len(song_rows)} songs, {len(album_ids)} albums, {len(artist_ids)} artists "
+          f"and {len(folder_ids)} folders.")
+
+# Search tables from before album and file_path were indexed again are rebuilt below.
+if table_columns('songs_fts') and 'file_path' not in table_columns('songs_fts'):
+    cursor.executescript('''
+    DROP TRIGGER IF EXISTS songs_fts_insert;
+    DROP TRIGGER IF EXISTS songs_fts_delete;
+    DROP TRIGGER IF EXISTS songs_fts_update;
+    DROP TRIGGER IF EXISTS songs_fts_folder_path;
+    DROP TABLE songs_fts;
+    DROP VIEW IF EXISTS songs_search;
+    ''')
+
+# What the search tables index: songs with their artist, album and file path,
+# and albums with their artist's name
+cursor.executescript('''
+CREATE VIEW IF NOT EXISTS songs_search AS
+    SELECT songs.id, songs.title, artists.name AS artist, albums.album_name AS album,
+           folders.path || '/' || songs.file_name AS file_path, songs.search_text
+    FROM songs LEFT JOIN artists ON artists.id = songs.artist_id
+    LEFT JOIN albums ON albums.id = songs.album_id
+    LEFT JOIN folders ON folders.id = songs.folder_id;
+CREATE VIEW IF NOT EXISTS albums_search AS
+    SELECT albums.id, albums.album_name, artists.name AS artist_name
+    FROM albums LEFT JOIN artists ON artists.id = albums.artist_id;
+''')
+
+# Full-text search over songs and albums (external content, kept in sync by triggers)
+cursor.execute("SELECT name FROM sqlite_master WHERE name IN ('songs_fts', 'albums_fts')")
+existing_fts = {row[0] for row in cursor.fetchall()}
+cursor.execute('''
+CREATE VIRTUAL TABLE IF NOT EXISTS songs_fts USING fts5(
+    title, artist, album, file_path, search_text,
+    content='songs_search', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
 )
 ''')
+# Artist and album names never change once written, so old.artist_id and old.album_id
+# still resolve to the indexed names. Folder paths do change (moves and renames), so
+# songs_fts_folder_path re-indexes a folder's songs with their new paths.
+SONG_FTS_VALUES = '''{row}.title, (SELECT name FROM artists WHERE id = {row}.artist_id),
+        (SELECT album_name FROM albums WHERE id = {row}.album_id),
+        (SELECT path FROM folders WHERE id = {row}.folder_id) || '/' || {row}.file_name, {row}.search_text'''
+cursor.executescript(f'''
+CREATE TRIGGER IF NOT EXISTS songs_fts_insert AFTER INSERT ON songs BEGIN
+    INSERT INTO songs_fts (rowid, title, artist, album, file_path, search_text)
+    VALUES (new.id, {SONG_FTS_VALUES.format(row='new')});
+END;
+CREATE TRIGGER IF NOT EXISTS songs_fts_delete AFTER DELETE ON songs BEGIN
+    INSERT INTO songs_fts (songs_fts, rowid, title, artist, album, file_path, search_text)
+    VALUES ('delete', old.id, {SONG_FTS_VALUES.format(row='old')});
+END;
+CREATE TRIGGER IF NOT EXISTS songs_fts_update
+AFTER UPDATE OF title, artist_id, album_id, folder_id, file_name, search_text ON songs BEGIN
+    INSERT INTO songs_fts (songs_fts, rowid, title, artist, album, file_path, search_text)
+    VALUES ('delete', old.id, {SONG_FTS_VALUES.format(row='old')});
+    INSERT INTO songs_fts (rowid, title, artist, album, file_path, search_text)
+    VALUES (new.id, {SONG_FTS_VALUES.format(row='new')});
+END;
+CREATE TRIGGER IF NOT EXISTS songs_fts_folder_path AFTER UPDATE OF path ON folders
+WHEN old.path IS NOT new.path BEGIN
+    INSERT INTO songs_fts (songs_fts, rowid, title, artist, album, file_path, search_text)
+    SELECT 'delete', songs.id, songs.title, (SELECT name FROM artists WHERE id = songs.artist_id),
+        (SELECT album_name FROM albums WHERE id = songs.album_id), old.path || '/' || songs.file_name,
+        songs.search_text
+    FROM songs WHERE songs.folder_id = old.id;
+    INSERT INTO songs_fts (rowid, title, artist, album, file_path, search_text)
+    SELECT songs.id, {SONG_FTS_VALUES.format(row='songs')}
+    FROM songs WHERE songs.folder_id = new.id;
+END;
+''')
+cursor.execute('''
+CREATE VIRTUAL TABLE IF NOT EXISTS albums_fts USING fts5(
+    album_name, artist_name,
+    content='albums_search', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+)
+''')
+cursor.executescript('''
+CREATE TRIGGER IF NOT EXISTS albums_fts_insert AFTER INSERT ON albums BEGIN
+    INSERT INTO albums_fts (rowid, album_name, artist_name)
+    VALUES (new.id, new.album_name, (SELECT name FROM artists WHERE id = new.artist_id));
+END;
+CREATE TRIGGER IF NOT EXISTS albums_fts_delete AFTER DELETE ON albums BEGIN
+    INSERT INTO albums_fts (albums_fts, rowid, album_name, artist_name)
+    VALUES ('delete', old.id, old.album_name, (SELECT name FROM artists WHERE id = old.artist_id));
+END;
+CREATE TRIGGER IF NOT EXISTS albums_fts_update AFTER UPDATE OF album_name, artist_id ON albums BEGIN
+    INSERT INTO albums_fts (albums_fts, rowid, album_name, artist_name)
+    VALUES ('delete', old.id, old.album_name, (SELECT name FROM artists WHERE id = old.artist_id));
+    INSERT INTO albums_fts (rowid, album_name, artist_name)
+    VALUES (new.id, new.album_name, (SELECT name FROM artists WHERE id = new.artist_id));
+END;
+''')
+# Index rows that existed before the search tables were (re)created.
+if 'songs_fts' not in existing_fts:
+    cursor.execute("INSERT INTO songs_fts (songs_fts) VALUES ('rebuild')")
+if 'albums_fts' not in existing_fts:
+    cursor.execute("INSERT INTO albums_fts (albums_fts) VALUES ('rebuild')")
 
 conn.commit()
+if legacy:
+    # Give the space of the old tables back, so the file shrinks.
+    conn.execute("VACUUM")
 conn.close()
 
 print("Database 'music_bot.db' and all tables (including albums) created successfully.")
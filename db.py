@@ -0,0 +1,90 @@
+import os
+import re
+import asyncio
+import sqlite3
+import threading
+import metrics
+
+# Milliseconds a writer waits for another worker's lock before "database is locked"
+BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# Compiled statements kept per connection; the bot runs a small fixed set of queries
+STATEMENT_CACHE_SIZE = int(os.getenv("SQLITE_STATEMENT_CACHE_SIZE", "128"))
+
+QUERY_SECONDS = metrics.histogram("sqlite_query_seconds", "SQLite statement time, including fetching rows",
+                                  ("query",))
+# "SELECT ... FROM songs_fts ..." -> "select songs_fts"
+STATEMENT_TARGET = re.compile(r"^\s*(\w+)(?:(?<=UPDATE)|.*?\b(?:FROM|INTO))\s+(\w+)", re.IGNORECASE | re.DOTALL)
+_query_labels = {}
+
+
+def query_label(sql: str) -> str:
+    label = _query_labels.get(sql)
+    if label is None:
+        match = STATEMENT_TARGET.match(sql)
+        label = _query_labels[sql] = f"{match.group(1)} {match.group(2)}".lower() if match else sql.split()[0].lower()
+    return label
+
+
+class Database:
+    """Per-thread SQLite connections for the bot's request and handler code.
+
+    Each thread (Flask request threads, and the worker threads the async
+    helpers run on) opens one connection on first use and keeps it, so the
+    per-connection statement cache stays warm instead of every query paying
+    for connect, schema load and prepare. Connections use WAL so the readers
+    never block the token writes, plus a busy timeout for writer contention
+    between gunicorn workers.
+
+    ``execute_async`` and ``run_async`` run the same calls on asyncio's
+    default thread pool, keeping blocking disk I/O off the event loop.
+    """
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self._local = threading.local()
+        self._wal_lock = threading.Lock()
+        self._wal_enabled = False
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=BUSY_TIMEOUT_MS / 1000,
+                                   cached_statements=STATEMENT_CACHE_SIZE)
+            self._enable_wal(conn)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def fetchone(self, sql: str, params=()):
+        with QUERY_SECONDS.time(query=query_label(sql)):
+            return self.connection().execute(sql, params).fetchone()
+
+    def fetchall(self, sql: str, params=()) -> list:
+        with QUERY_SECONDS.time(query=query_label(sql)):
+            return self.connection().execute(sql, params).fetchall()
+
+    def execute(self, sql: str, params=()) -> int:
+        """Run one write in its own transaction; returns the number of rows changed."""
+        conn = self.connection()
+        with QUERY_SECONDS.time(query=query_label(sql)), conn:
+            return conn.execute(sql, params).rowcount
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    async def execute_async(self, sql: str, params=()) -> int:
+        return await asyncio.to_thread(self.execute, sql, params)
+
+    async def run_async(self, func, *args):
+        """Run a blocking function that uses this database on a worker thread."""
+        return await asyncio.to_thread(func, *args)
+
+    def _enable_wal(self, conn):
+        # journal_mode=WAL is stored in the file; one switch per process is enough.
+        with self._wal_lock:
+            if not self._wal_enabled:
+                conn.execute("PRAGMA journal_mode=WAL")
+                self._wal_enabled = True
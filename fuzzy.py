@@ -0,0 +1,205 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from array import array
+from collections import Counter
+from itertools import chain
+from urllib.request import pathname2url
+from normalize import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# Catalog values each fuzzy field is built from
+FIELD_QUERIES = {
+    "title": "SELECT DISTINCT title FROM songs",
+    "artist": "SELECT name FROM artists",
+    "album": "SELECT DISTINCT album_name FROM albums",
+}
+# Changes whenever the indexer adds, removes or rewrites catalog rows
+SIGNATURE_QUERY = (
+    "SELECT (SELECT value FROM index_state WHERE key = 'delta_link'), "
+    "(SELECT max(id) FROM songs), (SELECT count(*) FROM songs), "
+    "(SELECT max(id) FROM albums), (SELECT count(*) FROM albums)"
+)
+EMPTY = array("I")
+APPLY_CHUNK = 10000
+
+
+def trigrams(text: str) -> set:
+    """Trigrams of each word padded like pg_trgm: 'abba' -> '  a', ' ab', 'abb', 'bba', 'ba '."""
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TrigramIndex:
+    """Trigram index over a set of normalized strings.
+
+    Posting lists are ``array('I')`` of value ids in insertion order, so 1M
+    values cost roughly 4 bytes per trigram occurrence rather than a Python
+    object each. Removed values are tombstoned, not unlinked; the owner
+    rebuilds the index once too many are dead.
+    """
+
+    def __init__(self, candidate_budget: int = 20000, rescore: int = 64):
+        self.candidate_budget = candidate_budget
+        self.rescore = rescore
+        self.values = []
+        self.ids = {}
+        self.postings = {}
+        self.dead = set()
+
+    def __len__(self):
+        return len(self.values) - len(self.dead)
+
+    def add(self, text: str):
+        value_id = self.ids.get(text)
+        if value_id is not None:
+            self.dead.discard(value_id)
+            return
+        value_id = self.ids[text] = len(self.values)
+        self.values.append(text)
+        for gram in trigrams(text):
+            posting = self.postings.get(gram)
+            if posting is None:
+                posting = self.postings[gram] = array("I")
+            posting.append(value_id)
+
+    def remove(self, text: str):
+        value_id = self.ids.get(text)
+        if value_id is not None:
+            self.dead.add(value_id)
+
+    def live_values(self) -> set:
+        return {text for value_id, text in enumerate(self.values) if value_id not in self.dead}
+
+    def search(self, query: str, limit: int = 5, min_similarity: float = 0.3) -> list:
+        """Up to ``limit`` (similarity, value) pairs, best first, by trigram Dice similarity.
+
+        Candidates are counted from the query's rarest posting lists until
+        ``candidate_budget`` postings have been read, so a query costs about
+        the same however large the index is; values sharing only very common
+        trigrams with the query are too dissimilar to matter. The best
+        ``rescore`` candidates are then scored exactly.
+        """
+        grams = trigrams(query)
+        if not grams:
+            return []
+        lists = sorted((self.postings.get(gram, EMPTY) for gram in grams), key=len)
+        selected, budget = [], self.candidate_budget
+        for posting in lists:
+            if selected and len(posting) > budget:
+                break
+            selected.append(posting)
+            budget -= len(posting)
+        counts = Counter(chain.from_iterable(selected))
+        for value_id in counts.keys() & self.dead:
+            del counts[value_id]
+        results = []
+        for value_id, _ in counts.most_common(self.rescore):
+            text = self.values[value_id]
+            value_grams = trigrams(text)
+            similarity = 2 * len(grams & value_grams) / (len(grams) + len(value_grams))
+            if similarity >= min_similarity:
+                results.append((similarity, text))
+        results.sort(reverse=True)
+        return results[:limit]
+
+
+class FuzzyCatalog:
+    """Typo-tolerant lookup of catalog titles, artists and album names.
+
+    ``start`` builds the indexes on a background thread and then re-checks
+    the catalog every ``reload_interval`` seconds; when the indexer has
+    changed it, only the values that appeared or disappeared are applied.
+    Until the first build finishes ``suggest`` returns None.
+
+    The indexes hold normalized values, which the raw title/artist/album FTS
+    columns do not match once an apostrophe or "&" was normalized away, so
+    each field also maps them back to a catalog value as stored.
+    """
+
+    def __init__(self, db_file: str, reload_interval: float = 60, max_dead_ratio: float = 0.25):
+        self.db_file = db_file
+        self.reload_interval = reload_interval
+        self.max_dead_ratio = max_dead_ratio
+        self.indexes = {field: TrigramIndex() for field in FIELD_QUERIES}
+        self.originals = {field: {} for field in FIELD_QUERIES}
+        self.ready = threading.Event()
+        self._lock = threading.Lock()
+        self._signature = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="fuzzy-catalog", daemon=True)
+            self._thread.start()
+        return self
+
+    def suggest(self, fields, query: str, min_similarity: float = 0.3):
+        """Best-matching catalog value for ``query`` across ``fields``, as stored, or None."""
+        if not self.ready.is_set():
+            return None
+        query = normalize_text(query)
+        best = None
+        with self._lock:
+            for field in fields:
+                for similarity, text in self.indexes[field].search(query, limit=1, min_similarity=min_similarity):
+                    match = (similarity, self.originals[field].get(text, text))
+                    best = max(best, match) if best else match
+        return best[1] if best else None
+
+    def refresh(self):
+        # Read-only, so a missing database file is an error rather than a new empty file.
+        conn = sqlite3.connect(f"file:{pathname2url(os.path.abspath(self.db_file))}?mode=ro", uri=True)
+        try:
+            signature = conn.execute(SIGNATURE_QUERY).fetchone()
+            if signature == self._signature:
+                return
+            started = time.monotonic()
+            for field, sql in FIELD_QUERIES.items():
+                originals = {normalize_text(value): value for (value,) in conn.execute(sql)}
+                originals.pop("", None)
+                self._apply(field, set(originals))
+                with self._lock:
+                    self.originals[field] = originals
+            self._signature = signature
+        finally:
+            conn.close()
+        logger.info(f"Fuzzy index loaded in {time.monotonic() - started:.1f}s: "
+                    + ", ".join(f"{len(index)} {field}s" for field, index in self.indexes.items()))
+
+    def _apply(self, field, wanted):
+        index = self.indexes[field]
+        current = index.live_values()
+        removed = current - wanted
+        if len(index.dead) + len(removed) > self.max_dead_ratio * max(len(wanted), 1):
+            # Too many tombstones: build a fresh index and swap it in.
+            index = TrigramIndex(index.candidate_budget, index.rescore)
+            for text in wanted:
+                index.add(text)
+            with self._lock:
+                self.indexes[field] = index
+            return
+        with self._lock:
+            for text in removed:
+                index.remove(text)
+        added = list(wanted - current)
+        # Small batches so searches are never held up for long by a reload.
+        for start in range(0, len(added), APPLY_CHUNK):
+            with self._lock:
+                for text in added[start:start + APPLY_CHUNK]:
+                    index.add(text)
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+                self.ready.set()
+            except sqlite3.Error as e:
+                logger.error(f"Fuzzy index reload failed: {e}")
+            time.sleep(self.reload_interval)
@@ -0,0 +1,93 @@
+import os
+import time
+import logging
+import threading
+import requests
+
+TENANT_ID = os.getenv("O365_TENANT_ID")
+CLIENT_ID = os.getenv("O365_CLIENT_ID")
+CLIENT_SECRET = os.getenv("O365_CLIENT_SECRET")
+AUTHORITY_HOST = os.getenv("O365_AUTHORITY_HOST", "https://login.microsoftonline.com")
+SCOPE = ["https://graph.microsoft.com/.default"]
+
+# Refresh this many seconds before the token expires
+REFRESH_MARGIN = int(os.getenv("GRAPH_TOKEN_REFRESH_MARGIN", "300"))
+
+logger = logging.getLogger(__name__)
+
+
+class TokenProvider:
+    """App-only Graph access token shared by the whole process.
+
+    One MSAL application (and its token cache) is reused for every call. A
+    token is handed out from memory until it is within ``refresh_margin`` of
+    expiry; then one caller refreshes it while the others keep using the
+    still-valid token, so no request waits on AAD unless the token has
+    actually expired.
+    """
+
+    def __init__(self, tenant_id=TENANT_ID, client_id=CLIENT_ID, client_secret=CLIENT_SECRET,
+                 authority_host=AUTHORITY_HOST, refresh_margin=REFRESH_MARGIN):
+        self.authority = f"{authority_host}/{tenant_id}"
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._app = None
+        self._token = None
+        self._expires_at = 0.0
+
+    def get_token(self):
+        now = time.time()
+        if self._token and now < self._expires_at - self.refresh_margin:
+            return self._token
+        if self._token and now < self._expires_at:
+            # Still valid: refresh in this caller only if nobody else is.
+            if not self._lock.acquire(blocking=False):
+                return self._token
+        else:
+            self._lock.acquire()
+        try:
+            if self._token and time.time() < self._expires_at - self.refresh_margin:
+                return self._token
+            return self._refresh()
+        finally:
+            self._lock.release()
+
+    def _refresh(self):
+        if self._app is None:
+            # Imported here rather than at startup: MSAL is slow to import and only a refresh needs it.
+            import msal
+            self._app = msal.ConfidentialClientApplication(
+                client_id=self.client_id, authority=self.authority, client_credential=self.client_secret
+            )
+        result = self._app.acquire_token_for_client(scopes=SCOPE)
+        if "access_token" in result:
+            self._token = result["access_token"]
+            self._expires_at = time.time() + int(result.get("expires_in", 3600))
+            return self._token
+        logger.error(f"Failed to acquire token: {result.get('error_description')}")
+        # Keep serving the old token if it has not expired yet.
+        return self._token if time.time() < self._expires_at else None
+
+
+class BearerAuth(requests.auth.AuthBase):
+    """requests auth hook that adds a fresh Graph token to Graph API calls only.
+
+    Pre-authenticated download URLs live on other hosts and must not get an
+    Authorization header.
+    """
+
+    def __init__(self, provider, url_prefix):
+        self.provider = provider
+        self.url_prefix = url_prefix
+
+    def __call__(self, request):
+        if request.url.startswith(self.url_prefix):
+            token = self.provider.get_token()
+            if token:
+                request.headers["Authorization"] = f"Bearer {token}"
+        return request
+
+
+token_provider = TokenProvider()
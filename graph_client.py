@@ -0,0 +1,84 @@
+import os
+import time
+import logging
+import threading
+import requests
+from graph_auth import token_provider, BearerAuth
+
+# --- Configuration ---
+TARGET_USER_ID = os.getenv("O365_USER_ID")
+GRAPH_API_URL = os.getenv("GRAPH_API_URL", "https://graph.microsoft.com/v1.0")
+DRIVE_URL = f"{GRAPH_API_URL}/users/{TARGET_USER_ID}/drive"
+
+POOL_SIZE = int(os.getenv("GRAPH_POOL_SIZE", "32"))
+MAX_RETRIES = int(os.getenv("GRAPH_MAX_RETRIES", "5"))
+CONNECT_TIMEOUT = float(os.getenv("GRAPH_CONNECT_TIMEOUT", "10"))
+READ_TIMEOUT = float(os.getenv("GRAPH_READ_TIMEOUT", "60"))
+MAX_BACKOFF = 60
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Statuses that mean "the service is throttling us", not just this request failed
+THROTTLE_STATUSES = (429, 503)
+
+logger = logging.getLogger(__name__)
+
+
+def retry_delay(response, attempt):
+    """Seconds to wait before retrying: Retry-After if given, else exponential backoff."""
+    retry_after = response.headers.get("Retry-After", "")
+    if retry_after.isdigit():
+        return int(retry_after)
+    return min(2 ** attempt, MAX_BACKOFF)
+
+
+class GraphSession(requests.Session):
+    """Keep-alive requests session for Graph and download URLs.
+
+    Requests get a default timeout, a bearer token on Graph API URLs, and
+    retries with backoff on 429/5xx. A 429/503 pauses every thread using the
+    session until Retry-After has passed, instead of each one hammering the
+    throttled service on its own.
+    """
+
+    def __init__(self, pool_size=POOL_SIZE, max_retries=MAX_RETRIES,
+                 timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)):
+        super().__init__()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+        self.auth = BearerAuth(token_provider, GRAPH_API_URL)
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._throttled_until = 0.0
+
+    def request(self, method, url, *args, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(self.max_retries + 1):
+            delay = self._throttled_until - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            response = super().request(method, url, *args, **kwargs)
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                return response
+            delay = retry_delay(response, attempt)
+            if response.status_code in THROTTLE_STATUSES:
+                with self._lock:
+                    self._throttled_until = max(self._throttled_until, time.monotonic() + delay)
+                logger.warning(f"Throttled ({response.status_code}), backing off {delay}s...")
+            response.close()
+            if response.status_code not in THROTTLE_STATUSES:
+                time.sleep(delay)
+        return response
+
+
+# --- Shared session ---
+session = GraphSession()
+
+
+# --- Drive item helpers ---
+def get_item(item_id: str):
+    return session.get(f"{DRIVE_URL}/items/{item_id}")
+
+
+def create_view_link(item_id: str):
+    return session.post(f"{DRIVE_URL}/items/{item_id}/createLink", json={"type": "view", "scope": "anonymous"})
@@ -0,0 +1,56 @@
+import time
+import sqlite3
+import threading
+from datetime import datetime
+
+
+def parse_expiry(expiry_date_str: str) -> float:
+    try:
+        expiry_date = datetime.fromisoformat(expiry_date_str)
+    except ValueError:
+        expiry_date = datetime.strptime(expiry_date_str, "%Y-%m-%d %H:%M:%S.%f")
+    return expiry_date.timestamp()
+
+
+class MembershipCache:
+    """In-memory view of the members table for per-update auth checks.
+
+    Each active member's expiry is kept as a pre-parsed timestamp, so
+    ``is_member`` is a dict lookup. Writes made through this process call
+    ``invalidate``; writes from other gunicorn workers are noticed through
+    SQLite's ``PRAGMA data_version``, checked at most every ``check_interval``
+    seconds on one long-lived connection.
+    """
+
+    def __init__(self, db_file: str, check_interval: float = 1.0):
+        self.db_file = db_file
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._conn = None
+        self._expiry = {}
+        self._data_version = None
+        self._checked_at = 0.0
+        self._stale = True
+
+    def is_member(self, user_id: int) -> bool:
+        now = time.time()
+        if self._stale or now - self._checked_at >= self.check_interval:
+            self._refresh(now)
+        expiry = self._expiry.get(user_id)
+        return expiry is not None and expiry > now
+
+    def invalidate(self):
+        self._stale = True
+
+    def _refresh(self, now):
+        with self._lock:
+            if self._conn is None:
+                self._conn = sqlite3.connect(self.db_file, check_same_thread=False)
+            data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            self._checked_at = now
+            if not self._stale and data_version == self._data_version:
+                return
+            self._stale = False
+            self._data_version = data_version
+            rows = self._conn.execute("SELECT telegram_id, expiry_date FROM members WHERE status = 'active'").fetchall()
+            self._expiry = {telegram_id: parse_expiry(expiry_date) for telegram_id, expiry_date in rows}
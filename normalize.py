@@ -0,0 +1,30 @@
+import re
+import unicodedata
+
+APOSTROPHES = re.compile(r"['’‘`´]")
+SEPARATORS = re.compile(r"[^\w\u0300-\u036f\u1000-\u109f]+")
+
+
+def _fold(char: str) -> str:
+    # é -> e, ñ -> n; scripts whose marks carry meaning (e.g. Myanmar) are left alone.
+    base = unicodedata.normalize("NFD", char)[0]
+    return base if base.isascii() else char
+
+
+def normalize_text(text: str) -> str:
+    """Lower-case, accent-free, punctuation-free form used for searching.
+
+    "Guns N' Roses", "guns n roses" and "GUNS ’N’ ROSES" all become
+    "guns n roses"; "AC/DC" becomes "ac dc" and "&" becomes "and".
+    """
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = "".join(_fold(char) for char in text)
+    text = APOSTROPHES.sub("", text).replace("&", " and ")
+    return " ".join(SEPARATORS.sub(" ", text).replace("_", " ").split())
+
+
+def build_search_text(title: str, artist: str, album: str) -> str:
+    """Combined title/artist/album column for the free-form /s search."""
+    return " ".join(part for part in map(normalize_text, (title, artist, album)) if part)
@@ -1,147 +1,656 @@
 import os
+import argparse
 import sqlite3
 import json
+import time
+from datetime import datetime, timezone
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import requests
-import msal
 from mutagen.flac import FLAC
 from mutagen.mp4 import MP4
 from mutagen.wave import WAVE
 from mutagen.dsf import DSF
-from io import BytesIO
+from remote_file import RangeFile
+from normalize import build_search_text
+import metrics
+from graph_auth import token_provider
+from graph_client import GraphSession, DRIVE_URL
 
 # --- Configuration ---
-TENANT_ID = os.getenv("O365_TENANT_ID")
-CLIENT_ID = os.getenv("O365_CLIENT_ID")
-CLIENT_SECRET = os.getenv("O365_CLIENT_SECRET")
-TARGET_USER_ID = os.getenv("O365_USER_ID")
-
-AUTHORITY = f"https://login.microsoftonline.com/{TENANT_ID}"
-SCOPE = ["https://graph.microsoft.com/.default"]
 DB_FILE = "music_bot.db"
 SUPPORTED_EXTENSIONS = ['.flac', '.wav', '.m4a', '.dsf']
 
+# Mutagen class and title/artist/album keys per format:
+# Vorbis comments (FLAC), MP4 atoms (M4A) and ID3 frames (WAV, DSF)
+TAG_FORMATS = {
+    '.flac': (FLAC, ('title', 'artist', 'album')),
+    '.m4a': (MP4, ('\xa9nam', '\xa9ART', '\xa9alb')),
+    '.wav': (WAVE, ('TIT2', 'TPE1', 'TALB')),
+    '.dsf': (DSF, ('TIT2', 'TPE1', 'TALB')),
+}
+# What one tag read yields; duration in seconds and bitrate in bits/s (None if unknown)
+TrackInfo = namedtuple("TrackInfo", "title artist album search_text duration bitrate")
+
+# Concurrency limits (folder listing workers / tag reading workers)
+LIST_WORKERS = int(os.getenv("INDEXER_LIST_WORKERS", "4"))
+TAG_WORKERS = int(os.getenv("INDEXER_TAG_WORKERS", "8"))
+MAX_RETRIES = int(os.getenv("INDEXER_MAX_RETRIES", "5"))
+
+# Children listing: largest page Graph allows, and only the fields the indexer reads
+PAGE_SIZE = int(os.getenv("INDEXER_PAGE_SIZE", "999"))
+CHILDREN_SELECT = "id,name,file,folder,size,eTag,cTag,@microsoft.graph.downloadUrl"
+
+# DB writer: rows per transaction, and the longest a row may sit in the buffer
+BATCH_SIZE = int(os.getenv("INDEXER_BATCH_SIZE", "500"))
+FLUSH_INTERVAL = float(os.getenv("INDEXER_FLUSH_INTERVAL", "5"))
+
+# Catalog indexes; dropped during a full scan and built once at the end
+# (the UNIQUE keys in create_database.py stay in place for upserts and id lookups)
+SECONDARY_INDEXES = {
+    "idx_songs_folder": "CREATE INDEX IF NOT EXISTS idx_songs_folder ON songs (folder_id)",
+    "idx_songs_artist": "CREATE INDEX IF NOT EXISTS idx_songs_artist ON songs (artist_id)",
+    "idx_songs_album": "CREATE INDEX IF NOT EXISTS idx_songs_album ON songs (album_id)",
+    "idx_albums_artist": "CREATE INDEX IF NOT EXISTS idx_albums_artist ON albums (artist_id)",
+}
+
+# Run summary (timings, per-stage throughput) written when the indexer exits
+SUMMARY_FILE = os.getenv("INDEXER_SUMMARY_FILE", "indexer_summary.json")
+
+# --- Metrics ---
+LIST_SECONDS = metrics.histogram("indexer_list_folder_seconds", "Listing one folder, all pages")
+FOLDERS_LISTED = metrics.counter("indexer_folders_listed_total", "Folders listed")
+TAG_SECONDS = metrics.histogram("indexer_tag_read_seconds", "Reading one file's tags over HTTP ranges")
+TAG_BYTES = metrics.counter("indexer_tag_bytes_total", "Bytes downloaded to read tags")
+TAG_REQUESTS = metrics.counter("indexer_tag_requests_total", "Range requests made to read tags")
+SONGS_TAGGED = metrics.counter("indexer_songs_tagged_total", "Files whose tags were read")
+FLUSH_SECONDS = metrics.histogram("indexer_db_flush_seconds", "One batched write transaction")
+
 # --- Global DB Connection ---
 conn = None
 cursor = None
+writer = None
+# Artist names and (folder, album) pairs already written in this run
+written_artists = set()
+written_albums = set()
+
+class BatchWriter:
+    """Row များကို buffer လုပ်ပြီး transaction တစ်ခုချင်းစီတွင် executemany ဖြင့် ရေးခြင်း
+
+    Each flush is one transaction, so a killed run leaves the database at the
+    last completed batch instead of a half-written row.
+    """
+
+    def __init__(self, connection, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.conn = connection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+        # (sql, rows, on_written) groups in arrival order, so e.g. a folder's
+        # checkpoint update is never applied before the folder row itself.
+        self._pending = []
+        self._count = 0
+        self._last_flush = time.monotonic()
+
+    def add(self, sql, row, on_written=None):
+        """Buffer one row; ``on_written`` is called after the commit if the row changed anything."""
+        if not on_written and self._pending and self._pending[-1][0] == sql and not self._pending[-1][2]:
+            self._pending[-1][1].append(row)
+        else:
+            # A row with a callback is a group of its own, so its rowcount is its alone.
+            self._pending.append((sql, [row], on_written))
+        self._count += 1
+        if self._count >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            written = []
+            with FLUSH_SECONDS.time(), self.conn:
+                for sql, rows, on_written in self._pending:
+                    if self.conn.executemany(sql, rows).rowcount and on_written:
+                        written.append(on_written)
+            self.rows_written += self._count
+            self._pending = []
+            self._count = 0
+            for on_written in written:
+                on_written()
+        self._last_flush = time.monotonic()
+
+def begin_bulk_load(connection):
+    """Bulk load အတွက် WAL နှင့် pragma များ သတ်မှတ်ခြင်း"""
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute("PRAGMA temp_store=MEMORY")
+    connection.execute("PRAGMA cache_size=-65536")
+
+def end_bulk_load(connection):
+    """Index များ တည်ဆောက်ပြီး database ကို file တစ်ခုတည်း (artifact) အဖြစ် ပြန်ထားခြင်း"""
+    create_secondary_indexes(connection)
+    connection.execute("ANALYZE")
+    connection.execute("PRAGMA journal_mode=DELETE")
+
+def drop_secondary_indexes(connection):
+    for name in SECONDARY_INDEXES:
+        connection.execute(f"DROP INDEX IF EXISTS {name}")
+
+def create_secondary_indexes(connection):
+    for sql in SECONDARY_INDEXES.values():
+        connection.execute(sql)
+
+# Keep-alive session shared by all listing and ranged tag reads. Graph calls
+# get a fresh token per request, so scans longer than the token lifetime work.
+http = GraphSession(pool_size=LIST_WORKERS + TAG_WORKERS, max_retries=MAX_RETRIES)
 
 def get_access_token():
-    """Microsoft Graph API အတွက် Access Token ရယူခြင်း"""
-    app = msal.ConfidentialClientApplication(
-        client_id=CLIENT_ID,
-        authority=AUTHORITY,
-        client_credential=CLIENT_SECRET
-    )
+    """Microsoft Graph API အတွက် Access Token ရယူခြင်း (shared provider မှ)"""
     print("Attempting to acquire token...")
-    result = app.acquire_token_for_client(scopes=SCOPE)
-    if "access_token" in result:
+    token = token_provider.get_token()
+    if token:
         print("Access Token acquired successfully.")
-        return result['access_token']
     else:
-        print(f"\nFailed to acquire access token: {result.get('error_description')}")
-        return None
+        print("\nFailed to acquire access token.")
+    return token
+
+def first_tag(tags, key, default):
+    value = tags.get(key)
+    # ID3 frames keep their values in .text; the other formats store lists
+    values = getattr(value, 'text', value)
+    return str(values[0]) if values else default
 
-def get_metadata(file_content, file_name):
-    """Mutagen ကိုသုံးပြီး သီချင်း metadata ဖတ်ခြင်း"""
+def get_metadata(file_like_object, file_name):
+    """Mutagen ကိုသုံးပြီး သီချင်း metadata နှင့် duration/bitrate ကို တစ်ကြိမ်တည်းဖတ်ခြင်း
+
+    Returns a ``TrackInfo``; ``search_text`` is the normalized
+    title/artist/album string that /s searches.
+    """
+    stem, extension = os.path.splitext(file_name)
     try:
-        file_like_object = BytesIO(file_content)
-        tags = None
-        if file_name.lower().endswith('.flac'):
-            tags = FLAC(fileobj=file_like_object)
-        elif file_name.lower().endswith('.m4a'):
-            tags = MP4(fileobj=file_like_object)
-        elif file_name.lower().endswith('.wav'):
-            tags = WAVE(fileobj=file_like_object)
-        elif file_name.lower().endswith('.dsf'):
-            tags = DSF(fileobj=file_like_object)
-
-        if tags:
-            title = tags.get('title', [os.path.splitext(file_name)[0]])[0]
-            artist = tags.get('artist', ['Unknown Artist'])[0]
-            album = tags.get('album', ['Unknown Album'])[0]
-            return title, artist, album
+        if extension.lower() in TAG_FORMATS:
+            file_type, (title_key, artist_key, album_key) = TAG_FORMATS[extension.lower()]
+            tags = file_type(fileobj=file_like_object)
+            title = first_tag(tags, title_key, stem)
+            artist = first_tag(tags, artist_key, 'Unknown Artist')
+            album = first_tag(tags, album_key, 'Unknown Album')
+            duration = round(tags.info.length, 3) if getattr(tags.info, 'length', None) else None
+            return TrackInfo(title, artist, album, build_search_text(title, artist, album),
+                             duration, getattr(tags.info, 'bitrate', None) or None)
     except Exception as e:
         print(f"  Could not read metadata for {file_name}. Error: {e}")
-    return "Unknown Title", "Unknown Artist", "Unknown Album"
+    return TrackInfo("Unknown Title", "Unknown Artist", "Unknown Album", "", None, None)
+
+def is_music_file(item):
+    return 'file' in item and os.path.splitext(item.get('name', ''))[1].lower() in SUPPORTED_EXTENSIONS
 
-def scan_folder(headers, item_id, current_path):
-    """OneDrive Folder များကို Recursive Scan လုပ်ပြီး songs နှင့် albums table များကို data ဖြည့်ခြင်း"""
-    endpoint = f"https://graph.microsoft.com/v1.0/users/{TARGET_USER_ID}/drive/items/{item_id}/children"
+def read_remote_metadata(item, resolve=False):
+    """File တစ်ခုလုံးကို download မလုပ်ဘဲ tag ပါသော byte range များကိုသာ ဖတ်ခြင်း"""
+    download_url = item.get('@microsoft.graph.downloadUrl')
+    if not download_url and resolve:
+        # Delta responses may omit the pre-authenticated URL; resolve the item.
+        try:
+            response = http.get(f"{DRIVE_URL}/items/{item.get('id')}", timeout=60)
+            response.raise_for_status()
+            download_url = response.json().get('@microsoft.graph.downloadUrl')
+        except requests.exceptions.RequestException as e:
+            print(f"  Could not resolve {item.get('name')}. Error: {e}")
+            return None
+    if not download_url:
+        return None
+    remote_file = RangeFile(download_url, size=item.get('size'), session=http)
     try:
-        response = requests.get(endpoint, headers=headers)
-        response.raise_for_status() # Raise an exception for bad status codes
+        with TAG_SECONDS.time(), remote_file:
+            return get_metadata(remote_file, item.get('name'))
     except requests.exceptions.RequestException as e:
-        print(f"Error scanning folder {item_id}: {e}")
+        print(f"  Could not fetch {item.get('name')}. Error: {e}")
+        return None
+    finally:
+        SONGS_TAGGED.inc()
+        TAG_BYTES.inc(remote_file.bytes_fetched)
+        TAG_REQUESTS.inc(remote_file.requests_made)
+
+def iter_pages(url, params=None):
+    """@odata.nextLink ကို လိုက်ပြီး Graph response page များကို တစ်ခုချင်း yield လုပ်ခြင်း"""
+    while url:
+        response = http.get(url, params=params, timeout=60)
+        response.raise_for_status() # Raise an exception for bad status codes
+        page = response.json()
+        yield page
+        # nextLink already carries the original query parameters.
+        url, params = page.get('@odata.nextLink'), None
+
+def iter_children(item_id):
+    """Folder တစ်ခုအတွင်းရှိ item များကို page အားလုံးမှ stream လုပ်ခြင်း"""
+    endpoint = f"{DRIVE_URL}/items/{item_id}/children"
+    params = {'$top': PAGE_SIZE, '$select': CHILDREN_SELECT}
+    for page in iter_pages(endpoint, params):
+        yield from page.get('value', [])
+
+def list_folder(item_id):
+    """Folder တစ်ခုအတွင်းရှိ item များကို Graph API မှ ရယူခြင်း"""
+    with LIST_SECONDS.time():
+        items = list(iter_children(item_id))
+    FOLDERS_LISTED.inc()
+    return items
+
+def get_root_id():
+    response = http.get(f"{DRIVE_URL}/root", params={'$select': 'id'}, timeout=60)
+    response.raise_for_status()
+    return response.json()['id']
+
+# Folders, artists and albums are referenced by integer ids; rows written
+# through the batch writer look them up by their natural keys instead.
+FOLDER_ID = "(SELECT id FROM folders WHERE item_id = ?)"
+ARTIST_ID = "(SELECT id FROM artists WHERE name = ?)"
+
+def write_folder(folder_id, parent_id, name, path, scanned=0):
+    writer.add(
+        f"INSERT INTO folders (item_id, parent_id, name, path, scanned) VALUES (?, {FOLDER_ID}, ?, ?, ?) "
+        "ON CONFLICT (item_id) DO UPDATE SET parent_id = excluded.parent_id, name = excluded.name, "
+        # A folder checkpointed as scanned stays scanned.
+        "path = excluded.path, scanned = max(folders.scanned, excluded.scanned)",
+        (folder_id, parent_id, name, path, scanned)
+    )
+
+def mark_folder_scanned(folder_id):
+    """Checkpoint: folder listing နှင့် ၎င်းအတွင်းရှိ song များ အားလုံး ရေးပြီးကြောင်း မှတ်ခြင်း"""
+    writer.add("UPDATE folders SET scanned = 1 WHERE item_id = ?", (folder_id,))
+
+def write_artist(artist):
+    if artist not in written_artists:
+        written_artists.add(artist)
+        writer.add("INSERT OR IGNORE INTO artists (name) VALUES (?)", (artist,))
+
+def write_album(folder_id, folder_path, metadata):
+    """Folder ထဲရှိ album တစ်ခုကို ပထမဆုံး song ၏ tag များဖြင့် တစ်ကြိမ်သာ ရေးခြင်း"""
+    if metadata.album == "Unknown Album" or (folder_id, metadata.album) in written_albums:
         return
+    written_albums.add((folder_id, metadata.album))
+    write_artist(metadata.artist)
+    # OR IGNORE: album already indexed in this folder, skip (and log nothing).
+    writer.add(
+        f"INSERT OR IGNORE INTO albums (album_name, artist_id, folder_id) VALUES (?, {ARTIST_ID}, {FOLDER_ID})",
+        (metadata.album, metadata.artist, folder_id),
+        on_written=lambda: print(f"++ Indexed Album Folder: '{metadata.album}' by {metadata.artist} ({folder_path})")
+    )
+
+def write_song(item, folder_id, metadata):
+    write_artist(metadata.artist)
+    writer.add(
+        "INSERT INTO songs (file_id, folder_id, file_name, title, artist_id, album_id, search_text, ctag, "
+        f"duration, bitrate, size) VALUES (?, {FOLDER_ID}, ?, ?, {ARTIST_ID}, "
+        f"(SELECT id FROM albums WHERE folder_id = {FOLDER_ID} AND album_name = ?), ?, ?, ?, ?, ?) "
+        "ON CONFLICT (file_id) DO UPDATE SET folder_id = excluded.folder_id, file_name = excluded.file_name, "
+        "title = excluded.title, artist_id = excluded.artist_id, album_id = excluded.album_id, "
+        "search_text = excluded.search_text, ctag = excluded.ctag, duration = excluded.duration, "
+        "bitrate = excluded.bitrate, size = excluded.size",
+        (item.get('id'), folder_id, item.get('name'), metadata.title, metadata.artist, folder_id, metadata.album,
+         metadata.search_text, item.get('cTag'), metadata.duration, metadata.bitrate, item.get('size'))
+    )
+    print(f"  -- Indexed Song: {metadata.artist} - {metadata.album} - {metadata.title}")
+
+def get_known_subfolders(folder_id):
+    """Resume: ပြတ်တောက်သွားသော run က ရေးပြီးသား subfolder များ (scan ပြီးသား သို့မဟုတ် checkpoint ထဲရှိဆဲ)"""
+    return {row[0] for row in cursor.execute(
+        "SELECT item_id FROM folders WHERE parent_id = (SELECT id FROM folders WHERE item_id = ?)", (folder_id,)
+    )}
 
-    items = response.json().get('value', [])
-    music_files_in_folder = [item for item in items if 'file' in item and os.path.splitext(item.get('name', ''))[1].lower() in SUPPORTED_EXTENSIONS]
-    
-    if music_files_in_folder:
-        first_song = music_files_in_folder[0]
-        download_url = first_song.get('@microsoft.graph.downloadUrl')
-        if download_url:
-            file_response = requests.get(download_url)
-            if file_response.status_code == 200:
-                _, artist, album = get_metadata(file_response.content, first_song.get('name'))
-                if album != "Unknown Album":
+def is_song_indexed(item):
+    row = cursor.execute("SELECT ctag FROM songs WHERE file_id = ?", (item.get('id'),)).fetchone()
+    return row is not None and row[0] == item.get('cTag')
+
+def scan_folder(folders, resume=False):
+    """OneDrive Folder များကို တပြိုင်နက် Scan လုပ်ပြီး songs နှင့် albums table များကို data ဖြည့်ခြင်း
+
+    Folder listing နှင့် tag ဖတ်ခြင်းကို thread pool နှစ်ခုဖြင့် လုပ်ပြီး DB ထဲသို့
+    ဒီ thread (writer) တစ်ခုတည်းကသာ ရေးသည်။ ``folders`` is the starting
+    frontier of ``(folder_id, path)`` pairs; each folder is checkpointed as
+    scanned once its listing and every song in it have been written. A
+    folder with a song that could not be read stays unscanned, so
+    ``--resume`` retries it.
+    """
+    frontier = deque(folders)
+    listings = {}
+    tag_reads = {}
+    # folder_id -> tag reads not yet written
+    outstanding = {}
+    # Folders with a song whose tags could not be fetched
+    failed = set()
+    # Stop listing new folders while the tag backlog is this deep, so memory
+    # and download URL age stay bounded on huge libraries.
+    max_tag_backlog = TAG_WORKERS * 16
+
+    with ThreadPoolExecutor(LIST_WORKERS) as list_pool, ThreadPoolExecutor(TAG_WORKERS) as tag_pool:
+        while frontier or listings or tag_reads:
+            while frontier and len(listings) < LIST_WORKERS and len(tag_reads) < max_tag_backlog:
+                folder_id, folder_path = frontier.popleft()
+                listings[list_pool.submit(list_folder, folder_id)] = (folder_id, folder_path)
+
+            done, _ = wait(list(listings) + list(tag_reads), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in listings:
+                    folder_id, folder_path = listings.pop(future)
                     try:
-                        cursor.execute(
-                            "INSERT INTO albums (album_name, artist_name, folder_id, folder_path) VALUES (?, ?, ?, ?)",
-                            (album, artist, item_id, current_path)
-                        )
-                        conn.commit()
-                        print(f"++ Indexed Album Folder: '{album}' by {artist}")
-                    except sqlite3.IntegrityError:
-                        pass # Folder already exists, skip.
-                    except Exception as e:
-                        print(f"Error inserting album to DB: {e}")
-
-    for item in items:
-        item_name = item.get('name')
-        new_path = f"{current_path}/{item_name}"
-        
-        if 'folder' in item:
-            print(f"Scanning subfolder: {new_path}")
-            scan_folder(headers, item.get('id'), new_path)
-        
-        elif 'file' in item and item in music_files_in_folder:
-            print(f"Found music file: {new_path}")
-            download_url = item.get('@microsoft.graph.downloadUrl')
-            if not download_url: continue
-
-            file_response = requests.get(download_url)
-            if file_response.status_code == 200:
-                title, artist, album = get_metadata(file_response.content, item_name)
+                        items = future.result()
+                    except requests.exceptions.RequestException as e:
+                        print(f"Error scanning folder {folder_id}: {e}")
+                        continue
+                    music_files_in_folder = [item for item in items if is_music_file(item)]
+                    if resume:
+                        # Songs written before the interruption need no second read.
+                        music_files_in_folder = [item for item in music_files_in_folder if not is_song_indexed(item)]
+                    # Resume: subfolders already recorded are either scanned or still in the checkpoint.
+                    known_subfolders = get_known_subfolders(folder_id) if resume else set()
+                    for item in items:
+                        new_path = f"{folder_path}/{item.get('name')}"
+                        if 'folder' in item and item.get('id') not in known_subfolders:
+                            print(f"Scanning subfolder: {new_path}")
+                            write_folder(item.get('id'), folder_id, item.get('name'), new_path)
+                            frontier.append((item.get('id'), new_path))
+                    for item in music_files_in_folder:
+                        print(f"Found music file: {folder_path}/{item.get('name')}")
+                        tag_reads[tag_pool.submit(read_remote_metadata, item)] = (item, folder_id, folder_path)
+                    outstanding[folder_id] = len(music_files_in_folder)
+                else:
+                    item, folder_id, folder_path = tag_reads.pop(future)
+                    metadata = future.result()
+                    if metadata:
+                        write_album(folder_id, folder_path, metadata)
+                        write_song(item, folder_id, metadata)
+                    else:
+                        failed.add(folder_id)
+                    outstanding[folder_id] -= 1
+                if outstanding.get(folder_id) == 0:
+                    del outstanding[folder_id]
+                    if folder_id in failed:
+                        print(f"Some songs could not be read in folder {folder_id}; it is left for --resume.")
+                    else:
+                        mark_folder_scanned(folder_id)
+
+# --- Incremental indexing (Graph delta) ---
+class DeltaResyncRequired(Exception):
+    """Stored delta link သက်တမ်းကုန်သွားပြီး full scan ပြန်လုပ်ရန် လိုအပ်ခြင်း"""
+
+def get_state(key):
+    row = cursor.execute("SELECT value FROM index_state WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+def set_state(key, value):
+    cursor.execute("INSERT OR REPLACE INTO index_state (key, value) VALUES (?, ?)", (key, value))
+    conn.commit()
+
+def get_latest_delta_link():
+    """ယခုအချိန်မှစ၍ ပြောင်းလဲမှုများကိုသာ ရယူနိုင်မည့် delta link"""
+    response = http.get(f"{DRIVE_URL}/root/delta", params={'token': 'latest'}, timeout=60)
+    response.raise_for_status()
+    return response.json().get('@odata.deltaLink')
+
+def fetch_delta(delta_link):
+    """Stored delta link မှစ၍ ပြောင်းလဲထားသော item များအားလုံးနှင့် နောက် delta link ကို ရယူခြင်း"""
+    changes = {}
+    try:
+        for page in iter_pages(delta_link):
+            # An item can appear more than once; the last occurrence wins.
+            for item in page.get('value', []):
+                changes.pop(item.get('id'), None)
+                changes[item.get('id')] = item
+            delta_link = page.get('@odata.deltaLink', delta_link)
+    except requests.exceptions.HTTPError as e:
+        if e.response is not None and e.response.status_code == 410:
+            raise DeltaResyncRequired()
+        raise
+    return list(changes.values()), delta_link
+
+def reset_catalog():
+    for table in ('songs', 'albums', 'artists', 'folders'):
+        cursor.execute(f"DELETE FROM {table}")
+    written_artists.clear()
+    written_albums.clear()
+    cursor.execute("DELETE FROM index_state WHERE key IN ('delta_link', 'pending_delta_link')")
+    conn.commit()
+
+def get_folder_path(folder_id):
+    # Folders written earlier in this run may still be buffered.
+    writer.flush()
+    row = cursor.execute("SELECT path FROM folders WHERE item_id = ?", (folder_id,)).fetchone()
+    return row[0] if row else None
+
+def move_path_prefix(old_path, new_path):
+    """Folder ရွှေ့/အမည်ပြောင်းသောအခါ အောက်ရှိ folder path များကို update လုပ်ခြင်း
+
+    Songs and albums refer to folders by id, so only folder rows change.
+    """
+    n = len(old_path) + 1
+    cursor.execute(
+        "UPDATE folders SET path = ? || substr(path, ?) WHERE substr(path, 1, ?) = ?",
+        (new_path, n, n, old_path + '/')
+    )
+
+def delete_folder_tree(path):
+    """Folder တစ်ခုနှင့် ၎င်းအောက်ရှိ folder, song, album များအားလုံးကို ဖျက်ခြင်း"""
+    tree = "SELECT id FROM folders WHERE path = ? OR substr(path, 1, ?) = ?"
+    params = (path, len(path) + 1, path + '/')
+    for table in ('songs', 'albums'):
+        cursor.execute(f"DELETE FROM {table} WHERE folder_id IN ({tree})", params)
+    cursor.execute(f"DELETE FROM folders WHERE id IN ({tree})", params)
+
+def prune_catalog():
+    """Song မကျန်တော့သော album များနှင့် song/album မရှိတော့သော artist များကို ဖျက်ခြင်း"""
+    cursor.execute("DELETE FROM albums WHERE NOT EXISTS (SELECT 1 FROM songs WHERE songs.album_id = albums.id)")
+    cursor.execute(
+        "DELETE FROM artists WHERE NOT EXISTS (SELECT 1 FROM songs WHERE songs.artist_id = artists.id) "
+        "AND NOT EXISTS (SELECT 1 FROM albums WHERE albums.artist_id = artists.id)"
+    )
+    written_artists.clear()
+    written_albums.clear()
+
+def apply_folder_change(item, pending):
+    """Folder အသစ်/ရွှေ့/ဖျက် ပြောင်းလဲမှုကို folders, songs, albums table များတွင် ပြင်ခြင်း"""
+    folder_id = item.get('id')
+    old_path = get_folder_path(folder_id)
+    if 'deleted' in item:
+        if old_path:
+            delete_folder_tree(old_path)
+            print(f"xx Removed folder: {old_path}")
+        return
+    if 'root' in item:
+        write_folder(folder_id, None, '', '', scanned=1)
+        return
+
+    parent_id = item.get('parentReference', {}).get('id')
+    # Parents may be listed after their children; apply them first.
+    if parent_id in pending:
+        apply_folder_change(pending.pop(parent_id), pending)
+    parent_path = get_folder_path(parent_id)
+    if parent_path is None:
+        return
+    new_path = f"{parent_path}/{item.get('name')}"
+    if old_path is not None and old_path != new_path:
+        move_path_prefix(old_path, new_path)
+        print(f"~~ Moved folder: {old_path} -> {new_path}")
+    write_folder(folder_id, parent_id, item.get('name'), new_path, scanned=1)
+
+def apply_delta(changes):
+    """Delta item များကို DB ထဲသို့ သက်ရောက်စေခြင်း (ပြောင်းသော file များကိုသာ tag ပြန်ဖတ်သည်)"""
+    # Deleted items may carry no folder facet, so also match known folder ids.
+    folder_changes = [item for item in changes
+                      if 'folder' in item or 'root' in item or get_folder_path(item.get('id')) is not None]
+    pending = {item.get('id'): item for item in folder_changes}
+    folder_ids = set(pending)
+    while pending:
+        _, item = pending.popitem()
+        apply_folder_change(item, pending)
+
+    tag_reads = []
+    for item in changes:
+        if item.get('id') in folder_ids:
+            continue
+        file_id = item.get('id')
+        row = cursor.execute(
+            "SELECT songs.ctag, folders.path || '/' || songs.file_name, songs.folder_id, songs.album_id "
+            "FROM songs JOIN folders ON folders.id = songs.folder_id WHERE songs.file_id = ?", (file_id,)
+        ).fetchone()
+        if 'deleted' in item or not is_music_file(item):
+            # Deleted, or renamed to a non-music extension.
+            if row:
+                cursor.execute("DELETE FROM songs WHERE file_id = ?", (file_id,))
+                print(f"xx Removed song: {row[1]}")
+            continue
+        parent_id = item.get('parentReference', {}).get('id')
+        parent_path = get_folder_path(parent_id)
+        if parent_path is None:
+            continue
+        if row and row[0] == item.get('cTag'):
+            # Content unchanged (rename or move): no need to re-read tags.
+            parent_folder = cursor.execute("SELECT id FROM folders WHERE item_id = ?", (parent_id,)).fetchone()[0]
+            if row[3] is not None and row[2] != parent_folder:
+                # The song's album moves along with it.
                 cursor.execute(
-                    "INSERT INTO songs (file_id, file_name, title, artist, album, file_path) VALUES (?, ?, ?, ?, ?, ?)",
-                    (item.get('id'), item_name, title, artist, album, new_path)
+                    "INSERT OR IGNORE INTO albums (album_name, artist_id, folder_id) "
+                    "SELECT album_name, artist_id, ? FROM albums WHERE id = ?", (parent_folder, row[3])
                 )
-                conn.commit()
-                print(f"  -- Indexed Song: {artist} - {album} - {title}")
+            cursor.execute(
+                "UPDATE songs SET file_name = ?, folder_id = ?, album_id = (SELECT id FROM albums "
+                "WHERE folder_id = ? AND album_name = (SELECT album_name FROM albums WHERE id = ?)) "
+                "WHERE file_id = ?",
+                (item.get('name'), parent_folder, parent_folder, row[3], file_id)
+            )
+            continue
+        tag_reads.append((item, parent_id, parent_path))
+
+    with ThreadPoolExecutor(TAG_WORKERS) as tag_pool:
+        results = tag_pool.map(lambda read: read_remote_metadata(read[0], resolve=True), tag_reads)
+        for (item, parent_id, parent_path), metadata in zip(tag_reads, results):
+            if not metadata:
+                continue
+            write_album(parent_id, parent_path, metadata)
+            write_song(item, parent_id, metadata)
+    writer.flush()
+    prune_catalog()
+    conn.commit()
+
+def get_checkpoint():
+    """ပြတ်တောက်သွားသော full scan ၏ မပြီးသေးသော folder များ (crawl frontier)"""
+    return cursor.execute("SELECT item_id, path FROM folders WHERE scanned = 0 AND item_id IS NOT NULL").fetchall()
+
+def full_scan(resume=False):
+    """Catalog ကို အစမှ ပြန်တည်ဆောက်ပြီး နောက် incremental run အတွက် delta link သိမ်းခြင်း
+
+    With ``resume`` and a checkpoint left by an interrupted scan, only the
+    folders not yet marked scanned are listed again.
+    """
+    frontier = get_checkpoint() if resume else []
+    resuming = bool(frontier)
+    if resuming:
+        print(f"\nResuming OneDrive scan: {len(frontier)} folders left...")
+        drop_secondary_indexes(conn)
+    else:
+        # Take the delta link first so changes made during the scan are not missed.
+        delta_link = get_latest_delta_link()
+        reset_catalog()
+        drop_secondary_indexes(conn)
+        if delta_link:
+            set_state('pending_delta_link', delta_link)
+        root_id = get_root_id()
+        write_folder(root_id, None, '', '')
+        frontier = [(root_id, '')]
+        print("\nStarting OneDrive scan from root folder...")
+    scan_folder(frontier, resume=resuming)
+    writer.flush()
+    create_secondary_indexes(conn)
+    if get_checkpoint():
+        print("Some folders could not be scanned; run again with --resume.")
+        return
+    delta_link = get_state('pending_delta_link')
+    if delta_link:
+        set_state('delta_link', delta_link)
+        cursor.execute("DELETE FROM index_state WHERE key = 'pending_delta_link'")
+        conn.commit()
+
+def incremental_scan():
+    delta_link = get_state('delta_link')
+    if not delta_link:
+        print("No stored delta link; running a full scan.")
+        full_scan(resume=True)
+        return
+    try:
+        changes, delta_link = fetch_delta(delta_link)
+    except DeltaResyncRequired:
+        print("Delta link expired; running a full scan.")
+        full_scan()
+        return
+    create_secondary_indexes(conn)
+    print(f"\nApplying {len(changes)} changed items...")
+    apply_delta(changes)
+    set_state('delta_link', delta_link)
+
+def write_summary(mode, status, started_at, elapsed):
+    """Run ၏ အချိန်နှင့် stage တစ်ခုချင်းစီ၏ throughput ကို JSON file အဖြစ် ရေးခြင်း"""
+    def rate(value):
+        return round(value / elapsed, 2) if elapsed > 0 else 0
+    rows_written = writer.rows_written if writer else 0
+    summary = {
+        "mode": mode,
+        "status": status,
+        "started_at": started_at,
+        "elapsed_seconds": round(elapsed, 2),
+        "folders_listed": FOLDERS_LISTED.value(),
+        "folders_per_second": rate(FOLDERS_LISTED.value()),
+        "songs_tagged": SONGS_TAGGED.value(),
+        "songs_per_second": rate(SONGS_TAGGED.value()),
+        "tag_bytes_fetched": TAG_BYTES.value(),
+        "tag_bytes_per_second": rate(TAG_BYTES.value()),
+        "tag_requests": TAG_REQUESTS.value(),
+        "rows_written": rows_written,
+        "rows_per_second": rate(rows_written),
+        "metrics": metrics.registry.snapshot(),
+    }
+    with open(SUMMARY_FILE, "w") as f:
+        json.dump(summary, f, indent=2)
+    print(f"Run summary written to {SUMMARY_FILE}.")
 
-def main():
-    global conn, cursor
+def main(argv=None):
+    global conn, cursor, writer
+    parser = argparse.ArgumentParser(description="Index OneDrive music files into music_bot.db")
+    parser.add_argument('--incremental', action='store_true',
+                        help="only apply changes since the last run (Graph delta)")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue an interrupted full scan from its checkpoint")
+    args = parser.parse_args(argv)
+    mode = "incremental" if args.incremental else "resume" if args.resume else "full"
+    started_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    started = time.monotonic()
+    status = "failed"
+    metrics.registry.reset()
+    written_artists.clear()
+    written_albums.clear()
     try:
         conn = sqlite3.connect(DB_FILE)
         cursor = conn.cursor()
+        writer = BatchWriter(conn)
+        begin_bulk_load(conn)
         print("Successfully connected to database.")
 
         token = get_access_token()
         if not token:
+            status = "no_token"
             return
 
-        headers = {'Authorization': f'Bearer {token}'}
-        
-        print("\nStarting OneDrive scan from root folder...")
-        scan_folder(headers, 'root', '')
+        if args.incremental:
+            incremental_scan()
+        else:
+            full_scan(resume=args.resume)
         
-        print("\nIndexing complete.")
+        writer.flush()
+        end_bulk_load(conn)
+        print(f"\nIndexing complete. {writer.rows_written} rows written.")
+        status = "ok"
     except Exception as e:
         print(f"An error occurred in main: {e}")
     finally:
         if conn:
             conn.close()
             print("Database connection closed.")
+        write_summary(mode, status, started_at, time.monotonic() - started)
 
 if __name__ == "__main__":
     main()
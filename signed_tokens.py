@@ -0,0 +1,114 @@
+import hmac
+import time
+import base64
+import struct
+import hashlib
+import secrets
+import threading
+from collections import namedtuple
+from cache import TTLCache
+
+# kind, item id, Telegram user id, expiry (unix seconds), nonce
+PAYLOAD = struct.Struct(">cIQI4s")
+SIGNATURE_BYTES = 16
+
+KIND_SONG = b"s"
+KIND_ALBUM = b"a"
+
+DownloadToken = namedtuple("DownloadToken", "kind item_id user_id expires_at token_id")
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class TokenSigner:
+    """Issues and verifies self-contained HMAC-signed download tokens.
+
+    A token is ``<payload>.<signature>`` in URL-safe base64 (about 50
+    characters), so verifying one needs no database lookup: a bad signature
+    or a past expiry is rejected in memory.
+    """
+
+    def __init__(self, secret: bytes, ttl: int = 1800):
+        self.secret = secret
+        self.ttl = ttl
+
+    def issue(self, kind: bytes, item_id: int, user_id: int, ttl: int = None) -> str:
+        expires_at = int(time.time()) + (self.ttl if ttl is None else ttl)
+        payload = PAYLOAD.pack(kind, item_id, user_id, expires_at, secrets.token_bytes(4))
+        return f"{_b64encode(payload)}.{_b64encode(self._sign(payload))}"
+
+    def verify(self, token: str):
+        """Decoded DownloadToken, or None if the token is malformed, forged or expired."""
+        try:
+            payload_text, signature_text = token.split(".")
+            payload, signature = _b64decode(payload_text), _b64decode(signature_text)
+            kind, item_id, user_id, expires_at, _ = PAYLOAD.unpack(payload)
+        except (ValueError, struct.error):
+            return None
+        if not hmac.compare_digest(signature, self._sign(payload)):
+            return None
+        if expires_at <= time.time():
+            return None
+        return DownloadToken(kind, item_id, user_id, expires_at, signature_text)
+
+    def _sign(self, payload: bytes) -> bytes:
+        return hmac.new(self.secret, payload, hashlib.sha256).digest()[:SIGNATURE_BYTES]
+
+
+class ReplayGuard:
+    """Remembers which one-time tokens have been spent until they expire.
+
+    Spent token ids live in the ``used_tokens`` table so every gunicorn worker
+    sees them, fronted by an in-memory cache so repeats seen by this process
+    never reach SQLite. Rows are useless once their token has expired and are
+    swept at most every ``sweep_interval`` seconds, so the table only ever
+    holds tokens from the last token lifetime.
+
+    A spent token can still be honoured for ``resume_window`` seconds after
+    its first use, but only for requests the caller marks as resumes. That
+    lets an interrupted download continue without making the link reusable.
+    """
+
+    def __init__(self, db, sweep_interval: float = 300, cache_size: int = 4096, resume_window: float = 0):
+        self.db = db
+        self.sweep_interval = sweep_interval
+        self.resume_window = resume_window
+        self._seen = TTLCache(maxsize=cache_size)
+        self._lock = threading.Lock()
+        self._swept_at = 0.0
+
+    def use(self, token: DownloadToken, resume: bool = False) -> bool:
+        """Mark the token spent; True for the first caller, and for resumes within the resume window."""
+        used_at = self._seen.get(token.token_id)
+        if used_at is None:
+            now = int(time.time())
+            self._maybe_sweep()
+            if self.db.execute(
+                "INSERT OR IGNORE INTO used_tokens (token_id, expires_at, used_at) VALUES (?, ?, ?)",
+                (token.token_id, token.expires_at, now)
+            ):
+                used_at = now
+                first_use = True
+            else:
+                # Spent by another worker: its first use starts the resume window.
+                row = self.db.fetchone("SELECT used_at FROM used_tokens WHERE token_id = ?", (token.token_id,))
+                used_at = row[0] if row else 0
+                first_use = False
+            self._seen.set(token.token_id, used_at, max(token.expires_at - time.time(), 0))
+            if first_use:
+                return True
+        return resume and time.time() < used_at + self.resume_window
+
+    def _maybe_sweep(self):
+        now = time.time()
+        with self._lock:
+            if now - self._swept_at < self.sweep_interval:
+                return
+            self._swept_at = now
+        self.db.execute("DELETE FROM used_tokens WHERE expires_at <= ?", (int(now),))
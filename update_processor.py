@@ -0,0 +1,84 @@
+import os
+import atexit
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateProcessor:
+    """Runs the bot's PTB Application on an event loop thread of its own and feeds it webhook updates.
+
+    Nothing Telegram-related is built until a process first needs it. Then
+    ``build`` creates the Application on that loop, it is initialized and
+    started once, and ``on_start`` runs. From there ``submit`` only puts an
+    update on ``application.update_queue``, so the webhook can answer
+    Telegram at once while the Application's own fetcher runs the handlers.
+    A forked worker sees a new pid and starts its own loop, since threads do
+    not survive fork. At exit the Application is stopped, which lets updates
+    already queued finish.
+    """
+
+    def __init__(self, build, on_start=None, start_timeout: float = 30.0):
+        self.build = build
+        self.on_start = on_start
+        self.start_timeout = start_timeout
+        self.application = None
+        self._loop = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def submit(self, data: dict):
+        """Queue one update as received by the webhook; it is handled later on the loop thread."""
+        from telegram import Update
+
+        self._ensure_started()
+        update = Update.de_json(data, self.application.bot)
+        self._loop.call_soon_threadsafe(self.application.update_queue.put_nowait, update)
+
+    def run(self, coroutine_function, timeout: float = None):
+        """Run ``coroutine_function(application)`` on the loop thread and return its result."""
+        self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(coroutine_function(self.application), self._loop).result(timeout)
+
+    def stop(self):
+        if self._pid != os.getpid():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._stop(), self._loop).result(self.start_timeout)
+        except Exception as e:
+            logger.error(f"Stopping the Telegram application failed: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._pid = None
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="telegram-updates", daemon=True).start()
+            try:
+                self.application = asyncio.run_coroutine_threadsafe(self._start(), loop).result(self.start_timeout)
+            except BaseException:
+                loop.call_soon_threadsafe(loop.stop)
+                raise
+            self._loop = loop
+            self._pid = os.getpid()
+            atexit.register(self.stop)
+
+    async def _start(self):
+        # Built on the loop: PTB's queues and HTTP clients belong to the loop they are first used on.
+        application = self.build()
+        await application.initialize()
+        await application.start()
+        if self.on_start:
+            self.on_start()
+        logger.info(f"Telegram application started in process {os.getpid()}")
+        return application
+
+    async def _stop(self):
+        await self.application.stop()
+        await self.application.shutdown()
@@ -0,0 +1,168 @@
+import zlib
+import queue
+import struct
+import threading
+from datetime import datetime
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+ZipEntry = namedtuple("ZipEntry", "name size")
+
+LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+DATA_DESCRIPTOR = struct.Struct("<IIII")
+DATA_DESCRIPTOR64 = struct.Struct("<IIQQ")
+CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+END_RECORD = struct.Struct("<IHHHHIIH")
+END_RECORD64 = struct.Struct("<IQHHIIQQQQ")
+END_LOCATOR64 = struct.Struct("<IIQI")
+ZIP64_LOCAL_EXTRA = struct.Struct("<HHQQ")
+ZIP64_CENTRAL_EXTRA = struct.Struct("<HHQQQ")
+
+# General purpose flags: sizes/CRC follow the data (bit 3), UTF-8 names (bit 11)
+FLAGS = 0x0808
+LIMIT32 = 0xFFFFFFFF
+
+
+class ZipStream:
+    """Store-only (uncompressed) ZIP archive written front to back.
+
+    Audio files do not compress, so entries are stored as-is and the archive
+    size is known before any data is read: ``content_length`` can be sent up
+    front. Each entry's CRC-32 is computed while it streams and written in a
+    data descriptor after it. ZIP64 records are used when the archive
+    outgrows the classic 4 GiB / 65535-entry limits.
+    """
+
+    def __init__(self, entries, date_time: datetime = None):
+        self.entries = [ZipEntry(name.encode("utf-8"), size) for name, size in entries]
+        date_time = date_time or datetime.now()
+        self.dos_time = (date_time.hour << 11) | (date_time.minute << 5) | (date_time.second // 2)
+        self.dos_date = ((max(date_time.year, 1980) - 1980) << 9) | (date_time.month << 5) | date_time.day
+        self.zip64 = self._data_length(zip64=False) >= LIMIT32 or len(self.entries) >= 0xFFFF
+
+    def _local_length(self, entry, zip64):
+        extra = ZIP64_LOCAL_EXTRA.size if zip64 else 0
+        descriptor = DATA_DESCRIPTOR64.size if zip64 else DATA_DESCRIPTOR.size
+        return LOCAL_HEADER.size + len(entry.name) + extra + entry.size + descriptor
+
+    def _data_length(self, zip64):
+        return sum(self._local_length(entry, zip64) for entry in self.entries)
+
+    def content_length(self) -> int:
+        central_extra = ZIP64_CENTRAL_EXTRA.size if self.zip64 else 0
+        central = sum(CENTRAL_HEADER.size + len(entry.name) + central_extra for entry in self.entries)
+        end = END_RECORD.size + (END_RECORD64.size + END_LOCATOR64.size if self.zip64 else 0)
+        return self._data_length(self.zip64) + central + end
+
+    def generate(self, contents):
+        """Yield the archive; ``contents`` yields one chunk iterator per entry, in order."""
+        version = 45 if self.zip64 else 20
+        offset = 0
+        central = []
+        for entry, chunks in zip(self.entries, contents):
+            header_size = LIMIT32 if self.zip64 else entry.size
+            header = LOCAL_HEADER.pack(0x04034B50, version, FLAGS, 0, self.dos_time, self.dos_date,
+                                       0, header_size, header_size, len(entry.name),
+                                       ZIP64_LOCAL_EXTRA.size if self.zip64 else 0) + entry.name
+            if self.zip64:
+                header += ZIP64_LOCAL_EXTRA.pack(0x0001, 16, entry.size, entry.size)
+            yield header
+            crc, written = 0, 0
+            for chunk in chunks:
+                crc = zlib.crc32(chunk, crc)
+                written += len(chunk)
+                yield chunk
+            if written != entry.size:
+                # The Content-Length promised to the client can no longer be met.
+                raise IOError(f"{entry.name.decode()}: expected {entry.size} bytes, got {written}")
+            if self.zip64:
+                yield DATA_DESCRIPTOR64.pack(0x08074B50, crc, entry.size, entry.size)
+            else:
+                yield DATA_DESCRIPTOR.pack(0x08074B50, crc, entry.size, entry.size)
+            central.append((entry, crc, offset))
+            offset += len(header) + entry.size + (DATA_DESCRIPTOR64.size if self.zip64 else DATA_DESCRIPTOR.size)
+
+        directory_offset = offset
+        directory = bytearray()
+        for entry, crc, entry_offset in central:
+            if self.zip64:
+                directory += CENTRAL_HEADER.pack(
+                    0x02014B50, version, version, FLAGS, 0, self.dos_time, self.dos_date, crc,
+                    LIMIT32, LIMIT32, len(entry.name), ZIP64_CENTRAL_EXTRA.size, 0, 0, 0, 0, LIMIT32)
+                directory += entry.name + ZIP64_CENTRAL_EXTRA.pack(0x0001, 24, entry.size, entry.size, entry_offset)
+            else:
+                directory += CENTRAL_HEADER.pack(
+                    0x02014B50, version, version, FLAGS, 0, self.dos_time, self.dos_date, crc,
+                    entry.size, entry.size, len(entry.name), 0, 0, 0, 0, 0, entry_offset)
+                directory += entry.name
+        count = len(central)
+        if self.zip64:
+            end64_offset = directory_offset + len(directory)
+            directory += END_RECORD64.pack(0x06064B50, END_RECORD64.size - 12, 45, 45, 0, 0,
+                                           count, count, end64_offset - directory_offset, directory_offset)
+            directory += END_LOCATOR64.pack(0x07064B50, 0, end64_offset, 1)
+            directory += END_RECORD.pack(0x06054B50, 0, 0, 0xFFFF, 0xFFFF, LIMIT32, LIMIT32, 0)
+        else:
+            directory += END_RECORD.pack(0x06054B50, 0, 0, count, count, len(directory), directory_offset, 0)
+        yield bytes(directory)
+
+
+def read_ahead(openers, files_ahead: int = 2, chunks_ahead: int = 4):
+    """Yield one chunk iterator per opener, in order, filled by background threads.
+
+    Up to ``files_ahead`` sources stream at once, each holding at most
+    ``chunks_ahead`` chunks, so memory stays bounded no matter how large the
+    files are while the next tracks' connections are already warm. Closing
+    the returned generator (client gone) stops the workers.
+    """
+    stop = threading.Event()
+    done = object()
+
+    def offer(buffer, item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def fill(opener, buffer):
+        chunks = None
+        try:
+            chunks = opener()
+            for chunk in chunks:
+                if not offer(buffer, chunk):
+                    return
+            offer(buffer, done)
+        except Exception as e:
+            offer(buffer, e)
+        finally:
+            # Lets the source release its upstream connection early.
+            close = getattr(chunks, "close", None)
+            if close:
+                close()
+
+    def drain(buffer):
+        while True:
+            item = buffer.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    pool = ThreadPoolExecutor(max_workers=files_ahead)
+    buffers = []
+    try:
+        for index, opener in enumerate(openers):
+            buffers.append(queue.Queue(maxsize=chunks_ahead))
+            pool.submit(fill, opener, buffers[-1])
+            # Start the following files before this one is drained.
+            if index + 1 >= files_ahead:
+                yield drain(buffers[index + 1 - files_ahead])
+        for buffer in buffers[max(len(buffers) + 1 - files_ahead, 0):]:
+            yield drain(buffer)
+    finally:
+        stop.set()
+        pool.shutdown(wait=False)